@@ -7,22 +7,87 @@
 
 import json
 import logging
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 import numpy as np
 import tensorflow as tf
 
+from cwt_engine import get_cwt_operator
+from dataset_cache import DEFAULT_CACHE_QUOTA_GB, dataset_fingerprint, prepare_cache
+from dataset_store import BEAT_INDEX_FILENAME, get_beat_index, get_store
+from memmap_loader import create_memmap_dataset
+from scalogram_store import RAW_REPRESENTATION, resolve_scale_rows
+from tfrecord_layout import BEAT_LAYOUT, QUANTIZATION_FEATURES, ShardIndex, is_quantized, read_layout
+
 logger = logging.getLogger(__name__)
 
+# Examples per read unit in a sharded directory (about 1024 beats at 256 beats
+# per example). Units are the work items the interleave readers pick up.
+READ_UNIT_EXAMPLES = 4
+# TFRecordDatasetV2 can start reading at a byte offset; without it a reader
+# falls back to skipping the preceding examples of the shard.
+_HAS_BYTE_OFFSETS = hasattr(tf.raw_ops, 'TFRecordDatasetV2')
+# Batch-native path (data config "batch_native_pipeline"): chunks stay tensors and
+# training shuffles within a buffer of this many chunks ("shuffle_buffer_chunks").
+DEFAULT_SHUFFLE_BUFFER_CHUNKS = 8
+# Nominal sequences per parsed chunk (create_batched_tfrecords.BATCH_SIZE_PER_CHUNK);
+# sizes the blocks that are permuted in the batch-native training shuffle.
+NOMINAL_CHUNK_SEQUENCES = 256
+
+@lru_cache(maxsize=128)
+def _cached_sequence_labels(preprocessed_dir: str, index_mtime: int, record_names: Tuple[str, ...], sequence_len: int) -> np.ndarray:
+    """
+    Memoized sequence labels. The index mtime is part of the key, so a rebuilt
+    beat_index.npz automatically invalidates every cached entry. The returned
+    array is read-only because it is shared between callers.
+    """
+    labels = get_beat_index(preprocessed_dir).sequence_labels(record_names, sequence_len)
+    labels.setflags(write=False)
+    return labels
+
+
+def get_sequence_label_counts(record_names: List[str], config: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    Returns per-class sequence counts for the given records straight from the
+    precomputed counts in beat_index.npz, or None when the index is missing.
+    """
+    index = get_beat_index(config["preprocessed_dir"])
+    if index is None:
+        return None
+    return index.sequence_label_counts(record_names, config['sequence_len'])
+
+
 # تابع get_all_labels بدون تغییر باقی می‌ماند
 def get_all_labels(record_names: List[str], config: Dict[str, Any]) -> np.ndarray:
     """
     Quickly retrieves all labels for the sequences that will be generated
-    from the given records by reading the precomputed metadata.json file.
+    from the given records. The compact beat_index.npz is used when it exists
+    (memoized on records, sequence length and index mtime), then the label
+    column of the consolidated store, and finally the metadata.json file.
     """
-    metadata_path = Path(config["preprocessed_dir"]) / "metadata.json"
     sequence_len = config['sequence_len']
+    index_path = Path(config["preprocessed_dir"]) / BEAT_INDEX_FILENAME
+    if index_path.exists():
+        return _cached_sequence_labels(
+            str(config["preprocessed_dir"]), index_path.stat().st_mtime_ns, tuple(record_names), sequence_len
+        )
+
+    store = get_store(config["preprocessed_dir"])
+    if store is not None:
+        # Records are contiguous in the store, so each record's sequence labels are one slice.
+        label_slices = []
+        for rec_name in record_names:
+            if rec_name in store:
+                beats = store.record_slice(rec_name)
+                if beats.stop - beats.start >= sequence_len:
+                    label_slices.append(store.label[beats.start + sequence_len - 1:beats.stop])
+        if not label_slices:
+            return np.array([], dtype=np.int32)
+        return np.concatenate(label_slices).astype(np.int32)
+
+    metadata_path = Path(config["preprocessed_dir"]) / "metadata.json"
     try:
         with open(metadata_path, 'r') as f:
             all_metadata = json.load(f)
@@ -45,6 +110,168 @@ def get_all_labels(record_names: List[str], config: Dict[str, Any]) -> np.ndarra
     return np.array(all_sequence_labels, dtype=np.int32)
 
 
+def _parse_batched_sequence(example_proto):
+    """Parses one example of the legacy layout: a chunk of pre-windowed sequences."""
+    feature_description = {
+        'num_in_batch': tf.io.FixedLenFeature([], tf.int64),
+        'sequence_len': tf.io.FixedLenFeature([], tf.int64),
+        'height': tf.io.FixedLenFeature([], tf.int64),
+        'width': tf.io.FixedLenFeature([], tf.int64),
+        'sequences_raw': tf.io.FixedLenFeature([], tf.string),
+        'labels_raw': tf.io.FixedLenFeature([], tf.string),
+    }
+    parsed = tf.io.parse_single_example(example_proto, feature_description)
+    shape = [parsed['num_in_batch'], parsed['sequence_len'], parsed['height'], parsed['width']]
+    sequences = tf.reshape(tf.io.decode_raw(parsed['sequences_raw'], tf.float32), shape)
+    labels = tf.reshape(tf.io.decode_raw(parsed['labels_raw'], tf.int32), [parsed['num_in_batch']])
+    return sequences, labels
+
+
+def _parse_beat_chunk(example_proto, compression: Optional[str] = None, storage_dtype: str = 'float32',
+                      scale_rows: Optional[np.ndarray] = None):
+    """
+    Parses one example of the beat layout: a chunk of consecutive beats of one
+    record, in the storage dtype recorded in the layout sidecar. compression names
+    the per-example payload compression ('ZLIB' or 'GZIP'). Quantized layouts also
+    return the record's per-scale scale and offset, which normalize_and_format
+    applies after windowing. scale_rows keeps only those scalogram rows (a scale
+    subset of a superset store).
+    """
+    feature_description = {
+        'num_in_batch': tf.io.FixedLenFeature([], tf.int64),
+        'height': tf.io.FixedLenFeature([], tf.int64),
+        'width': tf.io.FixedLenFeature([], tf.int64),
+        'beats_raw': tf.io.FixedLenFeature([], tf.string),
+        'labels_raw': tf.io.FixedLenFeature([], tf.string),
+    }
+    quantized = is_quantized(storage_dtype)
+    if quantized:
+        for name in QUANTIZATION_FEATURES:
+            feature_description[name] = tf.io.FixedLenFeature([], tf.string)
+    parsed = tf.io.parse_single_example(example_proto, feature_description)
+    shape = [parsed['num_in_batch'], parsed['height'], parsed['width']]
+    beats_raw = parsed['beats_raw']
+    if compression:
+        beats_raw = tf.io.decode_compressed(beats_raw, compression_type=compression)
+    beats = tf.reshape(tf.io.decode_raw(beats_raw, tf.as_dtype(storage_dtype)), shape)
+    labels = tf.reshape(tf.io.decode_raw(parsed['labels_raw'], tf.int32), [parsed['num_in_batch']])
+    if scale_rows is not None:
+        beats = tf.gather(beats, scale_rows, axis=1)
+    if quantized:
+        quantization = tuple(tf.reshape(tf.io.decode_raw(parsed[name], tf.float32), [parsed['height']])
+                             for name in QUANTIZATION_FEATURES)
+        if scale_rows is not None:
+            quantization = tuple(tf.gather(param, scale_rows) for param in quantization)
+        return (beats, labels) + quantization
+    return beats, labels
+
+
+def _dequantize(beats, quant_scale, quant_offset):
+    """Maps quantized codes (..., height, width) back to values with one scale and offset per row."""
+    return tf.cast(beats, tf.float32) * quant_scale[:, None] + quant_offset[:, None]
+
+
+def in_graph_cwt(wavelet_name: str, scales: List[float], width: int):
+    """
+    Returns a TensorFlow function mapping raw beat windows (n, 1, width) to |CWT|
+    scalograms (n, len(scales), width). It applies the cached filter bank of
+    cwt_engine.batched_cwt in its dense form (the filter bank's impulse response,
+    one matrix product per chunk of beats), so the result matches pywt.cwt to
+    float32 precision.
+    """
+    operator = tf.constant(get_cwt_operator(wavelet_name, tuple(float(s) for s in scales), width), tf.float32)
+    num_scales = len(scales)
+
+    def transform(beats):
+        coefficients = tf.matmul(tf.reshape(beats, [-1, width]), operator)
+        return tf.reshape(tf.abs(coefficients), [-1, num_scales, width])
+    return transform
+
+
+def _parse_raw_beat_chunk(example_proto, parse_beat_chunk, cwt):
+    """Parses a chunk of raw beat windows (dequantizing if needed) and returns its scalograms and labels."""
+    beats, labels, *quantization = parse_beat_chunk(example_proto)
+    beats = _dequantize(beats, *quantization) if quantization else tf.cast(beats, tf.float32)
+    return cwt(beats), labels
+
+
+def window_beat_chunks(beat_chunks: tf.data.Dataset, sequence_len: int, height: int, width: int, skip=0,
+                       dtype: tf.DType = tf.float32) -> tf.data.Dataset:
+    """
+    Per-record windowing stage: turns a dataset of consecutive beat chunks of ONE
+    record into chunks of overlapping sequences (stride 1) labelled with their last
+    beat, exactly like the former pre-windowed files. The last sequence_len - 1
+    beats of each chunk are carried over to the next, so sequences span chunk
+    boundaries but never record boundaries. The first `skip` sequences are dropped
+    (used when a read unit starts with context beats of the previous unit).
+    Beats keep their storage dtype; any further per-chunk tensors (the
+    quantization scale and offset) are passed through unchanged.
+    """
+    carry = sequence_len - 1
+
+    def _window(state, chunk):
+        tail_beats, tail_labels, to_skip = state
+        beats = tf.concat([tail_beats, chunk[0]], axis=0)
+        labels = tf.concat([tail_labels, chunk[1]], axis=0)
+        sequences = tf.signal.frame(beats, sequence_len, 1, axis=0)
+        sequence_labels = labels[carry:]
+        drop = tf.minimum(to_skip, tf.shape(sequence_labels)[0])
+        keep_from = tf.maximum(tf.shape(beats)[0] - carry, 0)
+        return ((beats[keep_from:], labels[keep_from:], to_skip - drop),
+                (sequences[drop:], sequence_labels[drop:]) + tuple(chunk[2:]))
+
+    initial_state = (tf.zeros([0, height, width], dtype), tf.zeros([0], tf.int32), tf.cast(skip, tf.int32))
+    return beat_chunks.scan(initial_state, _window)
+
+
+def _format_chunk(sequences, labels, *quantization):
+    """Turns a parsed chunk of sequences into float32 (dequantizing with the record's scale and offset)."""
+    if quantization:
+        return _dequantize(sequences, *quantization), labels
+    return tf.cast(sequences, tf.float32), labels
+
+
+def _shuffled_block_batches(sequences, labels, batch_size: int) -> tf.data.Dataset:
+    """Splits one block (several chunks) into batches of a random permutation, one gather per batch."""
+    order = tf.random.shuffle(tf.range(tf.shape(labels)[0]))
+    batch_orders = tf.data.Dataset.from_tensor_slices(tf.reshape(order, [-1, batch_size]))
+    return batch_orders.map(lambda batch_order: (tf.gather(sequences, batch_order), tf.gather(labels, batch_order)))
+
+
+def batch_native_batches(chunks: tf.data.Dataset, batch_size: int, is_training: bool = False,
+                         shuffle_buffer_chunks: int = DEFAULT_SHUFFLE_BUFFER_CHUNKS) -> tf.data.Dataset:
+    """
+    Batch-native counterpart of the per-element stage of create_dataset. Chunks of
+    sequences are never split into single elements: each chunk is dequantized as
+    one tensor and Dataset.rebatch concatenates and slices the
+    chunks into batches of batch_size (one copy per sequence, as unbatch().batch()
+    would do in two). Training shuffles the chunks in a buffer of
+    shuffle_buffer_chunks, regroups them into blocks of about that many chunks'
+    worth of sequences (a multiple of batch_size) and gathers each batch from a
+    random permutation of its block. Without training the batches are identical
+    to the per-element path.
+    """
+    dataset = chunks.map(_format_chunk, num_parallel_calls=tf.data.AUTOTUNE)
+    if not is_training:
+        return dataset.rebatch(batch_size)
+    block_batches = max(1, -(-shuffle_buffer_chunks * NOMINAL_CHUNK_SEQUENCES // batch_size))
+    dataset = dataset.shuffle(shuffle_buffer_chunks)
+    dataset = dataset.repeat()
+    dataset = dataset.rebatch(block_batches * batch_size, drop_remainder=True)
+    return dataset.flat_map(partial(_shuffled_block_batches, batch_size=batch_size))
+
+
+def _read_example(path, offset, position):
+    """Reads the single example that starts at a byte offset (or position) of a shard."""
+    if _HAS_BYTE_OFFSETS:
+        variant = tf.raw_ops.TFRecordDatasetV2(
+            filenames=tf.reshape(path, [1]), compression_type='',
+            buffer_size=tf.constant(256 * 1024, tf.int64), byte_offsets=tf.reshape(offset, [1])
+        )
+        return tf.data.experimental.from_variant(variant, tf.TensorSpec([], tf.string)).take(1)
+    return tf.data.TFRecordDataset(path).skip(position).take(1)
+
+
 def create_dataset(
     record_names: List[str],
     config: Dict[str, Any],
@@ -56,29 +283,122 @@ def create_dataset(
     """
     Creates a highly optimized tf.data.Dataset using a combined, two-stage
     shuffling strategy (file-level shuffle + interleave).
+    Beat-level TFRecord directories (see tfrecord_layout.py) are windowed into
+    sequences of config['sequence_len'] beats per record while reading; the
+    legacy pre-windowed files are read as they are. Raw-beat directories are
+    turned into scalograms (config['wavelet_scales'], or the recorded scales)
+    chunk by chunk before windowing, so every beat is transformed once.
+    With config['dataset_cache_dir'] set, the parsed beat chunks of every work item
+    are cached to local files keyed by a fingerprint of the records, data config
+    and TFRecord files (see dataset_cache.py), so later epochs and repeated
+    validation passes skip reading and parsing. Windowing and normalization run
+    after the cache: each beat is stored once, and folds with different mean/scale
+    share the cache.
+    With config['batch_native_pipeline'] the chunks are rebatched as tensors and
+    normalized once per batch (see batch_native_batches).
+    With config['memmap_loader'] the sequences are instead gathered from a
+    memory-mapped beat array of config['preprocessed_dir'] with a global
+    per-epoch shuffle (see memmap_loader.py); the TFRecords are not read.
+    config['in_memory_dataset'] does the same from a copy of the array in RAM
+    that is loaded once and shared by every call.
     """
+    if config.get("memmap_loader", False) or config.get("in_memory_dataset", False):
+        return create_memmap_dataset(record_names, config, batch_size, is_training, mean, scale)
+
     tfrecord_dir = Path(config.get("tfrecord_dir_batched", "tfrecord_data_batched"))
-    tfrecord_files = [str(tfrecord_dir / f"{name}.tfrecord") for name in record_names if (tfrecord_dir / f"{name}.tfrecord").exists()]
-    
-    if not tfrecord_files:
+    layout = read_layout(tfrecord_dir)
+    is_beat_layout = layout is not None and layout.get("layout") == BEAT_LAYOUT
+    if is_beat_layout:
+        sequence_len, height, width = config['sequence_len'], layout["height"], layout["width"]
+        storage_dtype = layout.get("storage_dtype", 'float32')
+        window_dtype = tf.as_dtype(storage_dtype)
+        if layout.get("representation") == RAW_REPRESENTATION:
+            # Raw beat windows: the scalograms are computed in-graph, at any scales.
+            scales = config.get("wavelet_scales") or layout["wavelet_scales"]
+            parse_beat_chunk = partial(
+                _parse_raw_beat_chunk,
+                parse_beat_chunk=partial(_parse_beat_chunk, compression=layout.get("compression"), storage_dtype=storage_dtype),
+                cwt=in_graph_cwt(layout["wavelet"], scales, width)
+            )
+            height, window_dtype = len(scales), tf.float32
+        else:
+            # A training config may select a subset of the stored wavelet scales.
+            scale_rows = resolve_scale_rows(layout.get("wavelet_scales"), config.get("wavelet_scales"))
+            if scale_rows is not None:
+                height = len(scale_rows)
+            parse_beat_chunk = partial(_parse_beat_chunk, compression=layout.get("compression"), storage_dtype=storage_dtype,
+                                       scale_rows=scale_rows)
+        window = partial(window_beat_chunks, sequence_len=sequence_len, height=height, width=width, dtype=window_dtype)
+        num_beats = sum(layout["records"].get(rec, 0) for rec in record_names)
+        expected_cache_bytes = num_beats * (height * width * window_dtype.size + 4)
+    else:
+        expected_cache_bytes = None
+
+    if is_beat_layout and layout.get("index"):
+        # Sharded layout: the offset index splits the requested records into
+        # equally sized read units, so the interleave readers stay balanced no
+        # matter how records are distributed over shards, and only the selected
+        # records' examples are read.
+        index = ShardIndex(tfrecord_dir)
+        read_units = index.read_units(record_names, sequence_len, READ_UNIT_EXAMPLES)
+        work_items = read_units
+        example_paths = tf.constant(np.array(index.shard_paths)[index.example_shard])
+        example_offsets = tf.constant(index.example_offset)
+        example_positions = tf.constant(index.example_position)
+
+        def record_sequences(item_id, unit):
+            start, stop, skip = unit[0], unit[1], unit[2]
+            examples = tf.data.Dataset.from_tensor_slices(
+                (example_paths[start:stop], example_offsets[start:stop], example_positions[start:stop])
+            )
+            beat_chunks = examples.flat_map(_read_example).map(parse_beat_chunk)
+            return window(cache_chunks(beat_chunks, item_id), skip=skip)
+    else:
+        # One file per record. Beat-level files are windowed per record, so every
+        # file yields chunks of sequences in either layout.
+        work_items = [str(tfrecord_dir / f"{name}.tfrecord") for name in record_names if (tfrecord_dir / f"{name}.tfrecord").exists()]
+        if is_beat_layout:
+            def record_sequences(item_id, filepath):
+                beat_chunks = tf.data.TFRecordDataset(filepath).map(parse_beat_chunk)
+                return window(cache_chunks(beat_chunks, item_id))
+        else:
+            def record_sequences(item_id, filepath):
+                return cache_chunks(tf.data.TFRecordDataset(filepath).map(_parse_batched_sequence), item_id)
+
+    def cache_chunks(chunks, item_id):
+        # One cache part per work item, in front of windowing and normalization.
+        if cache_path is None:
+            return chunks
+        return chunks.cache(tf.strings.join([cache_path, "_", tf.strings.as_string(item_id)]))
+
+    if len(work_items) == 0:
         logger.error(f"No BATCHED TFRecord files found for the provided records in directory: {tfrecord_dir}")
         return tf.data.Dataset.from_tensor_slices(([], []))
 
     mean_tensor = tf.constant(mean, dtype=tf.float32) if mean is not None else None
     scale_tensor = tf.constant(scale, dtype=tf.float32) if scale is not None else None
+
+    cache_path = None
+    if config.get("dataset_cache_dir"):
+        quota_bytes = int(config.get("dataset_cache_quota_gb", DEFAULT_CACHE_QUOTA_GB) * 2**30)
+        key = dataset_fingerprint(record_names, config, tfrecord_dir)
+        cache_path = prepare_cache(Path(config["dataset_cache_dir"]), key, expected_cache_bytes, quota_bytes,
+                                   {"records": list(record_names), "tfrecord_dir": str(tfrecord_dir)},
+                                   parts=len(work_items))
     
     # --- START: Combined Shuffling Implementation ---
 
-    # 1. Create a dataset from the file paths.
-    files_dataset = tf.data.Dataset.from_tensor_slices(tfrecord_files)
+    # 1. Create a dataset from the file paths (or the read units of a sharded directory).
+    # Each item carries its position, which names its part of the dataset cache.
+    files_dataset = tf.data.Dataset.from_tensor_slices((np.arange(len(work_items), dtype=np.int64), work_items))
 
     # 2. **Global Shuffle**: If training, shuffle the list of files. This is Solution 1.
     if is_training:
-        files_dataset = files_dataset.shuffle(len(tfrecord_files))
+        files_dataset = files_dataset.shuffle(len(work_items))
 
     # 3. **Local Shuffle**: Use interleave to mix records from multiple files. This is Solution 2.
     dataset = files_dataset.interleave(
-        lambda filepath: tf.data.TFRecordDataset(filepath),
+        record_sequences,
         cycle_length=4,  # Adjust based on CPU cores, 4 is a safe default
         block_length=1,
         num_parallel_calls=tf.data.AUTOTUNE
@@ -86,39 +406,44 @@ def create_dataset(
     
     # --- END: Combined Shuffling Implementation ---
 
-    # The rest of the pipeline remains the same
-    def _parse_batched_sequence(example_proto):
-        feature_description = {
-            'num_in_batch': tf.io.FixedLenFeature([], tf.int64),
-            'sequence_len': tf.io.FixedLenFeature([], tf.int64),
-            'height': tf.io.FixedLenFeature([], tf.int64),
-            'width': tf.io.FixedLenFeature([], tf.int64),
-            'sequences_raw': tf.io.FixedLenFeature([], tf.string),
-            'labels_raw': tf.io.FixedLenFeature([], tf.string),
-        }
-        parsed = tf.io.parse_single_example(example_proto, feature_description)
-        shape = [parsed['num_in_batch'], parsed['sequence_len'], parsed['height'], parsed['width']]
-        sequences = tf.reshape(tf.io.decode_raw(parsed['sequences_raw'], tf.float32), shape)
-        labels = tf.reshape(tf.io.decode_raw(parsed['labels_raw'], tf.int32), [parsed['num_in_batch']])
-        return sequences, labels
-
-    dataset = dataset.map(_parse_batched_sequence, num_parallel_calls=tf.data.AUTOTUNE)
-    dataset = dataset.flat_map(lambda seq, lab: tf.data.Dataset.from_tensor_slices((seq, lab)))
-
-    def normalize_and_format(scalogram_sequence, label):
-        if mean_tensor is not None and scale_tensor is not None:
-            scalogram_sequence = (scalogram_sequence - mean_tensor) / scale_tensor
-        scalogram_sequence = tf.expand_dims(scalogram_sequence, axis=-1)
-        return scalogram_sequence, label
-
-    dataset = dataset.map(normalize_and_format, num_parallel_calls=tf.data.AUTOTUNE)
+    if config.get("batch_native_pipeline", False):
+        dataset = batch_native_batches(dataset, batch_size, is_training,
+                                       config.get("shuffle_buffer_chunks", DEFAULT_SHUFFLE_BUFFER_CHUNKS))
 
-    if is_training:
-        # Final shuffle with a small buffer. The heavy lifting is already done.
-        dataset = dataset.shuffle(buffer_size=8)
-        dataset = dataset.repeat()
+        def normalize_batch(scalogram_batch, labels):
+            if mean_tensor is not None and scale_tensor is not None:
+                scalogram_batch = (scalogram_batch - mean_tensor) / scale_tensor
+            return tf.expand_dims(scalogram_batch, axis=-1), labels
+
+        dataset = dataset.map(normalize_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        def unbatch_sequences(seq, lab, *quantization):
+            # Quantized layouts carry the record's scale and offset along with each sequence.
+            per_sequence = tuple(tf.repeat(param[None], tf.shape(lab)[0], axis=0) for param in quantization)
+            return tf.data.Dataset.from_tensor_slices((seq, lab) + per_sequence)
+
+        dataset = dataset.flat_map(unbatch_sequences)
+
+        def normalize_and_format(scalogram_sequence, label, *quantization):
+            # Stored beats may be float16 or quantized integers; dequantize before normalizing.
+            if quantization:
+                scalogram_sequence = _dequantize(scalogram_sequence, *quantization)
+            else:
+                scalogram_sequence = tf.cast(scalogram_sequence, tf.float32)
+            if mean_tensor is not None and scale_tensor is not None:
+                scalogram_sequence = (scalogram_sequence - mean_tensor) / scale_tensor
+            scalogram_sequence = tf.expand_dims(scalogram_sequence, axis=-1)
+            return scalogram_sequence, label
+
+        dataset = dataset.map(normalize_and_format, num_parallel_calls=tf.data.AUTOTUNE)
+
+        if is_training:
+            # Final shuffle with a small buffer. The heavy lifting is already done.
+            dataset = dataset.shuffle(buffer_size=8)
+            dataset = dataset.repeat()
+
+        dataset = dataset.batch(batch_size)
 
-    dataset = dataset.batch(batch_size)
     dataset = dataset.prefetch(buffer_size=tf.data.AUTOTUNE)
 
     logger.info(f"Optimized tf.data.Dataset created using combined shuffling for {'training' if is_training else 'validation'}.")
@@ -11,7 +11,6 @@ import sys
 import logging
 import datetime
 import json
-import h5py
 import numpy as np
 import tensorflow as tf
 from sklearn.model_selection import KFold, train_test_split
@@ -26,6 +25,8 @@ import numpy as np
 # Import all custom pipeline components
 from DataLoader import create_dataset, get_all_labels
 from HistoryManager import HistoryManager
+from dataset_store import iter_record_scalograms
+from memmap_loader import shared_scaler_stats
 from sklearn.utils.class_weight import compute_class_weight
 
 
@@ -59,26 +60,22 @@ class TimeSeriesModel:
         Quickly and memory-efficiently calculates the mean and standard deviation
         for the training data of the current fold by processing data in chunks.
         """
+        if self.data_params.get("in_memory_dataset", False):
+            # The fold is a record mask over the shared in-RAM beat array; no disk reads.
+            mean, scale = shared_scaler_stats(self.train_records, self.data_params)
+            if mean is None:
+                raise RuntimeError(f"Scaler fitting failed for Fold {self.fold_num}.")
+            return mean, scale
+
         logger.info(f"[Fold {self.fold_num}] Calculating normalization stats in memory-efficient chunks...")
         scaler = StandardScaler()
-        h5_dir = self.data_params["preprocessed_dir"]
         
         for rec_name in tqdm(self.train_records, desc=f"Calculating Stats (Fold {self.fold_num})"):
             try:
-                with h5py.File(os.path.join(h5_dir, f"{rec_name}.h5"), 'r') as hf:
-                    if 'scalograms' not in hf:
-                        continue
-                    
-                    dataset = hf['scalograms']
-                    num_samples = dataset.shape[0]
-
-                    # Process the HDF5 dataset in smaller chunks
-                    for i in range(0, num_samples, chunk_size):
-                        end_index = min(i + chunk_size, num_samples)
-                        data_chunk = dataset[i:end_index] # Reads only a small part into memory
-                        
-                        reshaped_chunk = data_chunk.reshape(-1, data_chunk.shape[-1])
-                        scaler.partial_fit(reshaped_chunk)
+                # Chunks come from the consolidated store when present, else from {rec_name}.h5
+                for data_chunk in iter_record_scalograms(rec_name, self.data_params, chunk_size):
+                    reshaped_chunk = data_chunk.reshape(-1, data_chunk.shape[-1])
+                    scaler.partial_fit(reshaped_chunk)
 
             except (IOError, KeyError) as e:
                 logger.warning(f"Could not read {rec_name}.h5 for scaler stats: {e}")
@@ -139,6 +136,16 @@ class TimeSeriesModel:
         # The following hardcoded line has been REMOVED:
         # data_params['tfrecord_dir'] = "tfrecord_data_raw"
         
+        if self.data_params.get("normalize_in_model", False):
+            # Bake the fold statistics into every trial model (see ModelBuilder.set_normalization)
+            # and feed raw scalograms.
+            builder = getattr(self.model_builder_function, '__self__', None)
+            if builder is None or not hasattr(builder, 'set_normalization'):
+                logger.error(f"[Fold {self.fold_num}] normalize_in_model needs a ModelBuilder method as the model builder function.")
+                return None
+            builder.set_normalization(mean, scale)
+            mean, scale = None, None
+
         train_ds = create_dataset(self.train_records, self.data_params, self.training_params['batch_size'], is_training=True, mean=mean, scale=scale)
         val_ds = create_dataset(self.val_records, self.data_params, self.training_params['batch_size'], is_training=False, mean=mean, scale=scale)
 
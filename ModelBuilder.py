@@ -12,12 +12,13 @@ from tensorflow.keras.layers import (
     Input, Conv2D, BatchNormalization, MaxPooling2D, GlobalAveragePooling2D,
     Dense, TimeDistributed, LayerNormalization, LSTM,
     MultiHeadAttention, Dropout, Add, GlobalAveragePooling1D,
-    Embedding, Conv1D, DepthwiseConv1D, Activation
+    Embedding, Conv1D, DepthwiseConv1D, Activation, Normalization
 )
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import AdamW
 import keras_tuner as kt
-from typing import Tuple
+import numpy as np
+from typing import Optional, Tuple
 
 logger = tf.get_logger()
 
@@ -122,12 +123,40 @@ class AttentionOnlyBlock(tf.keras.layers.Layer):
 # --- Main ModelBuilder Class ---
 class ModelBuilder:
     """Builds various models for a comprehensive, publication-ready experiment."""
-    def __init__(self, scalogram_shape: Tuple[int, int], sequence_len: int, num_classes: int):
+    def __init__(self, scalogram_shape: Tuple[int, int], sequence_len: int, num_classes: int,
+                 mean: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None):
         self.scalogram_shape = scalogram_shape
         self.sequence_len = sequence_len
         self.num_classes = num_classes
+        self.set_normalization(mean, scale)
         logger.info("ModelBuilder initialized with SOTA Conformer and enhanced ablation models.")
 
+    def set_normalization(self, mean: Optional[np.ndarray], scale: Optional[np.ndarray]) -> None:
+        """
+        Sets the fold statistics baked into every model built afterwards (None
+        disables). The models then take raw scalograms and normalize them with a
+        frozen layer in front of the CNN, so the statistics are stored in the
+        saved .keras file. mean/scale are per time step (W,) or per scale and
+        time step (H, W), as computed by the StandardScaler of the fold.
+        """
+        if mean is None or scale is None:
+            self.normalization = None
+            return
+        self.normalization = (np.asarray(mean, dtype=np.float32), np.asarray(scale, dtype=np.float32))
+
+    def _build_input(self) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Creates the sequence input and, if statistics are set, the frozen normalization after it."""
+        inp = Input(shape=(self.sequence_len, self.scalogram_shape[0], self.scalogram_shape[1], 1))
+        if self.normalization is None:
+            return inp, inp
+        mean, scale = self.normalization
+        # Statistics cover the trailing (H, W) axes of (batch, seq, H, W, 1); float32
+        # keeps the arithmetic exact under a mixed-precision policy.
+        axis = tuple(range(4 - mean.ndim, 4))
+        x = Normalization(axis=axis, mean=mean, variance=np.square(scale), dtype='float32',
+                          name='fold_normalization')(inp)
+        return inp, x
+
     def _build_feature_extractor(self, embed_dim: int) -> Model:
         """Builds the shared 2D CNN sub-model."""
         input_shape = (self.scalogram_shape[0], self.scalogram_shape[1], 1)
@@ -154,9 +183,9 @@ class ModelBuilder:
         num_blocks = hp.Int('num_blocks', min_value=1, max_value=2, step=1)
         ff_dim = ff_dim_multiplier * embed_dim
 
-        inp = Input(shape=(self.sequence_len, self.scalogram_shape[0], self.scalogram_shape[1], 1))
+        inp, x = self._build_input()
         feature_extractor = self._build_feature_extractor(embed_dim=embed_dim)
-        x = TimeDistributed(feature_extractor)(inp)
+        x = TimeDistributed(feature_extractor)(x)
         for _ in range(num_blocks):
             x = ConformerBlock(self.sequence_len, embed_dim, num_heads, ff_dim, kernel_size, dropout_rate)(x)
         pooled = GlobalAveragePooling1D()(x)
@@ -180,9 +209,9 @@ class ModelBuilder:
         num_blocks = hp.Int('num_blocks', min_value=1, max_value=2, step=1)
         ff_dim = ff_dim_multiplier * embed_dim
 
-        inp = Input(shape=(self.sequence_len, self.scalogram_shape[0], self.scalogram_shape[1], 1))
+        inp, x = self._build_input()
         feature_extractor = self._build_feature_extractor(embed_dim=embed_dim)
-        x = TimeDistributed(feature_extractor)(inp)
+        x = TimeDistributed(feature_extractor)(x)
         for _ in range(num_blocks):
             x = AttentionOnlyBlock(self.sequence_len, embed_dim, num_heads, ff_dim, dropout_rate)(x)
         pooled = GlobalAveragePooling1D()(x)
@@ -196,9 +225,9 @@ class ModelBuilder:
         logger.info("Building a new ABLATION (CNN-LSTM) model instance...")
         embed_dim = hp.Int('embed_dim', min_value=64, max_value=128, step=64)
         lstm_units = hp.Int('lstm_units', min_value=64, max_value=128, step=64)
-        inp = Input(shape=(self.sequence_len, self.scalogram_shape[0], self.scalogram_shape[1], 1))
+        inp, x = self._build_input()
         feature_extractor = self._build_feature_extractor(embed_dim=embed_dim)
-        features = TimeDistributed(feature_extractor)(inp)
+        features = TimeDistributed(feature_extractor)(x)
         lstm_out = LSTM(units=lstm_units, return_sequences=False)(features)
         output = Dense(self.num_classes, activation='softmax')(lstm_out)
         model = Model(inputs=inp, outputs=output, name="Ablation_CNN_LSTM_Model")
@@ -209,9 +238,9 @@ class ModelBuilder:
         """Builds a simple CNN-only baseline model."""
         logger.info("Building a new BASELINE (CNN-Only) model instance...")
         embed_dim = hp.Int('embed_dim', min_value=64, max_value=128, step=64)
-        inp = Input(shape=(self.sequence_len, self.scalogram_shape[0], self.scalogram_shape[1], 1))
+        inp, x = self._build_input()
         feature_extractor = self._build_feature_extractor(embed_dim=embed_dim)
-        features = TimeDistributed(feature_extractor)(inp)
+        features = TimeDistributed(feature_extractor)(x)
         pooled = GlobalAveragePooling1D()(features)
         output = Dense(self.num_classes, activation='softmax')(pooled)
         model = Model(inputs=inp, outputs=output, name="Baseline_CNN_Model")
@@ -0,0 +1,81 @@
+# benchmark_cwt.py
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Compares the original per-beat pywt.cwt loop with the batched CWT
+# engine on one record. Reports beats per second for both paths and verifies that
+# the batched scalograms match the reference within float32 tolerance.
+#
+# Usage:
+#   python benchmark_cwt.py --record 100
+#   python benchmark_cwt.py --reference-beats 300
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import wfdb
+
+from cwt_engine import extract_beat_windows, batched_cwt, reference_cwt, get_cwt_operator
+from preprocess_data import Config, setup_logging
+
+
+def load_record_beats(rec_name: str, config: Config) -> np.ndarray:
+    """Loads one record and returns its valid beat windows."""
+    record = wfdb.rdrecord(f"{config.DB_DIRECTORY}/{rec_name}")
+    annotation = wfdb.rdann(f"{config.DB_DIRECTORY}/{rec_name}", 'atr')
+    raw_signal = record.p_signal[:, 0].flatten()
+    beats, _, _ = extract_beat_windows(
+        raw_signal, annotation.sample, annotation.symbol, config.AAMI_MAP, config.TIME_STEPS_PER_BEAT
+    )
+    return beats
+
+
+def main():
+    """Runs both CWT paths on the same beats and logs throughput and agreement."""
+    parser = argparse.ArgumentParser(description="Benchmark the batched CWT engine against per-beat pywt.cwt.")
+    parser.add_argument('--record', type=str, default='100', help='MIT-BIH record to benchmark on.')
+    parser.add_argument('--reference-beats', type=int, default=500,
+                        help='Number of beats timed on the slow per-beat path (all beats are used for the batched path).')
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    config = Config()
+
+    if Path(config.DB_DIRECTORY, f"{args.record}.hea").exists():
+        beats = load_record_beats(args.record, config)
+        logger.info(f"Loaded {len(beats)} beats from record {args.record}.")
+    else:
+        rng = np.random.default_rng(0)
+        beats = np.cumsum(rng.normal(scale=0.01, size=(2000, config.TIME_STEPS_PER_BEAT)), axis=1)
+        logger.warning(f"Record {args.record} not found in '{config.DB_DIRECTORY}'; using {len(beats)} synthetic beats.")
+
+    scales, wavelet = config.WAVELET_SCALES, config.WAVELET_NAME
+
+    start = time.perf_counter()
+    get_cwt_operator(wavelet, tuple(float(s) for s in scales), beats.shape[1])
+    build_time = time.perf_counter() - start
+
+    ref_beats = beats[:args.reference_beats]
+    start = time.perf_counter()
+    reference = reference_cwt(ref_beats, scales, wavelet)
+    ref_rate = len(ref_beats) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batched = batched_cwt(beats, scales, wavelet)
+    batched_rate = len(beats) / (time.perf_counter() - start)
+
+    max_abs_err = float(np.max(np.abs(batched[:len(ref_beats)] - reference)))
+    tolerance = float(np.finfo(np.float32).eps * np.max(np.abs(reference)) * 8)
+
+    logger.info(f"Filter bank build (one-off per worker): {build_time * 1e3:.1f} ms")
+    logger.info(f"Per-beat pywt.cwt : {ref_rate:10.1f} beats/s")
+    logger.info(f"Batched engine    : {batched_rate:10.1f} beats/s ({batched_rate / ref_rate:.1f}x)")
+    logger.info(f"Max abs difference: {max_abs_err:.3e} (float32 tolerance {tolerance:.3e})")
+    if max_abs_err > tolerance:
+        logger.error("Batched scalograms do NOT match the reference within float32 tolerance.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmark_h5_layouts.py
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Writes the same scalograms with every supported HDF5 layout
+# (contiguous, 1- and 128-beat chunks with no/gzip/lzf/Blosc compression, float32
+# and float16) and reports file size, write time and random-read time for each.
+#
+# Usage:
+#   python benchmark_h5_layouts.py --source preprocessed_data_h5_raw/dataset.h5
+#   python benchmark_h5_layouts.py --num-beats 2000
+
+import argparse
+import itertools
+import tempfile
+import time
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from cwt_engine import batched_cwt
+from preprocess_data import Config, setup_logging
+from scalogram_store import SCALOGRAM_DATASET, blosc_available, read_scalograms, write_scalograms
+
+
+def candidate_layouts():
+    """Yields (name, layout) pairs for every layout worth comparing."""
+    yield "contiguous/float32", {"chunk_beats": None, "compression": None, "compression_opts": None, "storage_dtype": 'float32'}
+    compressions = [None, 'gzip', 'lzf'] + (['blosc'] if blosc_available() else [])
+    for chunk_beats, compression, dtype in itertools.product((1, 128), compressions, ('float32', 'float16')):
+        name = f"chunk{chunk_beats}/{compression or 'none'}/{dtype}"
+        yield name, {"chunk_beats": chunk_beats, "compression": compression, "compression_opts": None, "storage_dtype": dtype}
+
+
+def load_scalograms(args, config: Config) -> np.ndarray:
+    """Loads the first scalograms of an existing file, or computes them for synthetic beats."""
+    if args.source:
+        with h5py.File(args.source, 'r') as hf:
+            return read_scalograms(hf[SCALOGRAM_DATASET], slice(args.num_beats))
+    rng = np.random.default_rng(0)
+    beats = np.cumsum(rng.normal(scale=0.01, size=(args.num_beats, config.TIME_STEPS_PER_BEAT)), axis=1)
+    return batched_cwt(beats, config.WAVELET_SCALES, config.WAVELET_NAME)
+
+
+def time_random_reads(path: Path, num_reads: int, window: int, rng: np.random.Generator) -> float:
+    """Returns the mean time in ms to read `window` consecutive beats at random offsets."""
+    with h5py.File(path, 'r') as hf:
+        dataset = hf[SCALOGRAM_DATASET]
+        starts = rng.integers(0, max(1, dataset.shape[0] - window), size=num_reads)
+        start = time.perf_counter()
+        for i in starts:
+            read_scalograms(dataset, slice(i, i + window))
+        return (time.perf_counter() - start) / num_reads * 1e3
+
+
+def main():
+    """Benchmarks each layout and logs a comparison table."""
+    parser = argparse.ArgumentParser(description="Benchmark HDF5 scalogram layouts.")
+    parser.add_argument('--source', type=str, help='Existing .h5 file (e.g. dataset.h5) to take scalograms from.')
+    parser.add_argument('--num-beats', type=int, default=2000, help='Number of beats (synthetic, or the first beats of --source).')
+    parser.add_argument('--num-reads', type=int, default=500, help='Random reads per layout.')
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    config = Config()
+    scalograms = load_scalograms(args, config)
+    logger.info(f"Benchmarking {len(scalograms)} scalograms of shape {scalograms.shape[1:]}.")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, layout in candidate_layouts():
+            path = Path(tmp_dir) / f"{name.replace('/', '_')}.h5"
+            start = time.perf_counter()
+            write_scalograms(path, scalograms, layout)
+            write_time = time.perf_counter() - start
+            rng = np.random.default_rng(0)
+            single_ms = time_random_reads(path, args.num_reads, 1, rng)
+            chunk_ms = time_random_reads(path, max(1, args.num_reads // 10), 128, rng)
+            rows.append((name, path.stat().st_size / 2**20, write_time, single_ms, chunk_ms))
+
+    logger.info(f"{'layout':<24} {'size MB':>9} {'write s':>9} {'1-beat ms':>10} {'128-beat ms':>12}")
+    for name, size_mb, write_time, single_ms, chunk_ms in rows:
+        logger.info(f"{name:<24} {size_mb:9.2f} {write_time:9.3f} {single_ms:10.3f} {chunk_ms:12.3f}")
+    if not blosc_available():
+        logger.info("Blosc layouts skipped: install 'hdf5plugin' to include them.")
+
+
+if __name__ == "__main__":
+    main()
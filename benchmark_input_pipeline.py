@@ -0,0 +1,176 @@
+# benchmark_input_pipeline.py
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Compares the two post-parsing stages of DataLoader.create_dataset:
+# the per-element path (flat_map into single sequences, per-sequence normalize
+# map and shuffle, batch) and the batch-native path (data config
+# "batch_native_pipeline": chunks rebatched as tensors, normalized per batch,
+# shuffled within "shuffle_buffer_chunks" chunks). Given the preprocessed
+# directory, it also times the memory-mapped loader (data config "memmap_loader",
+# global shuffle; see memmap_loader.py). For each path it times a validation pass
+# and the same number of training steps, and reports sequences/s and CPU seconds
+# per 1000 sequences. It also checks that the validation batches of the two
+# TFRecord paths are identical and that the memory-mapped loader yields the same
+# labels. Without a TFRecord directory it preprocesses and converts a few
+# synthetic records first (see synthetic_records.py), so no download is needed.
+#
+# Usage:
+#   python benchmark_input_pipeline.py --tfrecord-dir tfrecord_data_batched --records 100,101,103
+#   python benchmark_input_pipeline.py --tfrecord-dir tfrecord_data_batched --preprocessed-dir preprocessed_data_h5_raw
+#   python benchmark_input_pipeline.py --num-records 8 --duration-seconds 1805 --batch-size 64
+
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import create_batched_tfrecords
+from DataLoader import DEFAULT_SHUFFLE_BUFFER_CHUNKS, create_dataset
+from preprocess_data import Config, run_preprocessing, setup_logging
+from synthetic_records import generate_records
+from tfrecord_layout import read_layout
+
+PIPELINES = ("per_element", "batch_native")
+MEMMAP_PIPELINE = "memmap"
+
+
+def _time_pass(dataset, steps: int) -> Dict[str, float]:
+    """Iterates `steps` batches of a dataset; returns sequences, wall and CPU seconds and per-batch checksums."""
+    num_sequences, checksums = 0, []
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for scalograms, labels in dataset.take(steps):
+        num_sequences += int(labels.shape[0])
+        checksums.append((float(np.sum(scalograms, dtype=np.float64)), labels.numpy().tobytes()))
+    return {"sequences": num_sequences, "wall_s": time.perf_counter() - wall_start,
+            "cpu_s": time.process_time() - cpu_start, "checksums": checksums}
+
+
+def benchmark(tfrecord_dir: Path, record_names: List[str], sequence_len: int, batch_size: int,
+              shuffle_buffer_chunks: int, repeats: int, preprocessed_dir: Optional[Path] = None,
+              memmap_dir: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """
+    Measures a validation pass and an equally long training run for each
+    pipeline. The memory-mapped loader is included when preprocessed_dir is
+    given; its beat array is exported to memmap_dir before timing.
+    """
+    layout = read_layout(tfrecord_dir) or {}
+    width = layout.get("width", 187)
+    # Identity statistics: the normalization arithmetic runs without changing the data.
+    mean, scale = np.zeros(width, np.float32), np.ones(width, np.float32)
+    base_config = {"tfrecord_dir_batched": str(tfrecord_dir), "sequence_len": sequence_len,
+                   "shuffle_buffer_chunks": shuffle_buffer_chunks}
+    if layout.get("wavelet_scales"):
+        base_config["wavelet_scales"] = layout["wavelet_scales"]
+
+    pipelines = PIPELINES + ((MEMMAP_PIPELINE,) if preprocessed_dir else ())
+    rows = []
+    for pipeline in pipelines:
+        config = dict(base_config, batch_native_pipeline=pipeline == "batch_native")
+        if pipeline == MEMMAP_PIPELINE:
+            config.update(memmap_loader=True, preprocessed_dir=str(preprocessed_dir),
+                          memmap_dir=str(memmap_dir) if memmap_dir else None)
+        for mode in ("validation", "training"):
+            dataset = create_dataset(record_names, config, batch_size, is_training=mode == "training", mean=mean, scale=scale)
+            # Training repeats forever; it runs as many steps as a validation pass has batches.
+            steps = rows[0]["steps"] if mode == "training" else -1
+            for _ in dataset.take(1):
+                pass  # Build the pipeline and fill the buffers before timing.
+            passes = [_time_pass(dataset, steps) for _ in range(repeats)]
+            rows.append({"pipeline": pipeline, "mode": mode, "steps": len(passes[0]["checksums"]),
+                         "sequences": passes[0]["sequences"],
+                         "wall_s": sum(p["wall_s"] for p in passes) / repeats,
+                         "cpu_s": sum(p["cpu_s"] for p in passes) / repeats,
+                         "checksums": passes[0]["checksums"]})
+    return rows
+
+
+def report(rows: List[Dict[str, Any]], logger) -> None:
+    """Logs one line per pipeline and mode, with the speedup over the per-element path."""
+    base = {row["mode"]: row for row in rows if row["pipeline"] == "per_element"}
+    logger.info(f"{'pipeline':>13} {'mode':>11} {'sequences':>10} {'sequences/s':>12} "
+                f"{'cpu s/1k seq':>13} {'speedup':>8}")
+    for row in rows:
+        rate = row["sequences"] / max(row["wall_s"], 1e-9)
+        base_rate = base[row["mode"]]["sequences"] / max(base[row["mode"]]["wall_s"], 1e-9)
+        logger.info(f"{row['pipeline']:>13} {row['mode']:>11} {row['sequences']:>10} {rate:>12.0f} "
+                    f"{1000 * row['cpu_s'] / max(row['sequences'], 1):>13.3f} {rate / base_rate:>7.2f}x")
+    validation = [row for row in rows if row["mode"] == "validation" and row["pipeline"] in PIPELINES]
+    if all(row["checksums"] == validation[0]["checksums"] for row in validation):
+        logger.info("Validation batches are identical across the TFRecord pipelines.")
+    else:
+        logger.warning("Validation batches differ between the TFRecord pipelines.")
+    memmap = next((row for row in rows if row["mode"] == "validation" and row["pipeline"] == MEMMAP_PIPELINE), None)
+    if memmap is not None:
+        # The TFRecord paths interleave records, so only the label multiset is comparable.
+        labels = [np.sort(np.frombuffer(b"".join(checksum[1] for checksum in row["checksums"]), np.int32))
+                  for row in (validation[0], memmap)]
+        if np.array_equal(*labels):
+            logger.info("The memory-mapped loader yields the same validation labels.")
+        else:
+            logger.warning("The memory-mapped loader yields different validation labels.")
+
+
+def main():
+    """Prepares the input, runs the benchmark and prints the report."""
+    parser = argparse.ArgumentParser(description="Benchmark the per-element, batch-native and memory-mapped input pipelines.")
+    parser.add_argument('--tfrecord-dir', type=str, default=None,
+                        help='Beat-level TFRecord directory (default: convert synthetic records).')
+    parser.add_argument('--preprocessed-dir', type=str, default=None,
+                        help='Preprocessed directory of --tfrecord-dir; adds the memory-mapped loader.')
+    parser.add_argument('--records', type=str, default=None,
+                        help='Comma-separated records to read (default: every record of the directory).')
+    parser.add_argument('--num-records', type=int, default=4, help='Number of synthetic records.')
+    parser.add_argument('--duration-seconds', type=float, default=600.0, help='Length of each synthetic record.')
+    parser.add_argument('--sequence-len', type=int, default=3, help='Sequence length used by the loader.')
+    parser.add_argument('--batch-size', type=int, default=64, help='Loader batch size.')
+    parser.add_argument('--shuffle-buffer-chunks', type=int, default=DEFAULT_SHUFFLE_BUFFER_CHUNKS,
+                        help='Chunk shuffle buffer of the batch-native training path.')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed passes per measurement.')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated files.')
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    work_dir = Path(tempfile.mkdtemp(prefix='ecg_pipeline_bench_'))
+    try:
+        if args.tfrecord_dir:
+            tfrecord_dir = Path(args.tfrecord_dir)
+            preprocessed_dir = Path(args.preprocessed_dir) if args.preprocessed_dir else None
+        else:
+            config = Config()
+            config.DB_DIRECTORY = str(work_dir / 'records')
+            config.OUTPUT_DIRECTORY = str(work_dir / 'preprocessed')
+            config.RECORD_NAMES = generate_records(Path(config.DB_DIRECTORY), args.num_records, args.duration_seconds)
+            run_preprocessing(config, force=True)
+            preprocessed_dir = Path(config.OUTPUT_DIRECTORY)
+            tfrecord_dir = work_dir / 'tfrecords'
+            if create_batched_tfrecords.convert_records(Path(config.OUTPUT_DIRECTORY), tfrecord_dir) is None:
+                raise RuntimeError("Conversion of the synthetic records produced no TFRecords.")
+
+        layout = read_layout(tfrecord_dir)
+        if args.records:
+            record_names = args.records.split(',')
+        elif layout is not None:
+            record_names = sorted(layout["records"])
+        else:
+            record_names = sorted(path.stem for path in tfrecord_dir.glob("*.tfrecord"))
+
+        logger.info(f"Benchmarking input pipelines on {len(record_names)} records of {tfrecord_dir}.")
+        rows = benchmark(tfrecord_dir, record_names, args.sequence_len, args.batch_size,
+                         args.shuffle_buffer_chunks, args.repeats, preprocessed_dir, work_dir / 'memmap')
+        report(rows, logger)
+    finally:
+        if args.keep:
+            logger.info(f"Benchmark files kept in {work_dir}.")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Conversion workers must not inherit the parent's TensorFlow state.
+    multiprocessing.set_start_method('spawn')
+    main()
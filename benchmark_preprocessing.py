@@ -0,0 +1,141 @@
+# benchmark_preprocessing.py
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Offline throughput benchmark for preprocess_data.py. Generates
+# synthetic MIT-BIH-format records (see synthetic_records.py), runs the full
+# preprocessing stage over them with 1..N workers and reports beats/s, seconds
+# per record, peak RSS of the parent and of the largest worker, and the speedup
+# and parallel efficiency relative to the smallest worker count. With a
+# conditioning filter enabled (--highpass-hz/--lowpass-hz) it also reports the
+# filter's share of the worker time. No network or PhysioNet download is needed.
+#
+# Usage:
+#   python benchmark_preprocessing.py --num-records 8 --duration-seconds 1805 --workers 1,2,4
+#   python benchmark_preprocessing.py --data-dir mit-bih-arrhythmia-database-1.0.0 --records 100,101,103
+#   python benchmark_preprocessing.py --num-records 4 --workers 1,4 --highpass-hz 0.5 --lowpass-hz 45
+
+import argparse
+import logging
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+from preprocess_data import Config, run_preprocessing, setup_logging
+from synthetic_records import generate_records, parse_class_mix
+from work_scheduler import available_cpus
+
+
+def _peak_rss_mb(who: int) -> float:
+    """ru_maxrss in MB (kilobytes on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_once(config: Config, result_queue) -> None:
+    """Runs one forced preprocessing pass in a fresh process and reports its timings and peak RSS."""
+    setup_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    summary = run_preprocessing(config, force=True)
+    summary["parent_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+    summary["worker_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    result_queue.put(summary)
+
+
+def benchmark(config: Config, worker_counts: List[int]) -> List[Dict[str, Any]]:
+    """
+    Preprocesses config.RECORD_NAMES once per worker count, each run in its own
+    spawned process so the RSS figures are not inflated by earlier runs.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for workers in worker_counts:
+        config.NUM_WORKERS = workers
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_once, args=(config, queue))
+        process.start()
+        summary = queue.get()
+        process.join()
+        summary["workers"] = workers
+        rows.append(summary)
+    return rows
+
+
+def report(rows: List[Dict[str, Any]], num_records: int, logger: logging.Logger) -> None:
+    """
+    Logs one line per worker count with throughput, memory and scaling figures.
+    Speedup and efficiency are relative to the smallest worker count (normally 1).
+    The conditioning columns give the filter's summed worker seconds and its share
+    of all worker busy time.
+    """
+    base = min(rows, key=lambda row: row["workers"])
+    logger.info(f"{'workers':>7} {'beats':>8} {'time s':>8} {'beats/s':>9} {'s/record':>9} "
+                f"{'parent MB':>10} {'worker MB':>10} {'speedup':>8} {'eff.':>6} {'cond. s':>8} {'cond. %':>8}")
+    for row in rows:
+        speedup = base["elapsed"] / row["elapsed"]
+        efficiency = speedup * base["workers"] / row["workers"]
+        conditioning_share = row.get("conditioning_seconds", 0.0) / max(row.get("worker_seconds", 0.0), 1e-9)
+        logger.info(f"{row['workers']:>7} {row['num_beats']:>8} {row['elapsed']:>8.2f} "
+                    f"{row['num_beats'] / row['elapsed']:>9.0f} {row['elapsed'] / num_records:>9.3f} "
+                    f"{row['parent_rss_mb']:>10.0f} {row['worker_rss_mb']:>10.0f} "
+                    f"{speedup:>7.2f}x {efficiency:>6.0%} {row.get('conditioning_seconds', 0.0):>8.2f} {conditioning_share:>8.1%}")
+
+
+def main():
+    """Generates (or reuses) records, runs the benchmark and prints the report."""
+    parser = argparse.ArgumentParser(description="Benchmark preprocess_data.py on synthetic or local records.")
+    parser.add_argument('--data-dir', type=str, default=None,
+                        help='Existing WFDB directory to use instead of generating synthetic records.')
+    parser.add_argument('--records', type=str, default=None, help='Comma-separated record names (with --data-dir).')
+    parser.add_argument('--num-records', type=int, default=8, help='Number of synthetic records.')
+    parser.add_argument('--duration-seconds', type=float, default=1805.0, help='Length of each synthetic record.')
+    parser.add_argument('--heart-rate', type=float, default=75.0, help='Mean heart rate of the synthetic records.')
+    parser.add_argument('--class-mix', type=str, default=None, help="e.g. 'N=0.9,A=0.03,V=0.05,F=0.01,/=0.01'.")
+    parser.add_argument('--noise-std', type=float, default=0.03, help='White-noise level of the synthetic records (mV).')
+    parser.add_argument('--workers', type=str, default=None,
+                        help='Comma-separated worker counts (default: 1, 2, 4, ... up to the available CPUs).')
+    parser.add_argument('--stream-segment-seconds', type=float, default=None, help='Benchmark the streaming path.')
+    parser.add_argument('--highpass-hz', type=float, default=None, help='Enable the conditioning high-pass (e.g. 0.5).')
+    parser.add_argument('--lowpass-hz', type=float, default=None, help='Enable the conditioning low-pass (e.g. 45).')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated records and outputs.')
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    work_dir = Path(tempfile.mkdtemp(prefix='ecg_preprocess_bench_'))
+    try:
+        config = Config()
+        if args.data_dir:
+            config.DB_DIRECTORY = args.data_dir
+            if args.records:
+                config.RECORD_NAMES = args.records.split(',')
+        else:
+            config.DB_DIRECTORY = str(work_dir / 'records')
+            class_mix = parse_class_mix(args.class_mix) if args.class_mix else None
+            config.RECORD_NAMES = generate_records(Path(config.DB_DIRECTORY), args.num_records, args.duration_seconds,
+                                                   heart_rate=args.heart_rate, class_mix=class_mix, noise_std=args.noise_std)
+        config.OUTPUT_DIRECTORY = str(work_dir / 'preprocessed')
+        config.STREAM_SEGMENT_SECONDS = args.stream_segment_seconds
+        config.CONDITIONING_HIGHPASS_HZ = args.highpass_hz
+        config.CONDITIONING_LOWPASS_HZ = args.lowpass_hz
+
+        if args.workers:
+            worker_counts = sorted(int(w) for w in args.workers.split(','))
+        else:
+            max_workers = available_cpus()
+            worker_counts = sorted({min(2 ** i, max_workers) for i in range(max_workers.bit_length() + 1)})
+
+        logger.info(f"Benchmarking {len(config.RECORD_NAMES)} records with worker counts {worker_counts}.")
+        rows = benchmark(config, worker_counts)
+        report(rows, len(config.RECORD_NAMES), logger)
+    finally:
+        if args.keep:
+            logger.info(f"Benchmark files kept in {work_dir}.")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmark_tfrecord_compression.py
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Compares the payload compression modes of the batched TFRecords
+# (none, ZLIB, GZIP; see create_batched_tfrecords.TFRECORD_COMPRESSION). For each
+# mode the preprocessed scalograms are converted into a temporary directory and
+# the benchmark reports the size on disk, the conversion time, the CPU cost of
+# parsing and decompressing every example, and the end-to-end sequences/s of
+# DataLoader.create_dataset. Without a preprocessed directory it preprocesses a
+# few synthetic records first (see synthetic_records.py), so no download is needed.
+#
+# Usage:
+#   python benchmark_tfrecord_compression.py --input-dir preprocessed_data_h5_raw
+#   python benchmark_tfrecord_compression.py --num-records 4 --duration-seconds 600 --sequence-len 3
+
+import argparse
+import logging
+import multiprocessing
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import tensorflow as tf
+
+import create_batched_tfrecords
+from DataLoader import _parse_beat_chunk, create_dataset
+from preprocess_data import Config, run_preprocessing, setup_logging
+from synthetic_records import generate_records
+from tfrecord_layout import COMPRESSION_MODES, read_layout
+
+
+def _directory_bytes(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.glob("*.tfrecord"))
+
+
+def measure_decode(tfrecord_dir: Path, compression: Optional[str], repeats: int) -> Dict[str, float]:
+    """Parses (and decompresses) every example of the shards; returns CPU and wall seconds per pass."""
+    shards = sorted(str(path) for path in tfrecord_dir.glob("*.tfrecord"))
+    dataset = tf.data.TFRecordDataset(shards).map(lambda proto: _parse_beat_chunk(proto, compression))
+    for _ in dataset.take(1):
+        pass  # Build the pipeline before timing.
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(repeats):
+        for _ in dataset:
+            pass
+    return {"decode_cpu_s": (time.process_time() - cpu_start) / repeats,
+            "decode_wall_s": (time.perf_counter() - wall_start) / repeats}
+
+
+def measure_pipeline(tfrecord_dir: Path, sequence_len: int, batch_size: int, repeats: int) -> Dict[str, float]:
+    """Iterates the full create_dataset pipeline over every record; returns sequences/s."""
+    layout = read_layout(tfrecord_dir)
+    config = {"tfrecord_dir_batched": str(tfrecord_dir), "sequence_len": sequence_len}
+    dataset = create_dataset(sorted(layout["records"]), config, batch_size)
+    num_sequences, start = 0, time.perf_counter()
+    for _ in range(repeats):
+        for _, labels in dataset:
+            num_sequences += int(labels.shape[0])
+    elapsed = time.perf_counter() - start
+    return {"sequences": num_sequences // repeats, "sequences_per_s": num_sequences / elapsed}
+
+
+def benchmark(input_dir: Path, work_dir: Path, modes: List[Optional[str]], sequence_len: int,
+              batch_size: int, repeats: int) -> List[Dict[str, Any]]:
+    """Converts input_dir once per compression mode and measures each output."""
+    rows = []
+    for compression in modes:
+        output_dir = work_dir / f"tfrecords_{(compression or 'none').lower()}"
+        start = time.perf_counter()
+        summary = create_batched_tfrecords.convert_records(input_dir, output_dir, compression)
+        if summary is None:
+            raise RuntimeError(f"No records to convert in {input_dir}.")
+        row = {"compression": compression or 'none', "bytes": _directory_bytes(output_dir),
+               "convert_s": time.perf_counter() - start, "num_beats": summary["num_beats"]}
+        row.update(measure_decode(output_dir, compression, repeats))
+        row.update(measure_pipeline(output_dir, sequence_len, batch_size, repeats))
+        rows.append(row)
+    return rows
+
+
+def report(rows: List[Dict[str, Any]], logger: logging.Logger) -> None:
+    """Logs one line per mode; the size ratio is relative to the uncompressed output."""
+    base = next((row for row in rows if row["compression"] == 'none'), rows[0])
+    logger.info(f"{'mode':>6} {'MB':>8} {'ratio':>6} {'convert s':>10} {'decode cpu s':>13} "
+                f"{'beats/cpu s':>12} {'sequences/s':>12}")
+    for row in rows:
+        logger.info(f"{row['compression']:>6} {row['bytes'] / 2**20:>8.1f} {row['bytes'] / base['bytes']:>6.2f} "
+                    f"{row['convert_s']:>10.2f} {row['decode_cpu_s']:>13.3f} "
+                    f"{row['num_beats'] / max(row['decode_cpu_s'], 1e-9):>12.0f} {row['sequences_per_s']:>12.0f}")
+
+
+def main():
+    """Prepares the input, runs the benchmark and prints the report."""
+    parser = argparse.ArgumentParser(description="Benchmark TFRecord payload compression modes.")
+    parser.add_argument('--input-dir', type=str, default=None,
+                        help='Preprocessed HDF5 directory (default: preprocess synthetic records).')
+    parser.add_argument('--modes', type=str, default='none,ZLIB,GZIP', help='Comma-separated compression modes.')
+    parser.add_argument('--num-records', type=int, default=4, help='Number of synthetic records.')
+    parser.add_argument('--duration-seconds', type=float, default=600.0, help='Length of each synthetic record.')
+    parser.add_argument('--sequence-len', type=int, default=3, help='Sequence length used by the loader.')
+    parser.add_argument('--batch-size', type=int, default=64, help='Loader batch size.')
+    parser.add_argument('--repeats', type=int, default=3, help='Passes over the data per measurement.')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated files.')
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    modes = [None if mode.lower() == 'none' else mode.upper() for mode in args.modes.split(',')]
+    for mode in modes:
+        if mode not in COMPRESSION_MODES:
+            parser.error(f"Unsupported compression mode '{mode}'.")
+
+    work_dir = Path(tempfile.mkdtemp(prefix='ecg_tfrecord_bench_'))
+    try:
+        if args.input_dir:
+            input_dir = Path(args.input_dir)
+        else:
+            config = Config()
+            config.DB_DIRECTORY = str(work_dir / 'records')
+            config.OUTPUT_DIRECTORY = str(work_dir / 'preprocessed')
+            config.RECORD_NAMES = generate_records(Path(config.DB_DIRECTORY), args.num_records, args.duration_seconds)
+            run_preprocessing(config, force=True)
+            input_dir = Path(config.OUTPUT_DIRECTORY)
+
+        logger.info(f"Benchmarking compression modes {args.modes} on {input_dir}.")
+        rows = benchmark(input_dir, work_dir, modes, args.sequence_len, args.batch_size, args.repeats)
+        report(rows, logger)
+    finally:
+        if args.keep:
+            logger.info(f"Benchmark files kept in {work_dir}.")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Conversion workers must not inherit the parent's TensorFlow state.
+    multiprocessing.set_start_method('spawn')
+    main()
@@ -5,163 +5,449 @@
 # by making the helper functions TensorFlow-agnostic during multiprocessing.
 # It prevents child processes from unnecessarily initializing the GPU, ensuring
 # that the data preprocessing runs smoothly on the CPU without conflicts.
+# The examples are now framed by tfrecord_writer.py in pure Python/NumPy, so
+# neither the workers nor the parent import TensorFlow at all.
 
+import argparse
 import json
 import logging
 import multiprocessing
 import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 import h5py
 import numpy as np
-import tensorflow as tf
 from tqdm import tqdm
 import concurrent.futures
-import os
+import shutil
+
+from scalogram_store import beat_dataset, read_scalograms
+from dataset_store import get_store, iter_record_beats, record_beat_format
+from work_scheduler import pool_size, timed_call, report_utilization
+from tfrecord_layout import (
+    LAYOUT_FILENAME, INDEX_FILENAME, STORAGE_DTYPES, ShardIndex, build_shards, compress_payload, encode_beats,
+    is_quantized, iter_tfrecord_frames, quantization_params, read_layout, scalogram_bounds, write_layout
+)
+from tfrecord_writer import TFRecordWriter, bytes_feature, encode_example, int64_feature
 
 # --- Configuration ---
-SEQUENCE_LEN = 3
+# Beats are stored once, BATCH_SIZE_PER_CHUNK consecutive beats per example;
+# DataLoader.create_dataset windows them into sequences of any length at load time.
 BATCH_SIZE_PER_CHUNK = 256
 INPUT_H5_DIR = Path("preprocessed_data_h5_raw")
 OUTPUT_TFRECORD_DIR = Path("tfrecord_data_batched")
+# Examples are packed into shards of about this size, independent of record
+# boundaries; tfrecord_index.npz maps every record to its byte offsets.
+SHARD_SIZE_BYTES = 128 * 2**20
+STAGING_DIRNAME = "_staging"
+# Per-example payload compression: None, 'ZLIB' or 'GZIP'. Detected by the
+# loader from tfrecord_layout.json. See benchmark_tfrecord_compression.py.
+TFRECORD_COMPRESSION = None
+TFRECORD_COMPRESSION_LEVEL = 6
+# Storage dtype of the beats: 'float32', 'float16', or 'uint16'/'uint8' quantized
+# with a scale and offset per record ('record') or per wavelet scale ('scale').
+# DataLoader dequantizes while normalizing; see quantization_report.py.
+TFRECORD_STORAGE_DTYPE = 'float32'
+TFRECORD_QUANTIZATION = 'scale'
 METADATA_FILENAME = "metadata.json"
+PREPROCESS_MANIFEST_FILENAME = "manifest.json" # Content hashes written by preprocess_data.py
+# Per-record provenance of the current shards (source signature, beat count)
+# plus the conversion settings, used to rebuild only outdated records.
+TFRECORD_MANIFEST_FILENAME = "tfrecord_manifest.json"
+TFRECORD_FORMAT_VERSION = 2 # Bumped when the example format changes
 
 # --- Setup Logging ---
 logger = logging.getLogger(__name__)
 
-# --- TFRecord Helper Functions (Corrected) ---
-def _bytes_feature(value):
+# --- Core Logic ---
+def load_record_labels(rec_name: str, record_metadata: Optional[List[Dict[str, Any]]], input_h5_dir: Path) -> np.ndarray:
     """
-    Returns a bytes_list from a string / byte.
-    This version is simplified to avoid calling tf.constant in child processes.
+    Returns the int32 beat labels of one record in beat order, from the
+    consolidated store when it holds the record and from the metadata entries otherwise.
     """
-    # The input 'value' is already in bytes format from numpy's .tobytes()
-    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+    store = get_store(input_h5_dir)
+    if store is not None and rec_name in store:
+        return store.label[store.record_slice(rec_name)].astype(np.int32)
+    record_metadata.sort(key=lambda x: x['beat_index'])
+    return np.array([item['label'] for item in record_metadata], dtype=np.int32)
 
-def _int64_feature(value):
-    """Returns an int64_list from a bool / enum / int / uint."""
-    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
 
-# --- Core Logic ---
-def create_sequences_from_record(scalograms: np.ndarray, labels: np.ndarray, seq_len: int):
+def load_record_arrays(rec_name: str, record_metadata: Optional[List[Dict[str, Any]]], input_h5_dir: Path):
     """
-    Efficiently creates overlapping sequences and their corresponding labels from
-    a full record's data.
+    Returns (beats, labels) for one record as they are written to the TFRecords:
+    scalograms, or raw beat windows shaped (n, 1, n_samples) for a raw-beat
+    file. Read from the consolidated store when it exists and from
+    {rec_name}.h5 plus the metadata entries otherwise.
     """
-    num_beats = scalograms.shape[0]
-    if num_beats < seq_len:
-        return np.array([]), np.array([])
-
-    sequences = np.array([scalograms[i : i + seq_len] for i in range(num_beats - seq_len + 1)])
-    sequence_labels = np.array([labels[i + seq_len - 1] for i in range(num_beats - seq_len + 1)])
-    
-    return sequences.astype(np.float32), sequence_labels.astype(np.int32)
+    labels = load_record_labels(rec_name, record_metadata, input_h5_dir)
+    store = get_store(input_h5_dir)
+    if store is not None and rec_name in store:
+        beats = store.read(store.record_region(rec_name))
+    else:
+        with h5py.File(input_h5_dir / f"{rec_name}.h5", 'r') as hf:
+            beats = read_scalograms(beat_dataset(hf))
+    return (beats[:, None] if beats.ndim == 2 else beats), labels
 
 
 def process_record_to_batched_tfrecord(
     rec_name: str,
-    record_metadata: List[Dict[str, Any]],
+    record_metadata: Optional[List[Dict[str, Any]]],
     input_h5_dir: Path,
-    output_tfrecord_dir: Path
+    output_tfrecord_dir: Path,
+    compression: Optional[str] = TFRECORD_COMPRESSION,
+    storage_dtype: str = TFRECORD_STORAGE_DTYPE,
+    quantization: str = TFRECORD_QUANTIZATION
 ):
     """
-    Worker function: Processes a single HDF5 record, generates all sequences,
-    and saves them in batched TFRecord format.
+    Worker function: Processes a single HDF5 record and saves its beats in
+    batched TFRecord format, each beat exactly once and in beat order.
+    Beats are stored as storage_dtype (quantized for integer dtypes, with the
+    record's scale and offset in every example) and the beats_raw payload of each
+    example is compressed when compression is set. Raw-beat inputs are written
+    as beats of height 1 holding the raw window.
+    Returns a summary dict with the record's beat count and scalogram shape.
     """
-    # --- CRITICAL FIX: Hide GPUs from this specific worker process ---
-    # This ensures TensorFlow operations inside this function do not attempt
-    # to initialize CUDA, which is the source of the error.
-    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
-
-    h5_path = input_h5_dir / f"{rec_name}.h5"
     output_path = output_tfrecord_dir / f"{rec_name}.tfrecord"
+    tmp_path = output_tfrecord_dir / f"{rec_name}.tfrecord.tmp"
 
     try:
-        with h5py.File(h5_path, 'r') as hf:
-            scalograms = hf['scalograms'][:]
-        
-        record_metadata.sort(key=lambda x: x['beat_index'])
-        labels = np.array([item['label'] for item in record_metadata])
-
-        sequences, sequence_labels = create_sequences_from_record(scalograms, labels, SEQUENCE_LEN)
-
-        if sequences.shape[0] == 0:
-            return f"Record {rec_name} had insufficient beats. Skipped."
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported storage dtype '{storage_dtype}'. Choose one of {STORAGE_DTYPES}.")
+        labels = load_record_labels(rec_name, record_metadata, input_h5_dir)
+        data_config = {"preprocessed_dir": input_h5_dir}
+        # The stored beats are streamed one example (BATCH_SIZE_PER_CHUNK beats) at a
+        # time, so worker memory does not grow with the record length. Quantized
+        # dtypes need the record's value range first, which costs one extra pass.
+        quant_scale = quant_offset = None
+        if is_quantized(storage_dtype):
+            low, high = scalogram_bounds(iter_record_beats(rec_name, data_config, BATCH_SIZE_PER_CHUNK))
+            if low is not None:
+                quant_scale, quant_offset = quantization_params(low, high, storage_dtype, quantization)
 
-        _, _, height, width = sequences.shape
-        
-        with tf.io.TFRecordWriter(str(output_path)) as writer:
-            for i in range(0, sequences.shape[0], BATCH_SIZE_PER_CHUNK):
-                seq_chunk = sequences[i : i + BATCH_SIZE_PER_CHUNK]
-                label_chunk = sequence_labels[i : i + BATCH_SIZE_PER_CHUNK]
-                num_in_chunk = seq_chunk.shape[0]
+        num_beats, height, width = 0, None, None
+        with TFRecordWriter(tmp_path) as writer:
+            for scalogram_chunk in iter_record_beats(rec_name, data_config, BATCH_SIZE_PER_CHUNK):
+                num_in_chunk, height, width = scalogram_chunk.shape
+                beat_chunk = encode_beats(scalogram_chunk, storage_dtype, quant_scale, quant_offset)
+                label_chunk = labels[num_beats : num_beats + num_in_chunk]
+                if label_chunk.shape[0] != num_in_chunk:
+                    raise ValueError(f"{rec_name} has more scalograms than labelled beats ({len(labels)}).")
+                num_beats += num_in_chunk
 
                 feature = {
-                    'num_in_batch': _int64_feature(num_in_chunk),
-                    'sequence_len': _int64_feature(SEQUENCE_LEN),
-                    'height': _int64_feature(height),
-                    'width': _int64_feature(width),
-                    'sequences_raw': _bytes_feature(seq_chunk.tobytes()),
-                    'labels_raw': _bytes_feature(label_chunk.tobytes())
+                    'num_in_batch': int64_feature(num_in_chunk),
+                    'height': int64_feature(height),
+                    'width': int64_feature(width),
+                    'beats_raw': bytes_feature(compress_payload(beat_chunk.tobytes(), compression, TFRECORD_COMPRESSION_LEVEL)),
+                    'labels_raw': bytes_feature(label_chunk.tobytes())
                 }
-                example = tf.train.Example(features=tf.train.Features(feature=feature))
-                writer.write(example.SerializeToString())
-        
-        return f"Successfully processed record {rec_name}."
+                if quant_scale is not None:
+                    feature['quant_scale'] = bytes_feature(quant_scale.tobytes())
+                    feature['quant_offset'] = bytes_feature(quant_offset.tobytes())
+                writer.write(encode_example(feature))
+
+        if num_beats == 0:
+            tmp_path.unlink()
+            return {"record": rec_name, "num_beats": 0}
+        if num_beats != len(labels):
+            raise ValueError(f"{rec_name} has {num_beats} scalograms but {len(labels)} labelled beats.")
+        tmp_path.replace(output_path)
+
+        return {"record": rec_name, "num_beats": num_beats, "height": height, "width": width}
 
     except Exception as e:
         # Log the full traceback for better debugging
         logger.error(f"Worker failed for record {rec_name}: {e}", exc_info=True)
-        return f"Failed to process record {rec_name}."
-
-def main():
-    """Main execution function for the parallel batched TFRecord conversion."""
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-8s] %(message)s')
-    logger.info("--- Starting Optimized Preprocessing: HDF5 to Batched TFRecords (Corrected) ---")
-    start_time = time.time()
+        return {"record": rec_name, "num_beats": 0, "failed": True}
 
-    OUTPUT_TFRECORD_DIR.mkdir(parents=True, exist_ok=True)
+def list_input_records(input_h5_dir: Path) -> Optional[Tuple[List[str], Dict[str, int], Dict[str, List[Dict[str, Any]]]]]:
+    """
+    Returns (record names, beats per record, metadata entries per record) of a
+    preprocessed directory, or None when it has no metadata. The metadata map is
+    empty when the consolidated store supplies the labels.
+    """
+    metadata_map = {}
+    store = get_store(input_h5_dir)
+    if store is not None:
+        # The consolidated store carries its own label index; no JSON parsing needed.
+        logger.info(f"Reading beats from the consolidated store {store.path}.")
+        record_names = sorted(store.record_names)
+        record_costs = {rec: int(np.diff(store.record_offsets)[i]) for i, rec in enumerate(store.record_names)}
+    else:
+        metadata_path = input_h5_dir / METADATA_FILENAME
+        try:
+            with open(metadata_path, 'r') as f:
+                all_metadata = json.load(f)
+        except FileNotFoundError:
+            logger.error(f"FATAL: Metadata file not found at {metadata_path}. Please run preprocess_data.py first. Exiting.")
+            return None
 
-    metadata_path = INPUT_H5_DIR / METADATA_FILENAME
-    try:
-        with open(metadata_path, 'r') as f:
-            all_metadata = json.load(f)
-    except FileNotFoundError:
-        logger.error(f"FATAL: Metadata file not found at {metadata_path}. Please run preprocess_data.py first. Exiting.")
-        return
+        for item in all_metadata:
+            rec_name = item['record_name']
+            if rec_name not in metadata_map:
+                metadata_map[rec_name] = []
+            metadata_map[rec_name].append(item)
+        record_names = sorted(metadata_map.keys())
+        record_costs = {rec: len(items) for rec, items in metadata_map.items()}
 
-    metadata_map = {}
-    for item in all_metadata:
-        rec_name = item['record_name']
-        if rec_name not in metadata_map:
-            metadata_map[rec_name] = []
-        metadata_map[rec_name].append(item)
-    
-    record_names = sorted(metadata_map.keys())
     if not record_names:
         logger.error(f"No records found in metadata. Cannot proceed.")
-        return
+        return None
+    return record_names, record_costs, metadata_map
+
+# --- Freshness Manifest ---
+
+def conversion_settings(
+    compression: Optional[str],
+    storage_dtype: str = TFRECORD_STORAGE_DTYPE,
+    quantization: str = TFRECORD_QUANTIZATION
+) -> Dict[str, Any]:
+    """Settings that change every output record; a change invalidates the whole manifest."""
+    return {"format_version": TFRECORD_FORMAT_VERSION, "beats_per_example": BATCH_SIZE_PER_CHUNK,
+            "compression": compression, "storage_dtype": storage_dtype,
+            "quantization": quantization if is_quantized(storage_dtype) else None}
+
+def source_signatures(record_names: List[str], input_h5_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Provenance of each record's HDF5 input. The content hash from the
+    preprocessing manifest is used when it lists the record (it covers the raw
+    signals and every setting that shapes the scalograms); otherwise the size and
+    mtime of the file the beats are read from.
+    """
+    try:
+        with open(input_h5_dir / PREPROCESS_MANIFEST_FILENAME, 'r') as f:
+            preprocess_records = json.load(f).get("records", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        preprocess_records = {}
+    store = get_store(input_h5_dir)
+
+    signatures = {}
+    for rec_name in record_names:
+        content_hash = preprocess_records.get(rec_name, {}).get("hash")
+        if content_hash:
+            signatures[rec_name] = {"hash": content_hash}
+            continue
+        source = store.path if store is not None and rec_name in store else input_h5_dir / f"{rec_name}.h5"
+        try:
+            stat = source.stat()
+            signatures[rec_name] = {"file": source.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        except FileNotFoundError:
+            signatures[rec_name] = {"file": source.name}
+    return signatures
+
+def load_tfrecord_manifest(output_tfrecord_dir: Path) -> Dict[str, Any]:
+    """Loads the provenance manifest of the previous conversion, or an empty one."""
+    try:
+        with open(output_tfrecord_dir / TFRECORD_MANIFEST_FILENAME, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"settings": None, "records": {}}
+
+def load_shard_index(output_tfrecord_dir: Path) -> Optional[ShardIndex]:
+    """Returns the offset index of the current shards, or None if the index or any shard is missing."""
+    try:
+        index = ShardIndex(output_tfrecord_dir)
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        return None
+    if not all(Path(path).exists() for path in index.shard_paths):
+        return None
+    return index
+
+def find_stale_records(
+    record_names: List[str],
+    signatures: Dict[str, Dict[str, Any]],
+    settings: Dict[str, Any],
+    manifest: Dict[str, Any],
+    index: Optional[ShardIndex]
+) -> List[str]:
+    """Returns the records whose source or conversion settings changed, or whose examples are missing."""
+    if manifest.get("settings") != settings:
+        return list(record_names)
+    stale = []
+    for rec_name in record_names:
+        entry = manifest["records"].get(rec_name)
+        if entry is None or entry.get("source") != signatures[rec_name]:
+            stale.append(rec_name)
+        elif entry.get("num_beats", 0) > 0 and (index is None or rec_name not in index):
+            stale.append(rec_name)
+    return stale
+
+def find_outdated_records(
+    input_h5_dir: Path = INPUT_H5_DIR,
+    output_tfrecord_dir: Path = OUTPUT_TFRECORD_DIR,
+    compression: Optional[str] = TFRECORD_COMPRESSION,
+    storage_dtype: str = TFRECORD_STORAGE_DTYPE,
+    quantization: str = TFRECORD_QUANTIZATION
+) -> Optional[List[str]]:
+    """
+    Returns the records whose TFRecord output is missing or out of date (an empty
+    list when the directory is current), or None when there is no input metadata.
+    """
+    input_h5_dir, output_tfrecord_dir = Path(input_h5_dir), Path(output_tfrecord_dir)
+    listing = list_input_records(input_h5_dir)
+    if listing is None:
+        return None
+    record_names = listing[0]
+    manifest = load_tfrecord_manifest(output_tfrecord_dir)
+    stale = find_stale_records(record_names, source_signatures(record_names, input_h5_dir),
+                               conversion_settings(compression, storage_dtype, quantization), manifest,
+                               load_shard_index(output_tfrecord_dir))
+    removed = sorted(set(manifest["records"]) - set(record_names))
+    return stale + removed
+
+def _write_manifest(output_tfrecord_dir: Path, manifest: Dict[str, Any]) -> None:
+    path = output_tfrecord_dir / TFRECORD_MANIFEST_FILENAME
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    tmp_path.replace(path)
+
+# --- Conversion ---
+
+def convert_records(
+    input_h5_dir: Path = INPUT_H5_DIR,
+    output_tfrecord_dir: Path = OUTPUT_TFRECORD_DIR,
+    compression: Optional[str] = TFRECORD_COMPRESSION,
+    shard_size_bytes: int = SHARD_SIZE_BYTES,
+    force: bool = False,
+    storage_dtype: str = TFRECORD_STORAGE_DTYPE,
+    quantization: str = TFRECORD_QUANTIZATION
+) -> Optional[Dict[str, Any]]:
+    """
+    Brings the sharded beat-level TFRecords in output_tfrecord_dir up to date with
+    input_h5_dir. Only records whose provenance changed (all of them when
+    force=True) are converted again; the examples of the others are copied from
+    the current shards. Returns a summary with the record, beat and shard counts,
+    or None when there is no metadata to convert.
+    """
+    input_h5_dir, output_tfrecord_dir = Path(input_h5_dir), Path(output_tfrecord_dir)
+    listing = list_input_records(input_h5_dir)
+    if listing is None:
+        return None
+    record_names, record_costs, metadata_map = listing
     logger.info(f"Found metadata for {len(record_names)} records.")
 
-    num_processes = max(1, multiprocessing.cpu_count() - 1)
-    logger.info(f"Initializing process pool with {num_processes} workers.")
-    
-    # Using ProcessPoolExecutor which is generally more robust
-    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
-        futures = [
-            executor.submit(
-                process_record_to_batched_tfrecord,
-                rec,
-                metadata_map[rec],
-                INPUT_H5_DIR,
-                OUTPUT_TFRECORD_DIR
-            )
-            for rec in record_names
-        ]
-        
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(record_names), desc="Converting to Batched TFRecords"):
-            pass
+    output_tfrecord_dir.mkdir(parents=True, exist_ok=True)
+    settings = conversion_settings(compression, storage_dtype, quantization)
+    signatures = source_signatures(record_names, input_h5_dir)
+    manifest = {"settings": None, "records": {}} if force else load_tfrecord_manifest(output_tfrecord_dir)
+    index = None if force else load_shard_index(output_tfrecord_dir)
+    stale = find_stale_records(record_names, signatures, settings, manifest, index)
+    removed = set(manifest["records"]) - set(record_names)
+    if not stale and not removed:
+        logger.info(f"All {len(record_names)} records are up to date in '{output_tfrecord_dir}'. Nothing to do.")
+        beat_counts = [manifest["records"][rec].get("num_beats", 0) for rec in record_names]
+        return {"records": sum(1 for n in beat_counts if n > 0), "num_beats": sum(beat_counts), "shards": len(index.shard_names) if index else 0,
+                "converted": 0, "reused": len(record_names), "failed": []}
+    logger.info(f"{len(stale)} of {len(record_names)} records need conversion; "
+                f"{len(record_names) - len(stale)} are reused from the current shards.")
+
+    # Workers write one file per stale record into a staging directory (under a
+    # temporary name, renamed when complete); the parent then packs them together
+    # with the reused records into fixed-size shards.
+    staging_dir = output_tfrecord_dir / STAGING_DIRNAME
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staging_dir.mkdir(parents=True)
+
+    results = {}
+    if stale:
+        # Pool size follows the container's CPU quota; records are submitted largest
+        # (most beats) first so the longest conversions do not start last.
+        num_processes = pool_size(max_tasks=len(stale))
+        logger.info(f"Initializing process pool with {num_processes} workers.")
+        ordered = sorted(stale, key=lambda rec: record_costs.get(rec, 0), reverse=True)
+
+        # Using ProcessPoolExecutor which is generally more robust
+        pool_start = time.time()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+            futures = [
+                executor.submit(
+                    timed_call,
+                    process_record_to_batched_tfrecord,
+                    rec,
+                    metadata_map.get(rec),
+                    input_h5_dir,
+                    staging_dir,
+                    compression,
+                    storage_dtype,
+                    quantization
+                )
+                for rec in ordered
+            ]
+
+            timed_results = []
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(ordered), desc="Converting to Batched TFRecords"):
+                timed_results.append(future.result())
+        report_utilization(timed_results, time.time() - pool_start, logger)
+        results = {item["result"]["record"]: item["result"] for item in timed_results}
+
+    # Assemble the new record set in record order: fresh conversions from staging,
+    # everything else straight from the current shards.
+    new_records, record_frames = {}, []
+    height = width = None
+    for rec_name in record_names:
+        if rec_name in results:
+            result = results[rec_name]
+            if result.get("failed"):
+                continue
+            new_records[rec_name] = {"source": signatures[rec_name], "num_beats": result["num_beats"]}
+            if result["num_beats"] > 0:
+                record_frames.append((rec_name, iter_tfrecord_frames(staging_dir / f"{rec_name}.tfrecord"), result["num_beats"]))
+                height, width = result["height"], result["width"]
+        else:
+            entry = manifest["records"][rec_name]
+            new_records[rec_name] = entry
+            if entry["num_beats"] > 0:
+                record_frames.append((rec_name, index.iter_record_frames(rec_name), entry["num_beats"]))
+    if height is None and record_frames:
+        layout = read_layout(output_tfrecord_dir)
+        height, width = layout["height"], layout["width"]
+
+    # The manifest is removed before any shard is replaced and written last, so an
+    # interrupted run is redone from the HDF5 files instead of trusting mixed shards.
+    (output_tfrecord_dir / TFRECORD_MANIFEST_FILENAME).unlink(missing_ok=True)
+    shard_names = []
+    if record_frames:
+        shard_names = build_shards(record_frames, output_tfrecord_dir, shard_size_bytes, BATCH_SIZE_PER_CHUNK)
+        # The layout sidecar tells DataLoader to window the beats into sequences at
+        # load time and whether the beat payloads need decompressing.
+        # All records share one representation and scale set (both are part of the
+        # preprocessing fingerprint).
+        beat_format = record_beat_format(input_h5_dir, record_frames[0][0])
+        write_layout(output_tfrecord_dir, height, width,
+                     {rec: entry["num_beats"] for rec, entry in new_records.items() if entry["num_beats"] > 0},
+                     shard_names, compression, storage_dtype, settings["quantization"],
+                     beat_format["wavelet_scales"], beat_format["representation"], beat_format["wavelet"])
+        logger.info(f"Packed {len(record_frames)} records into {len(shard_names)} shards of ~{shard_size_bytes / 2**20:.0f} MB"
+                    f" (storage: {storage_dtype}, compression: {compression or 'none'}).")
+    else:
+        for stale_file in (output_tfrecord_dir / INDEX_FILENAME, output_tfrecord_dir / LAYOUT_FILENAME):
+            stale_file.unlink(missing_ok=True)
+    # Remove surplus shards of the previous build and legacy per-record files.
+    for old_file in output_tfrecord_dir.glob("*.tfrecord"):
+        if old_file.name not in shard_names:
+            old_file.unlink()
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    _write_manifest(output_tfrecord_dir, {"settings": settings, "records": new_records})
+
+    failed = sorted(rec for rec, result in results.items() if result.get("failed"))
+    if failed:
+        logger.error(f"{len(failed)} record(s) could not be converted: {', '.join(failed)}")
+    return {"records": len(record_frames), "num_beats": sum(entry["num_beats"] for entry in new_records.values()),
+            "shards": len(shard_names), "converted": len(results) - len(failed),
+            "reused": len(record_names) - len(results), "failed": failed}
+
+
+def main(force: bool = False):
+    """Main execution function for the parallel batched TFRecord conversion."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-8s] %(message)s')
+    logger.info("--- Starting Optimized Preprocessing: HDF5 to Batched TFRecords (Corrected) ---")
+    start_time = time.time()
+
+    if convert_records(INPUT_H5_DIR, OUTPUT_TFRECORD_DIR, TFRECORD_COMPRESSION, SHARD_SIZE_BYTES, force,
+                       TFRECORD_STORAGE_DTYPE, TFRECORD_QUANTIZATION) is None:
+        return
 
     end_time = time.time()
     logger.info(f"--- Preprocessing Complete in {end_time - start_time:.2f} seconds ---")
@@ -174,4 +460,6 @@ if __name__ == "__main__":
     except RuntimeError:
         # The start method can only be set once.
         pass
-    main()
+    parser = argparse.ArgumentParser(description="Convert preprocessed HDF5 records into sharded batched TFRecords.")
+    parser.add_argument('--force', action='store_true', help='Ignore tfrecord_manifest.json and convert every record.')
+    main(force=parser.parse_args().force)
@@ -0,0 +1,157 @@
+# dataset_cache.py (Fingerprinted tf.data File Caches)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Bookkeeping for the optional on-disk cache of parsed beat chunks
+# (DataLoader.create_dataset with data config "dataset_cache_dir"). The cache sits
+# in front of windowing and normalization, so every beat is stored once rather
+# than sequence_len times, and folds with different statistics share it. A cache
+# is keyed by a fingerprint of everything that determines its content: the
+# ordered record list, the data config and the files of the TFRecord directory
+# (names, sizes, mtimes). Rewriting the TFRecords or changing a setting therefore
+# selects a different cache instead of serving stale data.
+#
+# A cache has one part per loader work item (record file or read unit). tf.data
+# writes each part as <key>_<part>.index plus <key>_<part>.data-* files and only
+# finalizes it after the part was read completely. The directory is kept under a
+# disk quota by evicting the least recently used complete caches; each use
+# touches a small <key>.json marker that records the cache's last use, its
+# number of parts and its description.
+
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 2 # Bumped when the cached element structure changes
+DEFAULT_CACHE_QUOTA_GB = 50
+# Data config keys that do not affect the cached beat chunks: the cache settings
+# and the options of the stages after the cache.
+CACHE_CONFIG_KEYS = ("dataset_cache_dir", "dataset_cache_quota_gb", "batch_native_pipeline", "shuffle_buffer_chunks")
+# Unfinished caches (e.g. left by a killed run) become evictable after this long.
+STALE_INCOMPLETE_SECONDS = 24 * 3600
+
+
+def source_files_signature(tfrecord_dir: Path) -> List[List[Any]]:
+    """Name, size and mtime of every file in a TFRecord directory (shards, sidecars, manifest)."""
+    entries = []
+    for path in sorted(Path(tfrecord_dir).glob("*")):
+        if path.is_file():
+            stat = path.stat()
+            entries.append([path.name, stat.st_size, stat.st_mtime_ns])
+    return entries
+
+
+def dataset_fingerprint(record_names: Sequence[str], data_config: Dict[str, Any], tfrecord_dir: Path) -> str:
+    """
+    Returns the cache key of a dataset: a hash of the records (in order), the data
+    config and the source files. The normalization statistics are applied after
+    the cache and are not part of the key.
+    """
+    payload = {
+        "version": CACHE_FORMAT_VERSION,
+        "records": list(record_names),
+        "config": {k: v for k, v in data_config.items() if k not in CACHE_CONFIG_KEYS},
+        "source": source_files_signature(tfrecord_dir),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _marker_parts(marker_path: Path) -> int:
+    """Returns the number of parts recorded in a cache marker (1 when it is missing or unreadable)."""
+    try:
+        with open(marker_path, 'r') as f:
+            return int(json.load(f).get("parts", 1))
+    except (OSError, ValueError, TypeError, AttributeError):
+        return 1
+
+
+def cache_entries(cache_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Lists the caches in cache_dir as {key: {"bytes", "last_used", "complete",
+    "files", "finished_parts"}}. A cache is complete once every part recorded in
+    its marker has been finalized. last_used is the newest mtime (ns) of the
+    key's files, normally its marker.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    for path in Path(cache_dir).glob("*"):
+        if not path.is_file():
+            continue
+        key = path.name.split('.', 1)[0].split('_', 1)[0]
+        entry = entries.setdefault(key, {"bytes": 0, "last_used": 0, "complete": False, "files": [],
+                                         "finished_parts": set()})
+        stat = path.stat()
+        entry["files"].append(path)
+        entry["bytes"] += stat.st_size
+        entry["last_used"] = max(entry["last_used"], stat.st_mtime_ns)
+        if path.suffix == ".index":
+            entry["finished_parts"].add(path.name[:-len(".index")])
+    for key, entry in entries.items():
+        entry["complete"] = len(entry["finished_parts"]) >= _marker_parts(Path(cache_dir) / f"{key}.json")
+    return entries
+
+
+def evict_caches(cache_dir: Path, quota_bytes: int, reserve_bytes: int = 0, keep: Sequence[str] = ()) -> List[str]:
+    """
+    Deletes the least recently used caches until the directory plus reserve_bytes
+    fits in quota_bytes. Caches listed in keep, and unfinished caches younger than
+    STALE_INCOMPLETE_SECONDS (possibly still being written), are never evicted.
+    Returns the evicted keys.
+    """
+    entries = cache_entries(cache_dir)
+    total = sum(entry["bytes"] for entry in entries.values())
+    stale_before = time.time_ns() - STALE_INCOMPLETE_SECONDS * 10**9
+    evicted = []
+    candidates = sorted((entry["last_used"], key) for key, entry in entries.items()
+                        if key not in keep and (entry["complete"] or entry["last_used"] < stale_before))
+    for _, key in candidates:
+        if total + reserve_bytes <= quota_bytes:
+            break
+        for path in entries[key]["files"]:
+            path.unlink(missing_ok=True)
+        total -= entries[key]["bytes"]
+        evicted.append(key)
+    if evicted:
+        logger.info(f"Evicted {len(evicted)} dataset cache(s) from {cache_dir} to stay within "
+                    f"{quota_bytes / 2**20:.0f} MB.")
+    return evicted
+
+
+def prepare_cache(
+    cache_dir: Path,
+    key: str,
+    expected_bytes: Optional[int],
+    quota_bytes: int,
+    description: Optional[Dict[str, Any]] = None,
+    parts: int = 1
+) -> Optional[str]:
+    """
+    Makes room for (or reuses) the cache of one dataset with the given number of
+    parts and returns the filename prefix; part i is passed to
+    tf.data.Dataset.cache as "<prefix>_<i>". Returns None when the dataset would
+    not fit in the quota on its own. Leftovers of unfinished parts are removed
+    first, so a crashed run cannot block the rebuild; finished parts are kept.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entry = cache_entries(cache_dir).get(key)
+    complete = entry is not None and entry["complete"]
+    if not complete:
+        if expected_bytes is not None and expected_bytes > quota_bytes:
+            logger.warning(f"Dataset of ~{expected_bytes / 2**20:.0f} MB exceeds the cache quota of "
+                           f"{quota_bytes / 2**20:.0f} MB; it will not be cached.")
+            return None
+        for path in (entry["files"] if entry else []):
+            if path.name.split('.', 1)[0] not in entry["finished_parts"] and path.suffix != ".json":
+                path.unlink(missing_ok=True)
+        evict_caches(cache_dir, quota_bytes, expected_bytes or 0, keep=(key,))
+
+    marker = dict(description or {}, key=key, last_used=time.time(), expected_bytes=expected_bytes, parts=parts)
+    with open(cache_dir / f"{key}.json", 'w') as f:
+        json.dump(marker, f, indent=4)
+    logger.info(f"{'Reusing' if complete else 'Building'} dataset cache {cache_dir / key}.")
+    return str(cache_dir / key)
@@ -0,0 +1,521 @@
+# dataset_store.py (Consolidated Dataset Store)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: A single HDF5 file holding the scalograms of every beat of every
+# record, plus columnar index arrays (record id, beat index, label, R-peak
+# sample) and a per-record offset table. Each record's beats are one contiguous
+# region of the scalogram dataset (record_starts), so any record subset maps to
+# slices or a fancy index and consumers no longer need to reopen one file per
+# record or parse metadata.json.
+# The store is updated incrementally: re-processed records are rewritten in
+# place (or appended when their beat count changed) and only the small index
+# arrays are rewritten as a whole. Once their beats are in the store, the
+# per-record HDF5 files written by preprocessing are deleted, so dataset.h5 is
+# the only copy of the data.
+# The same index columns are also written to a small beat_index.npz so label
+# lookups never have to touch HDF5 or JSON.
+# Stores written in raw-beat mode hold the beat windows instead of scalograms;
+# iter_record_scalograms then computes the scalograms while reading.
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import h5py
+import numpy as np
+
+from scalogram_store import (
+    RAW_REPRESENTATION, beat_dataset, create_scalogram_dataset, raw_beat_scalograms, read_scalograms,
+    resolve_scale_rows, stored_representation, stored_scales, stored_wavelet
+)
+
+logger = logging.getLogger(__name__)
+
+CONSOLIDATED_FILENAME = "dataset.h5"
+BEAT_INDEX_FILENAME = "beat_index.npz"
+INDEX_COLUMNS = ("record_id", "beat_index", "label", "sample")
+LAYOUT_ATTR = "layout"
+# Share of the scalogram rows that may belong to no record (left behind by
+# records that were removed or appended anew) before the store is compacted.
+MAX_STALE_FRACTION = 0.25
+
+
+# Per-record beat arrays in beat order: {record_name: (labels, samples)}. This is
+# how preprocess_data.py holds the index in memory; beat_index is implicit.
+RecordBeats = Dict[str, Tuple[np.ndarray, np.ndarray]]
+
+
+def metadata_to_record_beats(metadata: List[Dict[str, Any]]) -> RecordBeats:
+    """Converts a list of per-beat metadata dicts (metadata.json) into per-record beat arrays."""
+    by_record: Dict[str, List[Dict[str, Any]]] = {}
+    for item in metadata:
+        by_record.setdefault(item['record_name'], []).append(item)
+    record_beats = {}
+    for rec_name, beats in by_record.items():
+        beats.sort(key=lambda x: x['beat_index'])
+        record_beats[rec_name] = (
+            np.array([b['label'] for b in beats], dtype=np.int8),
+            np.array([b.get('sample', -1) for b in beats], dtype=np.int64),
+        )
+    return record_beats
+
+
+def record_beats_to_columns(record_beats: RecordBeats) -> Tuple[List[str], np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Converts per-record beat arrays into columnar form: sorted record names, a
+    per-record offset table and one array per index column, all ordered by
+    (record_name, beat_index).
+    """
+    record_names = sorted(record_beats)
+    counts = np.array([len(record_beats[name][0]) for name in record_names], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    num_beats = int(offsets[-1])
+
+    columns = {
+        "record_id": np.empty(num_beats, dtype=np.int32),
+        "beat_index": np.empty(num_beats, dtype=np.int32),
+        "label": np.empty(num_beats, dtype=np.int8),
+        "sample": np.empty(num_beats, dtype=np.int64),
+    }
+    for rec_id, rec_name in enumerate(record_names):
+        labels, samples = record_beats[rec_name]
+        start, stop = int(offsets[rec_id]), int(offsets[rec_id + 1])
+        columns["record_id"][start:stop] = rec_id
+        columns["beat_index"][start:stop] = np.arange(stop - start)
+        columns["label"][start:stop] = labels
+        columns["sample"][start:stop] = samples
+    return record_names, offsets, columns
+
+
+class BeatIndex:
+    """
+    Compact, memory-resident beat index loaded from beat_index.npz: per-record
+    offsets, the label column and per-record label counts.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with np.load(self.path, allow_pickle=False) as data:
+            self.record_names = [str(name) for name in data["record_names"]]
+            self.record_offsets = data["record_offsets"]
+            self.label = data["label"]
+            self.sample = data["sample"]
+            self.label_counts = data["label_counts"]
+        self._record_lookup = {name: i for i, name in enumerate(self.record_names)}
+
+    def __contains__(self, rec_name: str) -> bool:
+        return rec_name in self._record_lookup
+
+    def record_labels(self, rec_name: str) -> np.ndarray:
+        """Returns the beat labels of one record in beat order."""
+        i = self._record_lookup[rec_name]
+        return self.label[self.record_offsets[i]:self.record_offsets[i + 1]]
+
+    def record_samples(self, rec_name: str) -> np.ndarray:
+        """Returns the R-peak sample positions of one record in beat order."""
+        i = self._record_lookup[rec_name]
+        return self.sample[self.record_offsets[i]:self.record_offsets[i + 1]]
+
+    def record_beats(self) -> RecordBeats:
+        """Returns the whole index as per-record (labels, samples) arrays."""
+        return {name: (self.record_labels(name), self.record_samples(name)) for name in self.record_names}
+
+    def sequence_labels(self, record_names: Sequence[str], sequence_len: int) -> np.ndarray:
+        """Returns the label of every sequence (its last beat) generated from the given records, in order."""
+        slices = [self.record_labels(name)[sequence_len - 1:] for name in record_names if name in self._record_lookup]
+        if not slices:
+            return np.array([], dtype=np.int32)
+        return np.concatenate(slices).astype(np.int32)
+
+    def sequence_label_counts(self, record_names: Sequence[str], sequence_len: int) -> np.ndarray:
+        """
+        Returns per-class sequence counts from the precomputed beat-level counts:
+        a record's sequences carry all of its labels except its first sequence_len - 1.
+        """
+        counts = np.zeros(self.label_counts.shape[1], dtype=np.int64)
+        for name in record_names:
+            if name in self._record_lookup:
+                counts += self.label_counts[self._record_lookup[name]]
+                head = self.record_labels(name)[:sequence_len - 1]
+                counts -= np.bincount(head, minlength=counts.size)[:counts.size]
+        return counts
+
+
+def write_beat_index(output_dir: Path, record_beats: RecordBeats, num_classes: int) -> Path:
+    """Writes the compact beat_index.npz for the given per-record beat arrays (atomically)."""
+    record_names, offsets, columns = record_beats_to_columns(record_beats)
+    label_counts = np.stack([
+        np.bincount(columns["label"][offsets[i]:offsets[i + 1]], minlength=num_classes)
+        for i in range(len(record_names))
+    ]) if record_names else np.zeros((0, num_classes), dtype=np.int64)
+
+    final_path = Path(output_dir) / BEAT_INDEX_FILENAME
+    tmp_path = Path(output_dir) / f"{BEAT_INDEX_FILENAME}.tmp.npz"
+    np.savez(tmp_path, record_names=np.array(record_names, dtype=str), record_offsets=offsets,
+             label_counts=label_counts.astype(np.int64), **columns)
+    os.replace(tmp_path, final_path)
+    return final_path
+
+
+_beat_indexes: Dict[str, Any] = {}
+
+def get_beat_index(preprocessed_dir: Union[str, Path]) -> Optional[BeatIndex]:
+    """
+    Returns the BeatIndex of a preprocessed directory, or None if it has no
+    beat_index.npz. Cached per process and reloaded when the file changes.
+    """
+    path = Path(preprocessed_dir) / BEAT_INDEX_FILENAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = str(path.resolve())
+    cached = _beat_indexes.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, BeatIndex(path))
+        _beat_indexes[key] = cached
+    return cached[1]
+
+
+class ConsolidatedStore:
+    """
+    Read access to a consolidated dataset file. The index arrays are loaded into
+    memory on open (a few bytes per beat); scalograms are read lazily. In a
+    raw-beat store (representation == 'raw') the scalograms dataset holds the
+    beat windows.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = h5py.File(self.path, 'r')
+        self.scalograms = beat_dataset(self._file)
+        self.representation = stored_representation(self.scalograms)
+        self.wavelet = stored_wavelet(self.scalograms)
+        self.wavelet_scales = stored_scales(self.scalograms)
+        self.record_names = [name.decode('utf-8') if isinstance(name, bytes) else name
+                             for name in self._file["record_names"][:]]
+        self.record_offsets = self._file["record_offsets"][:]
+        # Stores written before incremental updates keep records in index order.
+        self.record_starts = (self._file["record_starts"][:] if "record_starts" in self._file
+                              else self.record_offsets[:-1])
+        self.record_id = self._file["record_id"][:]
+        self.beat_index = self._file["beat_index"][:]
+        self.label = self._file["label"][:]
+        self.sample = self._file["sample"][:]
+        self._record_lookup = {name: i for i, name in enumerate(self.record_names)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Closes the underlying HDF5 file."""
+        self._file.close()
+
+    def __contains__(self, rec_name: str) -> bool:
+        return rec_name in self._record_lookup
+
+    @property
+    def num_beats(self) -> int:
+        return int(self.record_offsets[-1])
+
+    def record_slice(self, rec_name: str) -> slice:
+        """Returns the slice of the index columns that belongs to one record."""
+        i = self._record_lookup[rec_name]
+        return slice(int(self.record_offsets[i]), int(self.record_offsets[i + 1]))
+
+    def record_region(self, rec_name: str) -> slice:
+        """Returns the slice of the scalogram dataset that holds one record's beats."""
+        i = self._record_lookup[rec_name]
+        start = int(self.record_starts[i])
+        return slice(start, start + int(self.record_offsets[i + 1] - self.record_offsets[i]))
+
+    def select(self, record_names: Sequence[str]) -> np.ndarray:
+        """Returns the scalogram rows of a record subset, in the order given. Unknown records are skipped."""
+        slices = [self.record_region(name) for name in record_names if name in self._record_lookup]
+        if not slices:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(s.start, s.stop, dtype=np.int64) for s in slices])
+
+    def read(self, selection: Union[slice, np.ndarray]) -> np.ndarray:
+        """Reads scalograms for a slice or a sorted array of rows as float32."""
+        return read_scalograms(self.scalograms, selection)
+
+    def iter_record_chunks(self, rec_name: str, chunk_size: int = 128, rows: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+        """Yields a record's scalograms in chunks of at most chunk_size beats, optionally only the given scale rows."""
+        record = self.record_region(rec_name)
+        for i in range(record.start, record.stop, chunk_size):
+            chunk = self.read(slice(i, min(i + chunk_size, record.stop)))
+            yield chunk if rows is None else chunk[:, rows]
+
+
+def stored_record_names(path: Union[str, Path]) -> List[str]:
+    """Returns the records held by a consolidated store, or [] when it is missing or unreadable."""
+    try:
+        with h5py.File(path, 'r') as hf:
+            return [name.decode('utf-8') if isinstance(name, bytes) else name for name in hf["record_names"][:]]
+    except (OSError, KeyError):
+        return []
+
+
+def _write_index_tables(out: h5py.File, record_names: List[str], offsets: np.ndarray, starts: np.ndarray,
+                        columns: Dict[str, np.ndarray]) -> None:
+    """Writes (or resizes and overwrites) the index columns, record names, offsets and region starts."""
+    tables = dict(columns, record_names=np.array(record_names, dtype=h5py.string_dtype()),
+                  record_offsets=offsets, record_starts=starts)
+    for name, values in tables.items():
+        if name in out:
+            out[name].resize(len(values), axis=0)
+            out[name][...] = values
+        else:
+            out.create_dataset(name, data=values, maxshape=(None,), chunks=True)
+
+
+def _copy_beats(source: h5py.Dataset, source_start: int, dataset: h5py.Dataset, start: int, count: int,
+                copy_chunk: int) -> None:
+    """Copies count beats from source (at source_start) into dataset (at start), copy_chunk beats at a time."""
+    if source.shape[1:] != dataset.shape[1:]:
+        raise ValueError(f"Beat shape {source.shape[1:]} does not match the store's {dataset.shape[1:]}.")
+    for i in range(0, count, copy_chunk):
+        j = min(i + copy_chunk, count)
+        dataset[start + i:start + j] = source[source_start + i:source_start + j].astype(dataset.dtype, copy=False)
+
+
+def _update_in_place(path: Path, output_dir: Path, record_names: List[str], offsets: np.ndarray,
+                     columns: Dict[str, np.ndarray], sources: List[str], layout_key: str, copy_chunk: int) -> bool:
+    """
+    Writes the source records into an existing store: in place when a record
+    keeps its beat count, appended otherwise. Returns False, without writing
+    anything, when the store must be rebuilt instead (other layout or beat
+    format, a pre-incremental store, or too many stale rows).
+    """
+    try:
+        out = h5py.File(path, 'r+')
+    except OSError:
+        return False
+    with out:
+        if out.attrs.get(LAYOUT_ATTR) != layout_key or "record_starts" not in out:
+            return False
+        dataset = beat_dataset(out)
+        if sources:
+            with h5py.File(output_dir / f"{sources[0]}.h5", 'r') as hf:
+                source = beat_dataset(hf)
+                if (source.name != dataset.name or source.shape[1:] != dataset.shape[1:]
+                        or stored_wavelet(source) != stored_wavelet(dataset)
+                        or not np.array_equal(stored_scales(source), stored_scales(dataset))):
+                    return False
+
+        old_names = [name.decode('utf-8') if isinstance(name, bytes) else name for name in out["record_names"][:]]
+        old_counts = np.diff(out["record_offsets"][:])
+        old_regions = {name: (int(start), int(count))
+                       for name, start, count in zip(old_names, out["record_starts"][:], old_counts)}
+        counts = np.diff(offsets)
+        source_set = set(sources)
+        starts = np.empty(len(record_names), dtype=np.int64)
+        end = dataset.shape[0]
+        for i, rec_name in enumerate(record_names):
+            old = old_regions.get(rec_name)
+            if old is not None and old[1] == counts[i]:
+                starts[i] = old[0]
+            elif rec_name in source_set:
+                starts[i], end = end, end + int(counts[i])
+            else:
+                raise ValueError(f"Record {rec_name} is neither in the consolidated store nor in a per-record file.")
+        if end - int(offsets[-1]) > MAX_STALE_FRACTION * end:
+            return False
+
+        dataset.resize(end, axis=0)
+        for rec_name in sources:
+            i = record_names.index(rec_name)
+            with h5py.File(output_dir / f"{rec_name}.h5", 'r') as hf:
+                _copy_beats(beat_dataset(hf), 0, dataset, int(starts[i]), int(counts[i]), copy_chunk)
+        _write_index_tables(out, record_names, offsets, starts, columns)
+    return True
+
+
+def _rebuild_store(path: Path, output_dir: Path, record_names: List[str], offsets: np.ndarray,
+                   columns: Dict[str, np.ndarray], sources: List[str], layout: Dict[str, Any],
+                   layout_key: str, copy_chunk: int) -> None:
+    """
+    Writes a compact store with the records in sorted order, taking each record
+    from its per-record file when there is one and from the existing store
+    otherwise. The file is written under a temporary name and renamed at the
+    end, so readers never see a partial store.
+    """
+    old_store = ConsolidatedStore(path) if path.exists() else None
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        with h5py.File(tmp_path, 'w') as out:
+            dataset = None
+            for rec_id, rec_name in enumerate(record_names):
+                start, count = int(offsets[rec_id]), int(offsets[rec_id + 1] - offsets[rec_id])
+                if rec_name in sources:
+                    hf = h5py.File(output_dir / f"{rec_name}.h5", 'r')
+                    source, source_start = beat_dataset(hf), 0
+                elif old_store is not None and rec_name in old_store:
+                    hf = None
+                    source, source_start = old_store.scalograms, old_store.record_region(rec_name).start
+                else:
+                    raise ValueError(f"Record {rec_name} is neither in the consolidated store nor in a per-record file.")
+                try:
+                    if dataset is None:
+                        dataset = create_scalogram_dataset(out, source.shape[1:], layout, scales=stored_scales(source),
+                                                           wavelet=stored_wavelet(source),
+                                                           name=source.name.rsplit('/', 1)[-1])
+                        dataset.resize(int(offsets[-1]), axis=0)
+                    _copy_beats(source, source_start, dataset, start, count, copy_chunk)
+                finally:
+                    if hf is not None:
+                        hf.close()
+
+            if dataset is None:
+                raise ValueError("No records to consolidate.")
+            _write_index_tables(out, record_names, offsets, offsets[:-1], columns)
+            out.attrs[LAYOUT_ATTR] = layout_key
+    finally:
+        if old_store is not None:
+            old_store.close()
+    os.replace(tmp_path, path)
+
+
+def build_consolidated_store(
+    output_dir: Path,
+    record_beats: RecordBeats,
+    layout: Dict[str, Any],
+    filename: str = CONSOLIDATED_FILENAME,
+    copy_chunk: int = 1024
+) -> Path:
+    """
+    Brings the consolidated store in output_dir up to date with record_beats.
+    Records that have a per-record HDF5 file in output_dir are (re)written from
+    it; every other record must already be in the store with the same beat count
+    and is left untouched. The store is rewritten from scratch only when it is
+    missing, was written with another layout or would hold too many stale rows.
+    The per-record files are deleted once their beats are in the store.
+    """
+    output_dir = Path(output_dir)
+    record_names, offsets, columns = record_beats_to_columns(record_beats)
+    if not record_names:
+        raise ValueError("No records to consolidate.")
+    sources = [name for name in record_names if (output_dir / f"{name}.h5").exists()]
+    layout_key = json.dumps(layout, sort_keys=True)
+
+    final_path = output_dir / filename
+    _close_cached_store(final_path)
+    if final_path.exists() and _update_in_place(final_path, output_dir, record_names, offsets, columns,
+                                                sources, layout_key, copy_chunk):
+        logger.info(f"Updated {len(sources)} of {len(record_names)} records in the consolidated store {final_path}.")
+    else:
+        _rebuild_store(final_path, output_dir, record_names, offsets, columns, sources, layout, layout_key, copy_chunk)
+        logger.info(f"Consolidated store with {int(offsets[-1])} beats from {len(record_names)} records "
+                    f"written to {final_path}.")
+    for rec_name in sources:
+        (output_dir / f"{rec_name}.h5").unlink()
+    return final_path
+
+
+_open_stores: Dict[str, Any] = {}
+
+def _close_cached_store(path: Path) -> None:
+    """Closes this process's cached handle on a store before the store is written."""
+    cached = _open_stores.pop(str(path.resolve()), None)
+    if cached is not None:
+        cached[1].close()
+
+
+def get_store(preprocessed_dir: Union[str, Path]) -> Optional[ConsolidatedStore]:
+    """
+    Returns an open ConsolidatedStore for a preprocessed directory, or None when
+    the directory has no consolidated file. The handle is cached per process and
+    reopened automatically when the file is rebuilt.
+    """
+    path = Path(preprocessed_dir) / CONSOLIDATED_FILENAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = str(path.resolve())
+    cached = _open_stores.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    store = ConsolidatedStore(path)
+    _open_stores[key] = (mtime, store)
+    return store
+
+
+def iter_record_beats(rec_name: str, data_config: Dict[str, Any], chunk_size: int = 128) -> Iterator[np.ndarray]:
+    """
+    Yields one record's beats as stored, in float32 chunks: scalograms
+    (n, n_scales, n_samples), or for a raw-beat file the beat windows as
+    (n, 1, n_samples). Reads the consolidated store when it holds the record and
+    the per-record HDF5 file otherwise.
+    Raises KeyError / FileNotFoundError when the record is not available.
+    """
+    store = get_store(data_config["preprocessed_dir"])
+    if store is not None and rec_name in store:
+        for chunk in store.iter_record_chunks(rec_name, chunk_size):
+            yield chunk[:, None] if chunk.ndim == 2 else chunk
+        return
+
+    with h5py.File(Path(data_config["preprocessed_dir"]) / f"{rec_name}.h5", 'r') as hf:
+        dataset = beat_dataset(hf)
+        num_samples = dataset.shape[0]
+        for i in range(0, num_samples, chunk_size):
+            chunk = read_scalograms(dataset, slice(i, min(i + chunk_size, num_samples)))
+            yield chunk[:, None] if chunk.ndim == 2 else chunk
+
+
+def iter_record_scalograms(rec_name: str, data_config: Dict[str, Any], chunk_size: int = 128) -> Iterator[np.ndarray]:
+    """
+    Yields one record's scalograms as float32 chunks, from the consolidated store
+    when it exists and from the per-record HDF5 file otherwise. When
+    data_config["wavelet_scales"] is a subset of the stored scales, only those
+    rows are returned. Raw-beat files are transformed chunk by chunk, at the
+    requested scales or else the recorded ones.
+    Raises KeyError / FileNotFoundError when the record is not available.
+    """
+    requested = data_config.get("wavelet_scales")
+    store = get_store(data_config["preprocessed_dir"])
+    if store is not None and rec_name in store:
+        if store.representation == RAW_REPRESENTATION:
+            for chunk in store.iter_record_chunks(rec_name, chunk_size):
+                yield raw_beat_scalograms(store.scalograms, chunk, requested)
+        else:
+            yield from store.iter_record_chunks(rec_name, chunk_size, resolve_scale_rows(store.wavelet_scales, requested))
+        return
+
+    with h5py.File(Path(data_config["preprocessed_dir"]) / f"{rec_name}.h5", 'r') as hf:
+        try:
+            dataset = beat_dataset(hf)
+        except KeyError:
+            return
+        raw = stored_representation(dataset) == RAW_REPRESENTATION
+        rows = None if raw else resolve_scale_rows(stored_scales(dataset), requested)
+        num_samples = dataset.shape[0]
+        # Process the HDF5 dataset in smaller chunks to conserve memory
+        for i in range(0, num_samples, chunk_size):
+            chunk = read_scalograms(dataset, slice(i, min(i + chunk_size, num_samples)))
+            if raw:
+                yield raw_beat_scalograms(dataset, chunk, requested)
+            else:
+                yield chunk if rows is None else chunk[:, rows]
+
+
+def record_beat_format(preprocessed_dir: Union[str, Path], rec_name: str) -> Dict[str, Any]:
+    """
+    Describes what a record's file stores per beat: the representation
+    ('scalogram' or 'raw'), the wavelet and the wavelet scales (None when not recorded).
+    """
+    store = get_store(preprocessed_dir)
+    if store is not None and rec_name in store:
+        representation, wavelet, scales = store.representation, store.wavelet, store.wavelet_scales
+    else:
+        with h5py.File(Path(preprocessed_dir) / f"{rec_name}.h5", 'r') as hf:
+            dataset = beat_dataset(hf)
+            representation, wavelet, scales = stored_representation(dataset), stored_wavelet(dataset), stored_scales(dataset)
+    return {"representation": representation, "wavelet": wavelet,
+            "wavelet_scales": None if scales is None else scales.tolist()}
@@ -1,6 +1,10 @@
+import argparse
+import logging
 import wfdb
 import os
 
+from dataset_fetch import fetch_from_mirror, write_manifest
+
 # نام دیتابیس در وب‌سایت PhysioNet
 db_name = 'mitdb'
 
@@ -8,19 +12,50 @@ db_name = 'mitdb'
 # این پوشه در کنار اسکریپت شما ساخته خواهد شد
 save_directory = 'mit-bih-arrhythmia-database-1.0.0'
 
-print(f"Starting download of the {db_name} database...")
-print(f"Data will be saved in the '{save_directory}' directory.")
+def download_from_physionet():
+    """Downloads the whole database from PhysioNet with wfdb (single blocking call, no resume)."""
+    print(f"Starting download of the {db_name} database...")
+    print(f"Data will be saved in the '{save_directory}' directory.")
+
+    try:
+        # این تابع کل دیتابیس را به همراه تمام فایل‌های لازم دانلود می‌کند
+        wfdb.dl_database(db_name, dl_dir=save_directory)
+        print("\nDatabase downloaded successfully!")
+
+        # بررسی محتویات پوشه برای اطمینان
+        files_in_dir = os.listdir(save_directory)
+        print(f"Total files and directories downloaded: {len(files_in_dir)}")
+        print("A few example files:", files_in_dir[:5])
+
+    except Exception as e:
+        print(f"\nAn error occurred during download: {e}")
+        print("Please check your internet connection and permissions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the MIT-BIH Arrhythmia Database.")
+    parser.add_argument('--mirror', type=str, default=None,
+                        help='Base URL (http://, https://, file://) or local directory of a mirror. '
+                             'Enables the parallel, resumable, checksum-verified fetch.')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='sha256sum-style manifest (default: <mirror>/SHA256SUMS.txt).')
+    parser.add_argument('--output-dir', type=str, default=save_directory, help='Target directory in mirror mode.')
+    parser.add_argument('--jobs', type=int, default=8, help='Parallel transfers in mirror mode.')
+    parser.add_argument('--retries', type=int, default=3, help='Attempts per file in mirror mode.')
+    parser.add_argument('--write-manifest', type=str, default=None, metavar='DIR',
+                        help='Write SHA256SUMS.txt for an existing directory (to seed a mirror) and exit.')
+    args = parser.parse_args()
 
-try:
-    # این تابع کل دیتابیس را به همراه تمام فایل‌های لازم دانلود می‌کند
-    wfdb.dl_database(db_name, dl_dir=save_directory)
-    print("\nDatabase downloaded successfully!")
+    if args.write_manifest:
+        print(f"Manifest written to {write_manifest(args.write_manifest)}")
+    elif args.mirror:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-8s] %(message)s')
+        stats = fetch_from_mirror(args.mirror, args.output_dir, args.manifest, args.jobs, args.retries)
+        if stats["failed"]:
+            raise SystemExit(1)
+    else:
+        download_from_physionet()
 
-    # بررسی محتویات پوشه برای اطمینان
-    files_in_dir = os.listdir(save_directory)
-    print(f"Total files and directories downloaded: {len(files_in_dir)}")
-    print("A few example files:", files_in_dir[:5])
 
-except Exception as e:
-    print(f"\nAn error occurred during download: {e}")
-    print("Please check your internet connection and permissions.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
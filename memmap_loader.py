@@ -0,0 +1,316 @@
+# memmap_loader.py (Memory-Mapped Random-Access Loader)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: An alternative to the TFRecord input pipeline with a true global
+# shuffle. The scalograms of a preprocessed directory are exported once into a
+# flat beats_memmap.npy (num_beats x n_scales x n_samples, float32, in the beat
+# order of beat_index.npz) and opened with np.memmap. A sequence is then just the
+# index of its first beat, so every epoch draws a fresh permutation of all
+# sequence indices of the selected records and each batch gathers its sequences
+# from the page cache. Memory is bounded by the batches in flight, not by a
+# shuffle buffer, and batches are no longer correlated by record.
+#
+# MemmapSequenceLoader is a keras.utils.PyDataset (Keras fetches batches in
+# `workers` threads); as_dataset() exposes the same batches as a tf.data.Dataset,
+# gathered by a thread pool, which is what DataLoader.create_dataset returns with
+# data config "memmap_loader". A JSON sidecar records the wavelet scales and the
+# source files (names, sizes, mtimes), so a stale export is rebuilt automatically.
+#
+# With data config "in_memory_dataset" the export is instead read into RAM once
+# per process and shared read-only by every create_dataset call, fold and
+# Hyperband trial. A fold is then only a mask over the records of the beat index
+# (record_mask / sequence_starts), and its normalization statistics are computed
+# from the same array (shared_scaler_stats), so nothing touches the disk after
+# warm-up (load_shared_dataset).
+
+import json
+import logging
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_store import BEAT_INDEX_FILENAME, BeatIndex, get_beat_index, iter_record_scalograms
+
+logger = logging.getLogger(__name__)
+
+MEMMAP_FILENAME = "beats_memmap.npy"
+MEMMAP_META_FILENAME = "beats_memmap.json"
+MEMMAP_FORMAT_VERSION = 1
+DEFAULT_MEMMAP_WORKERS = 4
+DEFAULT_MEMMAP_QUEUE_BATCHES = 8
+
+
+def _source_signature(preprocessed_dir: Path) -> List[List[Any]]:
+    """Name, size and mtime of the beat index and every HDF5 file the export is read from."""
+    paths = sorted(preprocessed_dir.glob("*.h5")) + [preprocessed_dir / BEAT_INDEX_FILENAME]
+    return [[path.name, path.stat().st_size, path.stat().st_mtime_ns] for path in paths if path.exists()]
+
+
+def _export_metadata(preprocessed_dir: Path, wavelet_scales: Optional[Sequence[float]]) -> Dict[str, Any]:
+    return {"version": MEMMAP_FORMAT_VERSION,
+            "wavelet_scales": None if wavelet_scales is None else [float(s) for s in wavelet_scales],
+            "source": _source_signature(preprocessed_dir)}
+
+
+def build_beat_array(
+    preprocessed_dir: Union[str, Path],
+    output_dir: Optional[Union[str, Path]] = None,
+    wavelet_scales: Optional[Sequence[float]] = None,
+    chunk_size: int = 1024
+) -> Path:
+    """
+    Exports every beat of a preprocessed directory into one .npy file in
+    beat_index.npz order (records sorted, beats in order), at the requested
+    wavelet scales or the stored ones. Raw-beat stores are transformed while
+    exporting. The file is written under a temporary name and renamed at the end.
+    """
+    preprocessed_dir = Path(preprocessed_dir)
+    output_dir = Path(output_dir or preprocessed_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = get_beat_index(preprocessed_dir)
+    if index is None:
+        raise FileNotFoundError(f"No {BEAT_INDEX_FILENAME} in {preprocessed_dir}; run preprocess_data.py first.")
+    num_beats = int(index.record_offsets[-1])
+    read_config = {"preprocessed_dir": str(preprocessed_dir), "wavelet_scales": wavelet_scales}
+
+    tmp_path = output_dir / f"{MEMMAP_FILENAME}.tmp.npy"
+    beats = None
+    for rec_id, rec_name in enumerate(index.record_names):
+        position = int(index.record_offsets[rec_id])
+        for chunk in iter_record_scalograms(rec_name, read_config, chunk_size):
+            if beats is None:
+                beats = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                                  shape=(num_beats,) + chunk.shape[1:])
+            beats[position:position + len(chunk)] = chunk
+            position += len(chunk)
+        if position != int(index.record_offsets[rec_id + 1]):
+            raise ValueError(f"Record {rec_name} has {position - int(index.record_offsets[rec_id])} stored beats "
+                             f"but the beat index lists {int(index.record_offsets[rec_id + 1] - index.record_offsets[rec_id])}.")
+    if beats is None:
+        raise ValueError(f"No beats to export in {preprocessed_dir}.")
+    beats.flush()
+    shape = beats.shape
+    del beats
+
+    final_path = output_dir / MEMMAP_FILENAME
+    os.replace(tmp_path, final_path)
+    with open(output_dir / MEMMAP_META_FILENAME, 'w') as f:
+        json.dump(_export_metadata(preprocessed_dir, wavelet_scales), f, indent=4)
+    logger.info(f"Exported {num_beats} beats of shape {shape[1:]} to {final_path} "
+                f"({final_path.stat().st_size / 2**30:.2f} GB).")
+    return final_path
+
+
+_open_arrays: Dict[Tuple[str, bool], Tuple[int, Dict[str, Any], np.ndarray]] = {}
+
+def get_beat_array(
+    preprocessed_dir: Union[str, Path],
+    output_dir: Optional[Union[str, Path]] = None,
+    wavelet_scales: Optional[Sequence[float]] = None,
+    in_memory: bool = False
+) -> np.ndarray:
+    """
+    Returns the read-only memory-mapped beat array of a preprocessed directory,
+    exporting it first when it is missing, was built for other scales or its
+    source files changed. With in_memory=True the whole array is read into RAM
+    instead. Cached per process, so every caller shares the same array.
+    """
+    preprocessed_dir = Path(preprocessed_dir)
+    output_dir = Path(output_dir or preprocessed_dir)
+    path, meta_path = output_dir / MEMMAP_FILENAME, output_dir / MEMMAP_META_FILENAME
+    expected = _export_metadata(preprocessed_dir, wavelet_scales)
+    key = (str(path.resolve()), in_memory)
+    cached = _open_arrays.get(key)
+    if cached is not None and cached[1] == expected and path.exists() and path.stat().st_mtime_ns == cached[0]:
+        return cached[2]  # Already validated and loaded; only file stats were needed.
+
+    try:
+        with open(meta_path, 'r') as f:
+            current = json.load(f) == expected and path.exists()
+    except (FileNotFoundError, json.JSONDecodeError):
+        current = False
+    if not current:
+        build_beat_array(preprocessed_dir, output_dir, wavelet_scales)
+
+    if in_memory:
+        beats = np.load(path)
+        beats.setflags(write=False)
+        logger.info(f"Loaded {beats.shape[0]} beats ({beats.nbytes / 2**30:.2f} GB) into memory from {path}.")
+    else:
+        beats = np.load(path, mmap_mode='r')
+    _open_arrays[key] = (path.stat().st_mtime_ns, expected, beats)
+    return beats
+
+
+def _shared_array(config: Dict[str, Any]) -> np.ndarray:
+    """The beat array a data config reads: in RAM with "in_memory_dataset", memory-mapped otherwise."""
+    return get_beat_array(config["preprocessed_dir"], config.get("memmap_dir"), config.get("wavelet_scales"),
+                          in_memory=config.get("in_memory_dataset", False))
+
+
+def load_shared_dataset(config: Dict[str, Any]) -> Tuple[np.ndarray, BeatIndex]:
+    """Warm-up: exports (if needed) and loads the beat array and the beat index of a data config."""
+    index = get_beat_index(config["preprocessed_dir"])
+    if index is None:
+        raise FileNotFoundError(f"No {BEAT_INDEX_FILENAME} in {config['preprocessed_dir']}; run preprocess_data.py first.")
+    return _shared_array(config), index
+
+
+def record_mask(index: BeatIndex, record_names: Sequence[str]) -> np.ndarray:
+    """Boolean mask over the records of the beat index; unknown records are reported and ignored."""
+    wanted = set(record_names)
+    missing = wanted.difference(index.record_names)
+    if missing:
+        logger.warning(f"Records {sorted(missing)} are not in the beat index; skipping them.")
+    return np.array([name in wanted for name in index.record_names], dtype=bool)
+
+
+def sequence_starts(index: BeatIndex, record_names: Sequence[str], sequence_len: int) -> np.ndarray:
+    """
+    First-beat positions of every sequence of the given records, in beat-index
+    order: the beats of the masked records that are followed by at least
+    sequence_len - 1 beats of the same record.
+    """
+    lengths = np.diff(index.record_offsets)
+    record_id = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(int(index.record_offsets[-1])) - index.record_offsets[record_id]
+    valid = record_mask(index, record_names)[record_id] & (position <= lengths[record_id] - sequence_len)
+    return np.flatnonzero(valid).astype(np.int64)
+
+
+def shared_scaler_stats(record_names: Sequence[str], config: Dict[str, Any],
+                        chunk_size: int = 1024) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Per-time-step mean and scale of all beats of the given records, computed from
+    the shared beat array. Same definition as the StandardScaler of the fold
+    scripts (population std, zero scales replaced by 1). Returns (None, None)
+    when the records have no beats.
+    """
+    beats, index = load_shared_dataset(config)
+    mask = record_mask(index, record_names)
+    total = np.zeros(beats.shape[-1], dtype=np.float64)
+    total_sq = np.zeros(beats.shape[-1], dtype=np.float64)
+    count = 0
+    for rec_id in np.flatnonzero(mask):
+        for start in range(int(index.record_offsets[rec_id]), int(index.record_offsets[rec_id + 1]), chunk_size):
+            chunk = beats[start:min(start + chunk_size, int(index.record_offsets[rec_id + 1]))].astype(np.float64)
+            chunk = chunk.reshape(-1, chunk.shape[-1])
+            total += chunk.sum(axis=0)
+            total_sq += np.square(chunk).sum(axis=0)
+            count += chunk.shape[0]
+    if count == 0:
+        return None, None
+    mean = total / count
+    scale = np.sqrt(np.maximum(total_sq / count - np.square(mean), 0.0))
+    scale[scale < 10 * np.finfo(np.float64).eps] = 1.0
+    return mean.astype(np.float32), scale.astype(np.float32)
+
+
+class MemmapSequenceLoader(tf.keras.utils.PyDataset):
+    """
+    Batches of (scalogram sequences, labels) gathered from the memory-mapped (or,
+    with "in_memory_dataset", the shared in-RAM) beat array. With shuffle=True
+    every epoch uses a new permutation of all sequences of the selected records;
+    otherwise sequences come in beat-index order (records sorted by name).
+    Sequences are (sequence_len, n_scales, n_samples, 1) and normalized with
+    mean/scale when given.
+    """
+    def __init__(
+        self,
+        record_names: Sequence[str],
+        config: Dict[str, Any],
+        batch_size: int,
+        shuffle: bool = False,
+        mean: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+        seed: Optional[int] = None,
+        workers: int = DEFAULT_MEMMAP_WORKERS,
+        max_queue_size: int = DEFAULT_MEMMAP_QUEUE_BATCHES
+    ):
+        super().__init__(workers=workers, use_multiprocessing=False, max_queue_size=max_queue_size)
+        self.beats, index = load_shared_dataset(config)
+        self.sequence_len = config["sequence_len"]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.labels = index.label
+        self._rng = np.random.default_rng(seed)
+        self._beat_offsets = np.arange(self.sequence_len)
+
+        self.sequence_starts = sequence_starts(index, record_names, self.sequence_len)
+        self._order = np.arange(len(self.sequence_starts))
+        if self.shuffle:
+            self._rng.shuffle(self._order)
+
+    def __len__(self) -> int:
+        return math.ceil(len(self.sequence_starts) / self.batch_size)
+
+    def __getitem__(self, batch_index: int):
+        # Sorted starts keep the page-cache reads of one batch in file order.
+        positions = np.sort(self._order[batch_index * self.batch_size:(batch_index + 1) * self.batch_size])
+        starts = self.sequence_starts[positions]
+        sequences = self.beats[(starts[:, None] + self._beat_offsets).ravel()]
+        sequences = sequences.reshape((len(starts), self.sequence_len) + self.beats.shape[1:])
+        if self.mean is not None and self.scale is not None:
+            sequences = (sequences - self.mean) / self.scale
+        labels = self.labels[starts + self.sequence_len - 1].astype(np.int32)
+        return sequences[..., None], labels
+
+    def on_epoch_end(self) -> None:
+        if self.shuffle:
+            self._rng.shuffle(self._order)
+
+    def _batches(self, repeat: bool):
+        """Yields the batches of one epoch (or forever), gathered ahead by a pool of worker threads."""
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            while True:
+                pending = deque()
+                for batch_index in range(len(self)):
+                    pending.append(pool.submit(self.__getitem__, batch_index))
+                    if len(pending) >= self.max_queue_size:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+                self.on_epoch_end()
+                if not repeat:
+                    return
+
+    def as_dataset(self, repeat: bool = False) -> tf.data.Dataset:
+        """Exposes the loader as a tf.data.Dataset of batches (endless with repeat=True)."""
+        signature = (
+            tf.TensorSpec((None, self.sequence_len) + self.beats.shape[1:] + (1,), tf.float32),
+            tf.TensorSpec((None,), tf.int32),
+        )
+        dataset = tf.data.Dataset.from_generator(lambda: self._batches(repeat), output_signature=signature)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def create_memmap_dataset(
+    record_names: List[str],
+    config: Dict[str, Any],
+    batch_size: int,
+    is_training: bool = False,
+    mean: Optional[np.ndarray] = None,
+    scale: Optional[np.ndarray] = None
+) -> tf.data.Dataset:
+    """
+    create_dataset counterpart backed by the memory-mapped or shared in-RAM beat
+    array: globally shuffled and repeated for training, in beat-index order and
+    finite otherwise.
+    """
+    loader = MemmapSequenceLoader(
+        record_names, config, batch_size, shuffle=is_training, mean=mean, scale=scale,
+        seed=config.get("memmap_seed"), workers=config.get("memmap_workers", DEFAULT_MEMMAP_WORKERS),
+        max_queue_size=config.get("memmap_queue_batches", DEFAULT_MEMMAP_QUEUE_BATCHES)
+    )
+    source = "In-memory" if config.get("in_memory_dataset", False) else "Memory-mapped"
+    logger.info(f"{source} dataset with {len(loader.sequence_starts)} sequences created for "
+                f"{'training (global shuffle)' if is_training else 'validation'}.")
+    return loader.as_dataset(repeat=is_training)
@@ -5,20 +5,35 @@
 # to prevent data leakage. It now computes scalograms from the raw signals and
 # stores them in HDF5 format, one file per record.
 
+import argparse
+import hashlib
 import json
 import logging
+import os
 import time
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from functools import partial
 import multiprocessing
 
 import numpy as np
 import wfdb
-import pywt
 import h5py
 from tqdm import tqdm
 
+from cwt_engine import extract_beat_windows, batched_cwt
+from scalogram_store import (
+    RAW_BEAT_DATASET, SCALOGRAM_DATASET, write_scalograms, layout_from_config, create_scalogram_dataset,
+    append_scalograms, beat_dataset
+)
+from work_scheduler import Task, plan_tasks, pool_size, read_record_length, timed_call, report_utilization
+from dataset_store import (
+    CONSOLIDATED_FILENAME, BEAT_INDEX_FILENAME, RecordBeats, BeatIndex, metadata_to_record_beats,
+    build_consolidated_store, stored_record_names, write_beat_index
+)
+from shared_results import start_transport, export_beats, import_beats, discard_beats
+from signal_conditioning import condition_signal, conditioning_enabled, settle_samples
+
 # --- Configuration ---
 class Config:
     """Holds all static configuration parameters for the preprocessing script."""
@@ -31,9 +46,40 @@ class Config:
     ]
     TIME_STEPS_PER_BEAT = 187
     WAVELET_NAME = 'morl'
+    # May be a superset (e.g. parse_scale_spec('1:64:0.5')); training configs then
+    # select a subset through their data "wavelet_scales" list without re-preprocessing.
     WAVELET_SCALES = list(range(1, 33))
     OUTPUT_DIRECTORY = "preprocessed_data_h5_raw" # Directory for non-normalized HDF5 files
     METADATA_FILENAME = "metadata.json"
+    MANIFEST_FILENAME = "manifest.json" # Content hashes used for incremental rebuilds
+    CONSOLIDATED_FILENAME = CONSOLIDATED_FILENAME # Single store with all beats (see dataset_store.py)
+    BEAT_INDEX_FILENAME = BEAT_INDEX_FILENAME # Compact label index used by DataLoader.get_all_labels
+    METADATA_VERSION = 2 # Bumped when the per-beat metadata fields change
+    RECORD_FILE_EXTENSIONS = ('.dat', '.hea', '.atr')
+    # HDF5 layout of the scalogram datasets (see scalogram_store.py)
+    H5_CHUNK_BEATS = None       # Beats per chunk; None is contiguous (128-beat chunks if compressed or resizable, e.g. dataset.h5)
+    H5_COMPRESSION = None       # None, 'gzip', 'lzf' or 'blosc' (needs hdf5plugin)
+    H5_COMPRESSION_OPTS = None  # gzip level (0-9) or Blosc clevel; None uses the default
+    H5_STORAGE_DTYPE = 'float32' # 'float32' or 'float16'
+    # Store only the raw beat windows (TIME_STEPS_PER_BEAT samples instead of
+    # len(WAVELET_SCALES) x TIME_STEPS_PER_BEAT values per beat). The wavelet and
+    # scales are recorded with them and DataLoader computes the scalograms in-graph.
+    STORE_RAW_BEATS = False
+    # Optional record-level conditioning (see signal_conditioning.py), applied once
+    # to the full signal before beat extraction: a zero-phase Butterworth high-pass
+    # against baseline wander and/or low-pass. None disables a filter.
+    CONDITIONING_HIGHPASS_HZ = None # e.g. 0.5
+    CONDITIONING_LOWPASS_HZ = None  # e.g. 45.0
+    CONDITIONING_ORDER = 2
+    # Streaming mode for long (e.g. 24-hour Holter) recordings: the signal is read
+    # in segments of this many seconds and appended to a resizable dataset, so
+    # peak memory depends on the segment length instead of the record length.
+    STREAM_SEGMENT_SECONDS = None
+    # Records longer than this are split into sample-range sub-tasks that run in
+    # parallel and are merged afterwards, so one Holter file cannot become the
+    # straggler that the whole pool waits for.
+    MAX_TASK_SECONDS = 3600
+    NUM_WORKERS = None # Fixed pool size; None sizes the pool from the cgroup CPU/memory limits
     AAMI_MAP = {
         'N': 0, 'L': 0, 'R': 0, 'e': 0, 'j': 0, 'n': 0, 'B': 0,
         'A': 1, 'a': 1, 'J': 1, 'S': 1,
@@ -41,6 +87,25 @@ class Config:
         'F': 3,
         '/': 4, 'f': 4, 'Q': 4, '?': 4
     }
+    # Config fields that change the content of the generated files. Any change to
+    # one of them invalidates every record in the manifest.
+    FINGERPRINT_FIELDS = (
+        'WAVELET_NAME', 'WAVELET_SCALES', 'TIME_STEPS_PER_BEAT', 'AAMI_MAP',
+        'H5_CHUNK_BEATS', 'H5_COMPRESSION', 'H5_COMPRESSION_OPTS', 'H5_STORAGE_DTYPE',
+        'STORE_RAW_BEATS', 'CONDITIONING_HIGHPASS_HZ', 'CONDITIONING_LOWPASS_HZ', 'CONDITIONING_ORDER',
+        'METADATA_VERSION'
+    )
+    # Without conditioning, streaming (and splitting long records) produces the same
+    # scalograms as the whole-record path, so the segmentation is not fingerprinted.
+    # With a conditioning filter the segment boundaries change the output slightly
+    # (~1e-8 relative), so these fields are fingerprinted too and a manifest hit
+    # never mixes outputs of differently segmented runs.
+    CONDITIONED_FINGERPRINT_FIELDS = ('STREAM_SEGMENT_SECONDS', 'MAX_TASK_SECONDS')
+
+# Segment length used for split sub-tasks when STREAM_SEGMENT_SECONDS is not set.
+DEFAULT_STREAM_SEGMENT_SECONDS = 300
+# Approximate resident memory of an idle worker (interpreter, numpy, wfdb, h5py).
+WORKER_BASELINE_BYTES = 200 * 2**20
 
 # --- Setup Logging ---
 def setup_logging():
@@ -54,108 +119,527 @@ def setup_logging():
 
 # --- Core Functions ---
 
-def process_record_worker(rec_name: str, config: Config) -> Tuple[str, List[Dict[str, Any]]]:
+def beat_dataset_kwargs(config: Config) -> Dict[str, Any]:
+    """create_scalogram_dataset arguments for the per-beat output: scalograms, or raw windows with STORE_RAW_BEATS."""
+    num_samples = 2 * (config.TIME_STEPS_PER_BEAT // 2) + 1
+    if config.STORE_RAW_BEATS:
+        return {"beat_shape": (num_samples,), "scales": config.WAVELET_SCALES, "wavelet": config.WAVELET_NAME,
+                "name": RAW_BEAT_DATASET}
+    return {"beat_shape": (len(config.WAVELET_SCALES), num_samples), "scales": config.WAVELET_SCALES,
+            "wavelet": config.WAVELET_NAME, "name": SCALOGRAM_DATASET}
+
+def condition_record_signal(signal: np.ndarray, fs: float, config: Config) -> Tuple[np.ndarray, float]:
+    """
+    Applies the configured conditioning filter to a full signal; returns (signal,
+    seconds spent). Without conditioning the signal is returned as is and not timed.
+    """
+    if not conditioning_enabled(config.CONDITIONING_HIGHPASS_HZ, config.CONDITIONING_LOWPASS_HZ):
+        return signal, 0.0
+    start = time.perf_counter()
+    conditioned = condition_signal(signal, fs, config.CONDITIONING_HIGHPASS_HZ, config.CONDITIONING_LOWPASS_HZ,
+                                   config.CONDITIONING_ORDER)
+    return conditioned, time.perf_counter() - start
+
+def transform_beats(beats: np.ndarray, config: Config) -> np.ndarray:
+    """Turns extracted beat windows into what is stored: their scalograms, or the windows themselves with STORE_RAW_BEATS."""
+    if config.STORE_RAW_BEATS:
+        return beats.astype(np.float32)
+    return batched_cwt(beats, config.WAVELET_SCALES, config.WAVELET_NAME)
+
+def process_record_range(
+    rec_name: str,
+    config: Config,
+    output_path: Path,
+    sampfrom: int = 0,
+    sampto: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Streams the beats whose R-peak lies in [sampfrom, sampto) into output_path
+    and returns their (labels, samples) arrays and the seconds spent conditioning.
+
+    The range is read in segments of STREAM_SEGMENT_SECONDS with sampfrom/sampto.
+    Each segment owns the beats whose R-peak falls inside it and is read with
+    half a beat window (plus one sample) of overlap on both sides, so a beat that
+    straddles a segment edge is still extracted exactly once and with the same
+    boundary rule as the whole-record path. With conditioning enabled, each segment
+    is read with enough extra context for the filter to settle (settle_samples).
+    Scalograms are appended to a resizable
+    HDF5 dataset, so only one segment's scalograms are ever held in memory.
+    The file is written under a temporary name and only renamed into place when
+    it contains beats. Errors propagate to the caller.
+    """
+    record_path = f"{config.DB_DIRECTORY}/{rec_name}"
+    tmp_path = output_path.with_suffix('.h5.tmp')
+    half_window = config.TIME_STEPS_PER_BEAT // 2
+
+    try:
+        header = wfdb.rdheader(record_path)
+        sig_len = header.sig_len
+        sampto = sig_len if sampto is None else min(sampto, sig_len)
+        segment_seconds = config.STREAM_SEGMENT_SECONDS or DEFAULT_STREAM_SEGMENT_SECONDS
+        segment_len = max(1, int(segment_seconds * header.fs))
+        annotation = wfdb.rdann(record_path, 'atr')
+        r_peaks, symbols = np.asarray(annotation.sample), np.asarray(annotation.symbol)
+        context = half_window + 1 + settle_samples(header.fs, config.CONDITIONING_HIGHPASS_HZ, config.CONDITIONING_LOWPASS_HZ)
+
+        record_labels, record_samples, conditioning_seconds = [], [], 0.0
+        with h5py.File(tmp_path, 'w') as hf:
+            dataset = create_scalogram_dataset(hf, layout=layout_from_config(config), **beat_dataset_kwargs(config))
+            for seg_start in range(sampfrom, sampto, segment_len):
+                seg_end = min(seg_start + segment_len, sampto)
+                in_segment = (r_peaks >= seg_start) & (r_peaks < seg_end)
+                if not np.any(in_segment):
+                    continue
+
+                read_start = max(0, seg_start - context)
+                read_end = min(sig_len, seg_end + context)
+                segment = wfdb.rdrecord(record_path, sampfrom=read_start, sampto=read_end, channels=[0])
+                segment_signal, seconds = condition_record_signal(segment.p_signal[:, 0], header.fs, config)
+                conditioning_seconds += seconds
+
+                beats, labels, peaks = extract_beat_windows(
+                    segment_signal, r_peaks[in_segment] - read_start, symbols[in_segment],
+                    config.AAMI_MAP, config.TIME_STEPS_PER_BEAT
+                )
+                append_scalograms(dataset, transform_beats(beats, config))
+                record_labels.append(labels)
+                record_samples.append(peaks + read_start)
+
+        labels = np.concatenate(record_labels) if record_labels else np.zeros(0, dtype=np.int32)
+        samples = np.concatenate(record_samples) if record_samples else np.zeros(0, dtype=np.int64)
+        if len(labels):
+            os.replace(tmp_path, output_path)
+        else:
+            tmp_path.unlink()
+        return labels, samples, conditioning_seconds
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+def process_record_streaming(rec_name: str, config: Config) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Streaming variant of process_record for long recordings (see process_record_range)."""
+    output_path = Path(config.OUTPUT_DIRECTORY) / f"{rec_name}.h5"
+    return process_record_range(rec_name, config, output_path)
+
+def _part_path(config: Config, rec_name: str, part: int) -> Path:
+    return Path(config.OUTPUT_DIRECTORY) / f"{rec_name}.part{part}.h5"
+
+def run_preprocessing_task(task: Task, config: Config) -> Tuple[str, int, Optional[Dict[str, Any]]]:
+    """
+    Pool entry point. A whole-record task runs process_record_worker; a sub-task
+    of a split record streams its sample range into a part file that the parent
+    merges afterwards. Returns (record, part, summary) where summary is the
+    shared-memory handle of the beat arrays (see shared_results.py) plus the
+    seconds spent conditioning, or None when the task failed.
+    """
+    if task.num_parts == 1:
+        rec_name, summary = process_record_worker(task.record, config)
+        return rec_name, 0, summary
+    try:
+        labels, samples, conditioning_seconds = process_record_range(
+            task.record, config, _part_path(config, task.record, task.part), task.sampfrom, task.sampto
+        )
+        return task.record, task.part, dict(export_beats(labels, samples), conditioning_s=conditioning_seconds)
+    except Exception as e:
+        logging.error(f"Worker failed to process {task.record} samples [{task.sampfrom}, {task.sampto}): {e}")
+        return task.record, task.part, None
+
+def merge_record_parts(
+    rec_name: str,
+    parts: Dict[int, Optional[Dict[str, Any]]],
+    num_parts: int,
+    config: Config
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Concatenates the part files and beat arrays of a split record into
+    {rec_name}.h5 in sample order. Returns None (and cleans up) if any part failed.
+    """
+    part_paths = [_part_path(config, rec_name, part) for part in range(num_parts)]
+    try:
+        if len(parts) != num_parts or any(summary is None for summary in parts.values()):
+            logging.error(f"Record {rec_name}: {num_parts - sum(s is not None for s in parts.values())} sub-task(s) failed.")
+            for summary in parts.values():
+                discard_beats(summary)
+            return None
+        part_beats = [import_beats(parts[part]) for part in range(num_parts)]
+        output_path = Path(config.OUTPUT_DIRECTORY) / f"{rec_name}.h5"
+        tmp_path = output_path.with_suffix('.h5.tmp')
+        with h5py.File(tmp_path, 'w') as hf:
+            dataset = create_scalogram_dataset(hf, layout=layout_from_config(config), **beat_dataset_kwargs(config))
+            for part_path, (labels, _) in zip(part_paths, part_beats):
+                if not len(labels):
+                    continue
+                with h5py.File(part_path, 'r') as part_file:
+                    source = beat_dataset(part_file)
+                    for i in range(0, source.shape[0], 1024):
+                        append_scalograms(dataset, source[i:i + 1024])
+        labels = np.concatenate([labels for labels, _ in part_beats])
+        samples = np.concatenate([samples for _, samples in part_beats])
+        if len(labels):
+            os.replace(tmp_path, output_path)
+        else:
+            tmp_path.unlink()
+        return labels, samples
+    finally:
+        for part_path in part_paths:
+            if part_path.exists():
+                part_path.unlink()
+
+def estimate_task_memory(task: Task, fs: float, config: Config) -> int:
+    """Rough upper bound of a worker's peak memory for one task, used to size the pool."""
+    seconds = task.cost / fs
+    if task.num_parts > 1 or config.STREAM_SEGMENT_SECONDS:
+        seconds = min(seconds, config.STREAM_SEGMENT_SECONDS or DEFAULT_STREAM_SEGMENT_SECONDS)
+    max_beats = seconds * 3.5  # 210 bpm upper bound
+    beat_bytes = (1 if config.STORE_RAW_BEATS else len(config.WAVELET_SCALES)) * config.TIME_STEPS_PER_BEAT * 4
+    # Signal (all channels, float64), scalograms (float32) and a copy for the HDF5 write, plus interpreter baseline.
+    return int(seconds * fs * 2 * 8 + 2 * max_beats * beat_bytes + WORKER_BASELINE_BYTES)
+
+def process_record_worker(rec_name: str, config: Config) -> Tuple[str, Optional[Dict[str, Any]]]:
     """
     Worker function to be run in a separate process. It processes a single
     record, computes scalograms from the RAW signal, and saves them into an HDF5 file.
     The StandardScaler has been removed from this function.
+    All valid beats are extracted and transformed in one batched CWT call
+    (see cwt_engine.py) instead of one pywt.cwt call per beat. When
+    STREAM_SEGMENT_SECONDS is set the record is streamed segment by segment.
+    The optional conditioning filter runs once on the full signal.
+    The beat labels and R-peak positions are handed back through shared memory;
+    only a small summary is returned (None on failure).
     """
-    record_metadata = []
-    record_scalograms = []
-    half_window = config.TIME_STEPS_PER_BEAT // 2
     output_dir = Path(config.OUTPUT_DIRECTORY)
 
     try:
+        if config.STREAM_SEGMENT_SECONDS:
+            labels, peaks, conditioning_seconds = process_record_streaming(rec_name, config)
+            return rec_name, dict(export_beats(labels, peaks), conditioning_s=conditioning_seconds)
+
         # Load record and annotations
         record = wfdb.rdrecord(f"{config.DB_DIRECTORY}/{rec_name}")
         annotation = wfdb.rdann(f"{config.DB_DIRECTORY}/{rec_name}", 'atr')
         r_peaks, symbols = annotation.sample, annotation.symbol
 
-        # The signal is used directly without scaling
-        raw_signal = record.p_signal[:, 0].flatten()
-
-        # Extract valid beats and compute their scalograms
-        beat_index = 0
-        for peak, symbol in zip(r_peaks, symbols):
-            if symbol in config.AAMI_MAP:
-                # Boundary check to ensure the window is within signal limits
-                if half_window < peak < len(raw_signal) - half_window:
-                    start, end = peak - half_window, peak + half_window + 1
-                    heartbeat_signal = raw_signal[start:end]
-
-                    # Compute CWT on the raw heartbeat signal
-                    coeffs, _ = pywt.cwt(heartbeat_signal, config.WAVELET_SCALES, config.WAVELET_NAME)
-                    scalogram = np.abs(coeffs).astype(np.float32)
-                    
-                    # Collect scalograms and metadata
-                    record_scalograms.append(scalogram)
-                    record_metadata.append({
-                        "record_name": rec_name,
-                        "beat_index": beat_index, # This is the index within the HDF5 dataset
-                        "label": config.AAMI_MAP[symbol]
-                    })
-                    beat_index += 1
-        
+        # The signal is not scaled; it is only filtered when conditioning is enabled
+        raw_signal, conditioning_seconds = condition_record_signal(record.p_signal[:, 0].flatten(), record.fs, config)
+
+        # Extract all valid beat windows at once and compute their scalograms
+        beats, labels, peaks = extract_beat_windows(
+            raw_signal, r_peaks, symbols, config.AAMI_MAP, config.TIME_STEPS_PER_BEAT
+        )
+        scalograms = transform_beats(beats, config)
+
         # After collecting all beats, save them to a single HDF5 file
-        if record_scalograms:
+        if len(scalograms):
             output_path = output_dir / f"{rec_name}.h5"
-            with h5py.File(output_path, 'w') as hf:
-                hf.create_dataset("scalograms", data=np.array(record_scalograms))
-        
-        return rec_name, record_metadata
+            dataset_kwargs = beat_dataset_kwargs(config)
+            write_scalograms(output_path, scalograms, layout_from_config(config), dataset_kwargs["scales"],
+                             dataset_kwargs["wavelet"], dataset_kwargs["name"])
+
+        return rec_name, dict(export_beats(labels, peaks), conditioning_s=conditioning_seconds)
     except Exception as e:
-        # Log the error and return an empty list to indicate failure
+        # Log the error and return None to indicate failure
         logging.error(f"Worker failed to process record {rec_name}: {e}")
-        return rec_name, []
+        return rec_name, None
 
-def main():
-    """Main execution function for the parallel HDF5 preprocessing pipeline."""
-    logger = setup_logging()
-    config = Config()
+# --- Incremental Build Manifest ---
+
+def config_fingerprint(config: Config) -> str:
+    """Returns a stable hash of the Config fields that affect the generated files."""
+    names = config.FINGERPRINT_FIELDS
+    if conditioning_enabled(config.CONDITIONING_HIGHPASS_HZ, config.CONDITIONING_LOWPASS_HZ):
+        names += config.CONDITIONED_FINGERPRINT_FIELDS
+    fields = {name: getattr(config, name) for name in names}
+    payload = json.dumps(fields, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+def record_content_hash(rec_name: str, config: Config) -> str:
+    """
+    Hashes the raw .dat/.hea/.atr files of a record together with the config
+    fingerprint, so the key changes when either the inputs or the settings change.
+    """
+    digest = hashlib.sha256(config_fingerprint(config).encode('utf-8'))
+    for ext in config.RECORD_FILE_EXTENSIONS:
+        file_path = Path(config.DB_DIRECTORY) / f"{rec_name}{ext}"
+        digest.update(ext.encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(output_dir: Path, config: Config) -> Dict[str, Any]:
+    """Loads the manifest of the previous run, or an empty one if it is missing or unreadable."""
+    manifest_path = output_dir / config.MANIFEST_FILENAME
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"records": {}}
+
+def load_existing_beats(output_dir: Path, config: Config) -> RecordBeats:
+    """
+    Loads the beat index of the previous run as per-record arrays, from
+    beat_index.npz when present and from metadata.json otherwise.
+    """
+    index_path = output_dir / config.BEAT_INDEX_FILENAME
+    if index_path.exists():
+        try:
+            return BeatIndex(index_path).record_beats()
+        except (OSError, KeyError, ValueError):
+            pass
+    metadata_path = output_dir / config.METADATA_FILENAME
+    try:
+        with open(metadata_path, 'r') as f:
+            return metadata_to_record_beats(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_metadata_json(metadata_path: Path, record_beats: RecordBeats) -> None:
+    """
+    Writes metadata.json (one dict per beat, sorted by record and beat index) one
+    record at a time, so the full list of dicts is never built in memory.
+    """
+    first = True
+    with open(metadata_path, 'w') as f:
+        f.write('[')
+        for rec_name in sorted(record_beats):
+            labels, samples = record_beats[rec_name]
+            for beat_index, (label, sample) in enumerate(zip(labels.tolist(), samples.tolist())):
+                item = {
+                    "record_name": rec_name,
+                    "beat_index": beat_index, # This is the index within the HDF5 dataset
+                    "label": label,
+                    "sample": sample # R-peak position in the original signal
+                }
+                f.write(('\n' if first else ',\n') + '\n'.join('    ' + line for line in json.dumps(item, indent=4).splitlines()))
+                first = False
+        f.write('\n]' if not first else ']')
+
+def find_stale_records(config: Config, manifest: Dict[str, Any], record_hashes: Dict[str, str], has_metadata: bool) -> List[str]:
+    """
+    Returns the records whose content hash changed or whose beats are missing,
+    i.e. neither in the consolidated store nor in a not yet consolidated
+    per-record file.
+    """
+    output_dir = Path(config.OUTPUT_DIRECTORY)
+    stored = set(stored_record_names(output_dir / config.CONSOLIDATED_FILENAME))
+    stale = []
+    for rec_name in config.RECORD_NAMES:
+        entry = manifest["records"].get(rec_name)
+        if (not has_metadata or entry is None or entry.get("hash") != record_hashes[rec_name]
+                or not (rec_name in stored or (output_dir / f"{rec_name}.h5").exists())):
+            stale.append(rec_name)
+    return stale
+
+# --- Main Pipeline ---
+
+def consolidate_records(output_dir: Path, record_beats: RecordBeats, config: Config) -> None:
+    """
+    Moves the per-record HDF5 files written by this run into the consolidated
+    store (see build_consolidated_store); records already in it are kept as they are.
+    """
+    logger = logging.getLogger(__name__)
+    if not record_beats:
+        logger.warning("No beats available; the consolidated store was not built.")
+        return
+    try:
+        build_consolidated_store(output_dir, record_beats, layout_from_config(config), config.CONSOLIDATED_FILENAME)
+    except (IOError, KeyError, ValueError) as e:
+        logger.error(f"Could not build the consolidated store: {e}")
+
+def save_index_files(output_dir: Path, all_beats: RecordBeats, manifest: Dict[str, Any], config: Config) -> None:
+    """Writes metadata.json and beat_index.npz for the given beats, then the manifest."""
+    logger = logging.getLogger(__name__)
+    metadata_path = output_dir / config.METADATA_FILENAME
+    num_beats = sum(len(labels) for labels, _ in all_beats.values())
+    logger.info(f"Saving metadata for {num_beats} total beats to {metadata_path}...")
+    try:
+        # Records and beats are written in sorted order for a consistent and readable file
+        write_metadata_json(metadata_path, all_beats)
+        write_beat_index(output_dir, all_beats, max(config.AAMI_MAP.values()) + 1)
+        # The manifest is written last so an interrupted run is simply redone.
+        with open(output_dir / config.MANIFEST_FILENAME, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        logger.info("Metadata and manifest files saved successfully.")
+    except IOError as e:
+        logger.error(f"Could not write metadata file: {e}")
+
+def run_preprocessing(config: Config, force: bool = False) -> Dict[str, Any]:
+    """
+    Runs the parallel HDF5 preprocessing pipeline. Only records whose content
+    hash differs from the manifest are reprocessed (all of them when force=True);
+    their metadata is merged into the existing index. Records no longer listed
+    in RECORD_NAMES are dropped from the index, the manifest and the store.
+    """
+    logger = logging.getLogger(__name__)
     output_dir = Path(config.OUTPUT_DIRECTORY)
     output_dir.mkdir(parents=True, exist_ok=True)
 
     logger.info("--- Starting Parallel HDF5 Preprocessing (Scaler Removed) ---")
     start_time = time.time()
 
-    # Step 1: Process all records in parallel using a process pool
-    all_metadata = []
-    num_processes = max(1, multiprocessing.cpu_count() - 1)
-    logger.info(f"Initializing process pool with {num_processes} workers.")
+    # Step 1: Hash the inputs and decide which records need to be rebuilt
+    manifest = {"records": {}} if force else load_manifest(output_dir, config)
+    existing_beats = {} if force else load_existing_beats(output_dir, config)
+    wanted = set(config.RECORD_NAMES)
+    record_hashes = {}
+    for rec_name in config.RECORD_NAMES:
+        try:
+            record_hashes[rec_name] = record_content_hash(rec_name, config)
+        except FileNotFoundError as e:
+            logger.error(f"Input files for record {rec_name} are missing: {e}")
+            record_hashes[rec_name] = None
+    stale_records = find_stale_records(config, manifest, record_hashes, bool(existing_beats))
+    logger.info(f"{len(stale_records)} of {len(config.RECORD_NAMES)} records need to be (re)processed.")
+
+    if not stale_records:
+        all_beats = {rec_name: beats for rec_name, beats in existing_beats.items() if rec_name in wanted}
+        dropped = sorted((set(existing_beats) | set(manifest["records"])) - wanted)
+        stored = set(stored_record_names(output_dir / config.CONSOLIDATED_FILENAME))
+        if dropped:
+            logger.info(f"{len(dropped)} record(s) no longer in RECORD_NAMES; removing them from the index.")
+            manifest["records"] = {k: v for k, v in manifest["records"].items() if k in wanted}
+            save_index_files(output_dir, all_beats, manifest, config)
+        else:
+            logger.info("All records are up to date. Nothing to do.")
+            if not (output_dir / config.BEAT_INDEX_FILENAME).exists() and all_beats:
+                write_beat_index(output_dir, all_beats, max(config.AAMI_MAP.values()) + 1)
+        # Per-record files left by an interrupted run are consolidated now, and a
+        # store that still holds dropped records is brought in line with the index.
+        pending = [rec_name for rec_name in all_beats if (output_dir / f"{rec_name}.h5").exists()]
+        if pending or stored != set(all_beats):
+            consolidate_records(output_dir, all_beats, config)
+        num_beats = sum(len(labels) for labels, _ in all_beats.values())
+        return {"processed_records": [], "num_beats": num_beats, "elapsed": time.time() - start_time,
+                "worker_seconds": 0.0, "conditioning_seconds": 0.0}
+
+    # Step 2: Plan tasks largest first (cost = signal length from the .hea file),
+    # splitting very long records, and size the pool from the cgroup limits
+    record_lengths, sampling_rates = {}, {}
+    for rec_name in stale_records:
+        try:
+            record_lengths[rec_name], sampling_rates[rec_name] = read_record_length(Path(config.DB_DIRECTORY) / f"{rec_name}.hea")
+        except (OSError, ValueError):
+            record_lengths[rec_name], sampling_rates[rec_name] = 0, 360.0
+    max_task_samples = {rec: int(config.MAX_TASK_SECONDS * fs) for rec, fs in sampling_rates.items()}
+    tasks = [task for rec_name in stale_records
+             for task in plan_tasks({rec_name: record_lengths[rec_name]}, max_task_samples[rec_name])]
+    tasks.sort(key=lambda t: t.cost, reverse=True)
+    per_worker_bytes = max(estimate_task_memory(t, sampling_rates[t.record], config) for t in tasks)
+    num_processes = min(config.NUM_WORKERS, len(tasks)) if config.NUM_WORKERS else pool_size(per_worker_bytes, max_tasks=len(tasks))
+    logger.info(f"Initializing process pool with {num_processes} workers for {len(tasks)} tasks "
+                f"(~{per_worker_bytes / 2**20:.0f} MB per worker).")
 
     # Use 'partial' to create a callable with fixed arguments for the pool
-    worker_func = partial(process_record_worker, config=config)
+    worker_func = partial(timed_call, run_preprocessing_task, config=config)
 
+    start_transport()
+    pool_start = time.time()
     with multiprocessing.Pool(processes=num_processes) as pool:
-        # Use imap_unordered for efficiency and tqdm for a progress bar
-        results = list(tqdm(
-            pool.imap_unordered(worker_func, config.RECORD_NAMES),
-            total=len(config.RECORD_NAMES),
-            desc="Processing all records (raw signals)"
+        # imap_unordered with chunksize=1 hands tasks out in the (largest-first) submission order
+        timed_results = list(tqdm(
+            pool.imap_unordered(worker_func, tasks),
+            total=len(tasks),
+            desc="Processing records (raw signals)"
         ))
+    report_utilization(timed_results, time.time() - pool_start, logger)
+    worker_seconds = sum(item["end"] - item["start"] for item in timed_results)
+    conditioning_seconds = sum((item["result"][2] or {}).get("conditioning_s", 0.0) for item in timed_results)
+    if conditioning_enabled(config.CONDITIONING_HIGHPASS_HZ, config.CONDITIONING_LOWPASS_HZ):
+        logger.info(f"Signal conditioning took {conditioning_seconds:.2f}s of {worker_seconds:.1f}s worker time "
+                    f"({conditioning_seconds / max(worker_seconds, 1e-9):.1%}).")
+
+    # Step 3: Collect the beat arrays from shared memory (merging split records)
+    # and merge them into the existing per-record index
+    parts_by_record: Dict[str, Dict[int, Optional[Dict[str, Any]]]] = {}
+    for item in timed_results:
+        rec_name, part, summary = item["result"]
+        parts_by_record.setdefault(rec_name, {})[part] = summary
+    num_parts = {task.record: task.num_parts for task in tasks}
+    results = []
+    for rec_name, parts in parts_by_record.items():
+        if num_parts[rec_name] > 1:
+            results.append((rec_name, merge_record_parts(rec_name, parts, num_parts[rec_name], config)))
+        elif parts[0] is not None:
+            results.append((rec_name, import_beats(parts[0])))
+        else:
+            results.append((rec_name, None))
 
-    # Step 2: Consolidate metadata from all successful worker processes
-    for rec_name, metadata in results:
-        if metadata:
-            all_metadata.extend(metadata)
+    reprocessed = {rec_name for rec_name, _ in results}
+    all_beats = {rec_name: beats for rec_name, beats in existing_beats.items()
+                 if rec_name in wanted and rec_name not in reprocessed}
+    for rec_name, beats in results:
+        if beats is not None and len(beats[0]):
+            all_beats[rec_name] = beats
+            manifest["records"][rec_name] = {"hash": record_hashes[rec_name], "num_beats": len(beats[0])}
         else:
+            manifest["records"].pop(rec_name, None)
             logger.warning(f"Record {rec_name} produced no metadata, likely due to a processing error.")
+    manifest["records"] = {k: v for k, v in manifest["records"].items() if k in wanted}
+    manifest["config_fingerprint"] = config_fingerprint(config)
 
-    # Step 3: Save the consolidated metadata to a single JSON file
-    metadata_path = output_dir / config.METADATA_FILENAME
-    logger.info(f"Saving metadata for {len(all_metadata)} total beats to {metadata_path}...")
-    try:
-        # Sort metadata to ensure a consistent and readable order
-        all_metadata.sort(key=lambda x: (x['record_name'], x['beat_index']))
-        with open(metadata_path, 'w') as f:
-            json.dump(all_metadata, f, indent=4)
-        logger.info("Metadata file saved successfully.")
-    except IOError as e:
-        logger.error(f"Could not write metadata file: {e}")
+    # Step 4: Save the merged metadata to a single JSON file, then the manifest
+    num_beats = sum(len(labels) for labels, _ in all_beats.values())
+    save_index_files(output_dir, all_beats, manifest, config)
+
+    # Step 5: Move the new per-record files into the consolidated store used by the loaders
+    consolidate_records(output_dir, all_beats, config)
 
     end_time = time.time()
     logger.info(f"--- Preprocessing Complete in {end_time - start_time:.2f} seconds ---")
+    return {"processed_records": sorted(reprocessed), "num_beats": num_beats, "elapsed": end_time - start_time,
+            "worker_seconds": worker_seconds, "conditioning_seconds": conditioning_seconds}
+
+def parse_scale_spec(text: str) -> List[float]:
+    """
+    Parses a wavelet scale list given as 'start:stop:step' (stop included) or as
+    comma-separated values. Integral scales are returned as ints, so '1:32:1'
+    fingerprints the same as the default range(1, 33).
+    """
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        values = np.arange(start, stop + step / 2, step)
+    else:
+        values = np.array([float(part) for part in text.split(',')])
+    if values.size == 0 or np.any(values <= 0):
+        raise ValueError(f"Invalid wavelet scale specification '{text}'.")
+    return [int(v) if float(v).is_integer() else round(float(v), 6) for v in values]
+
+def main():
+    """Main execution function for the parallel HDF5 preprocessing pipeline."""
+    parser = argparse.ArgumentParser(description="Compute raw-signal scalograms and store them as HDF5 files.")
+    parser.add_argument('--force', action='store_true', help='Ignore the manifest and rebuild every record.')
+    parser.add_argument('--chunk-beats', type=int, default=Config.H5_CHUNK_BEATS, help='Beats per HDF5 chunk (default: contiguous; 128 with --compression).')
+    parser.add_argument('--compression', type=str, default=Config.H5_COMPRESSION or 'none', choices=['none', 'gzip', 'lzf', 'blosc'], help='HDF5 compression filter.')
+    parser.add_argument('--compression-opts', type=int, default=Config.H5_COMPRESSION_OPTS, help='gzip level or Blosc clevel.')
+    parser.add_argument('--float16', action='store_true', help='Store scalograms as float16 instead of float32.')
+    parser.add_argument('--stream-segment-seconds', type=float, default=Config.STREAM_SEGMENT_SECONDS,
+                        help='Stream each record in segments of this many seconds (bounded memory for long recordings).')
+    parser.add_argument('--workers', type=int, default=Config.NUM_WORKERS, help='Number of worker processes (default: derived from CPU/memory limits).')
+    parser.add_argument('--raw-beats', action='store_true',
+                        help='Store raw beat windows only; scalograms are computed by the data loader.')
+    parser.add_argument('--highpass-hz', type=float, default=Config.CONDITIONING_HIGHPASS_HZ,
+                        help='Zero-phase high-pass cutoff for baseline-wander removal (e.g. 0.5; default: off).')
+    parser.add_argument('--lowpass-hz', type=float, default=Config.CONDITIONING_LOWPASS_HZ,
+                        help='Zero-phase low-pass cutoff; with --highpass-hz this forms a band-pass (e.g. 45).')
+    parser.add_argument('--wavelet-scales', type=str, default=None,
+                        help="Scales to compute, e.g. '1:64:0.5' (a superset that training configs can subset) or '1,2,4,8'.")
+    args = parser.parse_args()
+
+    setup_logging()
+    config = Config()
+    config.H5_CHUNK_BEATS = args.chunk_beats or None
+    config.H5_COMPRESSION = None if args.compression == 'none' else args.compression
+    config.H5_COMPRESSION_OPTS = args.compression_opts
+    config.H5_STORAGE_DTYPE = 'float16' if args.float16 else Config.H5_STORAGE_DTYPE
+    config.STREAM_SEGMENT_SECONDS = args.stream_segment_seconds
+    config.NUM_WORKERS = args.workers
+    config.STORE_RAW_BEATS = args.raw_beats
+    config.CONDITIONING_HIGHPASS_HZ = args.highpass_hz
+    config.CONDITIONING_LOWPASS_HZ = args.lowpass_hz
+    if args.wavelet_scales:
+        config.WAVELET_SCALES = parse_scale_spec(args.wavelet_scales)
+    run_preprocessing(config, force=args.force)
 
 if __name__ == "__main__":
     # Ensure the script is runnable from the command line
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,145 @@
+# quantization_report.py (Quantized Storage Report)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Checks what the TFRecord storage dtypes cost (see
+# create_batched_tfrecords.TFRECORD_STORAGE_DTYPE). The storage part quantizes
+# the preprocessed scalograms with every dtype/granularity, exactly as the
+# converter does, and reports bytes per beat and the reconstruction error. The
+# accuracy part compares the raw_predictions.npz of a run trained on quantized
+# TFRecords with a float32 baseline (e.g. one of Research_Runs/final_run_*) and
+# reports accuracy, F1 and AUC deltas.
+#
+# Usage:
+#   python quantization_report.py --preprocessed-dir preprocessed_data_h5_raw
+#   python quantization_report.py --baseline Research_Runs/final_run_Main_Model_20250824_154136/raw_predictions.npz \
+#       --candidate Research_Runs/final_run_Main_Model_<uint8 run>/raw_predictions.npz
+
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.metrics import f1_score, recall_score, roc_auc_score
+
+from create_batched_tfrecords import list_input_records, load_record_arrays
+from tfrecord_layout import QUANTIZATION_MODES, STORAGE_DTYPES, dequantize_beats, is_quantized, quantize_beats
+
+logger = logging.getLogger(__name__)
+
+CLASS_NAMES = ["Normal", "SVEB", "VEB", "Fusion", "Unknown"]
+
+
+def storage_modes() -> List[Tuple[str, Optional[str]]]:
+    """Every (storage dtype, quantization) combination the converter supports."""
+    modes = []
+    for storage_dtype in STORAGE_DTYPES:
+        if is_quantized(storage_dtype):
+            modes.extend((storage_dtype, quantization) for quantization in QUANTIZATION_MODES)
+        else:
+            modes.append((storage_dtype, None))
+    return modes
+
+
+def storage_report(preprocessed_dir: Path, max_records: Optional[int] = None) -> List[Dict[str, float]]:
+    """
+    Quantizes each record's scalograms per mode and accumulates the error against
+    float32. nrmse is the RMSE divided by the standard deviation of the data;
+    max_rel_error is the largest absolute error relative to the data range.
+    """
+    listing = list_input_records(preprocessed_dir)
+    if listing is None:
+        raise FileNotFoundError(f"No preprocessed records found in {preprocessed_dir}.")
+    record_names, _, metadata_map = listing
+    record_names = record_names[:max_records] if max_records else record_names
+
+    modes = storage_modes()
+    squared_error = np.zeros(len(modes))
+    max_error = np.zeros(len(modes))
+    total, total_sq, count, low, high = 0.0, 0.0, 0, np.inf, -np.inf
+    for rec_name in record_names:
+        scalograms, _ = load_record_arrays(rec_name, metadata_map.get(rec_name), preprocessed_dir)
+        scalograms = np.asarray(scalograms, dtype=np.float32)
+        if scalograms.shape[0] == 0:
+            continue
+        total += float(scalograms.sum(dtype=np.float64))
+        total_sq += float(np.square(scalograms, dtype=np.float64).sum())
+        count += scalograms.size
+        low, high = min(low, float(scalograms.min())), max(high, float(scalograms.max()))
+        for i, (storage_dtype, quantization) in enumerate(modes):
+            restored = dequantize_beats(*quantize_beats(scalograms, storage_dtype, quantization or 'scale'))
+            error = restored - scalograms
+            squared_error[i] += float(np.square(error, dtype=np.float64).sum())
+            max_error[i] = max(max_error[i], float(np.abs(error).max()))
+
+    std = np.sqrt(max(total_sq / count - (total / count) ** 2, 0.0))
+    return [{"storage_dtype": storage_dtype, "quantization": quantization or '-',
+             "bytes_per_value": np.dtype(storage_dtype).itemsize,
+             "nrmse": np.sqrt(squared_error[i] / count) / std,
+             "max_rel_error": max_error[i] / (high - low)}
+            for i, (storage_dtype, quantization) in enumerate(modes)]
+
+
+def prediction_metrics(path: Path) -> Dict[str, object]:
+    """Accuracy, macro/weighted F1, per-class recall and mean one-vs-rest AUC of a raw_predictions.npz."""
+    with np.load(path) as data:
+        y_true = data["y_true"].astype(int)
+        probs = data["y_pred_probs"].astype(np.float64)
+    preds = np.argmax(probs, axis=1)
+    classes = list(range(probs.shape[1]))
+    present = [c for c in classes if np.any(y_true == c)]
+    aucs = [roc_auc_score(y_true == c, probs[:, c]) for c in present if np.any(y_true != c)]
+    return {
+        "y_true": y_true,
+        "preds": preds,
+        "accuracy": float(np.mean(preds == y_true)),
+        "macro_f1": float(f1_score(y_true, preds, labels=classes, average='macro', zero_division=0)),
+        "weighted_f1": float(f1_score(y_true, preds, labels=classes, average='weighted', zero_division=0)),
+        "recall": recall_score(y_true, preds, labels=classes, average=None, zero_division=0),
+        "mean_auc": float(np.mean(aucs)) if aucs else float('nan'),
+    }
+
+
+def accuracy_report(baseline: Path, candidate: Path) -> None:
+    """Logs the candidate's metrics next to the baseline's, with deltas."""
+    base, cand = prediction_metrics(baseline), prediction_metrics(candidate)
+    logger.info(f"Baseline:  {baseline}")
+    logger.info(f"Candidate: {candidate}")
+    logger.info(f"{'metric':>16} {'baseline':>9} {'candidate':>10} {'delta':>8}")
+    rows = [(name, base[name], cand[name]) for name in ("accuracy", "macro_f1", "weighted_f1", "mean_auc")]
+    rows += [(f"recall {name}", base["recall"][i], cand["recall"][i])
+             for i, name in enumerate(CLASS_NAMES[:len(base["recall"])])]
+    for name, base_value, cand_value in rows:
+        logger.info(f"{name:>16} {base_value:>9.4f} {cand_value:>10.4f} {cand_value - base_value:>+8.4f}")
+    if np.array_equal(base["y_true"], cand["y_true"]):
+        logger.info(f"Identical predicted class for {np.mean(base['preds'] == cand['preds']):.2%} of the test sequences.")
+    else:
+        logger.warning("The two runs have different test labels or order; per-sequence agreement is not reported.")
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Report the storage and accuracy cost of quantized TFRecords.")
+    parser.add_argument('--preprocessed-dir', type=str, default=None,
+                        help='Preprocessed HDF5 directory for the storage/error report.')
+    parser.add_argument('--max-records', type=int, default=None, help='Limit the storage report to the first N records.')
+    parser.add_argument('--baseline', type=str, default=None, help='raw_predictions.npz of the float32 run.')
+    parser.add_argument('--candidate', type=str, default=None, help='raw_predictions.npz of the quantized run.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-8s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    if not args.preprocessed_dir and not (args.baseline and args.candidate):
+        parser.error("Give --preprocessed-dir and/or both --baseline and --candidate.")
+
+    if args.preprocessed_dir:
+        rows = storage_report(Path(args.preprocessed_dir), args.max_records)
+        logger.info(f"{'dtype':>8} {'quant.':>7} {'size':>6} {'NRMSE':>10} {'max rel err':>12}")
+        for row in rows:
+            logger.info(f"{row['storage_dtype']:>8} {row['quantization']:>7} {row['bytes_per_value'] / 4:>6.0%} "
+                        f"{row['nrmse']:>10.2e} {row['max_rel_error']:>12.2e}")
+    if args.baseline and args.candidate:
+        accuracy_report(Path(args.baseline), Path(args.candidate))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,7 +20,6 @@ import numpy as np
 import tensorflow as tf
 import keras_tuner as kt
 from tqdm import tqdm
-import h5py
 from sklearn.preprocessing import StandardScaler
 import datetime
 import argparse
@@ -30,6 +29,8 @@ from ModelBuilder import ModelBuilder
 from DataLoader import create_dataset, get_all_labels
 from Evaluator import Evaluator # Assumes you are using the corrected version of Evaluator.py
 from HistoryManager import HistoryManager
+from dataset_store import iter_record_scalograms
+from memmap_loader import load_shared_dataset, shared_scaler_stats
 from sklearn.utils.class_weight import compute_class_weight
 
 # --- Configuration (Loaded from file) ---
@@ -99,30 +100,21 @@ def calculate_final_normalization_stats(train_records: list, data_config: dict,
     This is the most critical fix to prevent the OS from killing the process due to high RAM usage.
     """
     logger = logging.getLogger(__name__)
+    if data_config.get("in_memory_dataset", False):
+        # Computed from the shared in-RAM beat array (see memmap_loader.py).
+        return shared_scaler_stats(train_records, data_config)
     scaler = StandardScaler()
-    h5_dir = Path(data_config["preprocessed_dir"])
 
     logger.info("Calculating final normalization statistics in memory-efficient chunks...")
     for rec_name in tqdm(train_records, desc="Calculating Final Scaler Stats"):
-        h5_path = h5_dir / f"{rec_name}.h5"
         try:
-            with h5py.File(h5_path, 'r') as hf:
-                if 'scalograms' not in hf:
-                    continue
-                
-                dataset = hf['scalograms']
-                num_samples = dataset.shape[0]
-
-                # Process the HDF5 dataset in smaller chunks
-                for i in range(0, num_samples, chunk_size):
-                    end_index = min(i + chunk_size, num_samples)
-                    data_chunk = dataset[i:end_index] # Reads only a small part into memory
-                    
-                    reshaped_chunk = data_chunk.reshape(-1, data_chunk.shape[-1])
-                    scaler.partial_fit(reshaped_chunk)
+            # Process the record in smaller chunks (consolidated store or {rec_name}.h5)
+            for data_chunk in iter_record_scalograms(rec_name, data_config, chunk_size):
+                reshaped_chunk = data_chunk.reshape(-1, data_chunk.shape[-1])
+                scaler.partial_fit(reshaped_chunk)
 
         except (IOError, KeyError, FileNotFoundError) as e:
-            logger.warning(f"⚠️ Could not process {h5_path} for scaler stats: {e}")
+            logger.warning(f"⚠️ Could not process record {rec_name} for scaler stats: {e}")
 
     if not hasattr(scaler, 'mean_') or scaler.mean_ is None:
         logger.error("❌ Scaler could not be fitted. Not enough valid training data found.")
@@ -170,6 +162,9 @@ def main():
     train_records = data_splits['kfold_records']
     test_records = data_splits['final_test_records']
     logger.info(f"Using {len(train_records)} records for final training and {len(test_records)} for final testing.")
+    if CONFIG["data"].get("in_memory_dataset", False):
+        # Training and test sets are masks over the same shared in-RAM array.
+        load_shared_dataset(CONFIG["data"])
 
     mean, scale = calculate_final_normalization_stats(train_records, CONFIG["data"])
     if mean is None:
@@ -179,8 +174,11 @@ def main():
     batch_size = args.batch_size if args.batch_size else CONFIG["training"]['batch_size']
     logger.info(f"Using batch size: {batch_size}")
 
-    train_ds = create_dataset(train_records, CONFIG["data"], batch_size, is_training=True, mean=mean, scale=scale)
-    test_ds = create_dataset(test_records, CONFIG["data"], batch_size, is_training=False, mean=mean, scale=scale)
+    # With normalize_in_model the statistics go into the model (and its saved .keras file) instead of the pipeline
+    normalize_in_model = CONFIG["data"].get("normalize_in_model", False)
+    pipeline_mean, pipeline_scale = (None, None) if normalize_in_model else (mean, scale)
+    train_ds = create_dataset(train_records, CONFIG["data"], batch_size, is_training=True, mean=pipeline_mean, scale=pipeline_scale)
+    test_ds = create_dataset(test_records, CONFIG["data"], batch_size, is_training=False, mean=pipeline_mean, scale=pipeline_scale)
     
     # --- FINAL FIX 2: Explicitly repeat the training dataset ---
     train_ds = train_ds.repeat()
@@ -189,6 +187,8 @@ def main():
         scalogram_shape=(len(CONFIG["data"]["wavelet_scales"]), CONFIG["data"]["time_steps_per_beat"]),
         sequence_len=CONFIG["data"]["sequence_len"], num_classes=CONFIG["model"]["num_classes"]
     )
+    if normalize_in_model:
+        model_builder.set_normalization(mean, scale)
     model_functions = {
         "Main_Model": model_builder.build_model,
         "AttentionOnly": model_builder.build_attention_only_model, 
@@ -32,7 +32,8 @@ import shutil   # <-- New import for file operations
 # --- Custom Module Imports ---
 from MainClass import TimeSeriesModel
 from ModelBuilder import ModelBuilder
-from create_batched_tfrecords import main as create_batched_tfrecords
+from create_batched_tfrecords import convert_records, find_outdated_records
+from memmap_loader import load_shared_dataset
 
 # --- 1. CENTRALIZED CONFIGURATION ---
 CONFIG = {
@@ -48,7 +49,24 @@ CONFIG = {
         "sequence_len": 3,
         "time_steps_per_beat": 187,
         "wavelet_scales": list(range(1, 33)),
-        "class_names": ['Normal', 'SVEB', 'VEB', 'Fusion', 'Unknown']
+        "class_names": ['Normal', 'SVEB', 'VEB', 'Fusion', 'Unknown'],
+        # Normalize with a frozen layer inside the model instead of in the tf.data pipeline
+        # (the fold statistics are then saved with the model; see ModelBuilder.set_normalization)
+        "normalize_in_model": False,
+        # Rebatch parsed chunks as tensors and normalize per batch (see DataLoader.batch_native_batches)
+        "batch_native_pipeline": False,
+        "shuffle_buffer_chunks": 8,
+        # Read sequences from a memory-mapped beat array with a global per-epoch shuffle
+        # instead of the TFRecords (see memmap_loader.py; None memmap_dir = preprocessed_dir)
+        "memmap_loader": False,
+        "memmap_dir": None,
+        "memmap_workers": 4,
+        # Load all beats into one shared read-only array in RAM (about 2.6 GB of float32
+        # scalograms for MIT-BIH); datasets, folds and trials then run without disk reads
+        "in_memory_dataset": False,
+        # Local directory for cached parsed/normalized datasets (None disables; see dataset_cache.py)
+        "dataset_cache_dir": None,
+        "dataset_cache_quota_gb": 50
     },
     "model": {
         "num_classes": 5
@@ -107,7 +125,7 @@ def setup_environment(model_name: str):
     return run_timestamp, run_path
 
 def check_data_prerequisites():
-    """Checks for HDF5 data and creates batched TFRecords if they are missing."""
+    """Checks for HDF5 data and creates or updates the batched TFRecords if they are missing or outdated."""
     logger = logging.getLogger(__name__)
     h5_dir = Path(CONFIG["data"]["preprocessed_dir"])
     tfrecord_dir = Path(CONFIG["data"]["tfrecord_dir_batched"])
@@ -116,16 +134,24 @@ def check_data_prerequisites():
         logger.error(f"❌ Critical Error: HDF5 directory '{h5_dir}' is missing. Run 'preprocess_data.py'. Exiting.")
         sys.exit(1)
 
-    if not tfrecord_dir.exists() or not any(tfrecord_dir.iterdir()):
-        logger.warning(f"⚠️ Batched TFRecord directory '{tfrecord_dir}' not found. Creating them now...")
+    # The provenance manifest catches stale or partial conversions, not just a missing directory.
+    outdated = find_outdated_records(h5_dir, tfrecord_dir)
+    if outdated is None:
+        logger.error(f"❌ Critical Error: No record metadata found in '{h5_dir}'. Run 'preprocess_data.py'. Exiting.")
+        sys.exit(1)
+    if outdated:
+        logger.warning(f"⚠️ {len(outdated)} record(s) in '{tfrecord_dir}' are missing or outdated. Updating them now...")
         try:
-            create_batched_tfrecords()
-            logger.info("✅ Successfully created batched TFRecord files.")
+            summary = convert_records(h5_dir, tfrecord_dir)
         except Exception as e:
             logger.error(f"❌ Fatal Error: Failed to create batched TFRecords: {e}. Exiting.", exc_info=True)
             sys.exit(1)
+        if summary is None or summary["failed"]:
+            logger.error("❌ Fatal Error: Some records could not be converted to batched TFRecords. Exiting.")
+            sys.exit(1)
+        logger.info(f"✅ Converted {summary['converted']} record(s) and reused {summary['reused']}.")
     else:
-        logger.info(f"✅ Batched TFRecord data found in '{tfrecord_dir}'.")
+        logger.info(f"✅ Batched TFRecord data in '{tfrecord_dir}' is up to date.")
 
 # --- 3. MAIN EXECUTION BLOCK ---
 def main():
@@ -150,6 +176,9 @@ def main():
 
     logger.info("STEP 1: Checking for required data files...")
     check_data_prerequisites()
+    if CONFIG["data"].get("in_memory_dataset", False):
+        # Load every beat once; the tuning fold and all Hyperband trials share this array.
+        load_shared_dataset(CONFIG["data"])
 
     logger.info(f"STEP 2: All artifacts for this tuning run will be saved in: {run_path}")
 
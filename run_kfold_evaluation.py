@@ -24,7 +24,6 @@ from sklearn.model_selection import KFold
 import keras_tuner as kt
 from sklearn.utils.class_weight import compute_class_weight
 import argparse
-import h5py
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
@@ -33,6 +32,8 @@ import matplotlib.pyplot as plt
 from ModelBuilder import ModelBuilder
 from DataLoader import create_dataset, get_all_labels
 from HistoryManager import HistoryManager
+from dataset_store import iter_record_scalograms
+from memmap_loader import load_shared_dataset, shared_scaler_stats
 
 # --- 1. CENTRALIZED CONFIGURATION (Loaded from file) ---
 # The CONFIG dictionary is intentionally left empty. It will always be
@@ -113,31 +114,22 @@ def calculate_fold_normalization_stats(train_records: list, data_config: dict, c
     """
     from sklearn.preprocessing import StandardScaler
     logger = logging.getLogger(__name__)
+    if data_config.get("in_memory_dataset", False):
+        # Computed from the shared in-RAM beat array (see memmap_loader.py).
+        return shared_scaler_stats(train_records, data_config)
     scaler = StandardScaler()
-    h5_dir = Path(data_config["preprocessed_dir"])
     
     logger.info("Calculating normalization stats in memory-efficient chunks...")
     
     for rec_name in tqdm(train_records, desc="Calculating Fold Scaler Stats", leave=False):
-        h5_path = h5_dir / f"{rec_name}.h5"
         try:
-            with h5py.File(h5_path, 'r') as hf:
-                if 'scalograms' not in hf:
-                    continue
-                
-                dataset = hf['scalograms']
-                num_samples = dataset.shape[0]
-                
-                # Process the HDF5 dataset in smaller chunks to conserve memory
-                for i in range(0, num_samples, chunk_size):
-                    end_index = min(i + chunk_size, num_samples)
-                    data_chunk = dataset[i:end_index]
-                    
-                    reshaped_chunk = data_chunk.reshape(-1, data_chunk.shape[-1])
-                    scaler.partial_fit(reshaped_chunk)
+            # Process the record in smaller chunks to conserve memory
+            for data_chunk in iter_record_scalograms(rec_name, data_config, chunk_size):
+                reshaped_chunk = data_chunk.reshape(-1, data_chunk.shape[-1])
+                scaler.partial_fit(reshaped_chunk)
 
         except (IOError, KeyError, FileNotFoundError) as e:
-            logger.warning(f"⚠️ Could not process {h5_path} for scaler stats: {e}")
+            logger.warning(f"⚠️ Could not process record {rec_name} for scaler stats: {e}")
             
     if not hasattr(scaler, 'mean_') or scaler.mean_ is None:
         logger.error("❌ Scaler could not be fitted. Not enough valid training data found.")
@@ -212,6 +204,9 @@ def main():
     kfold_records = np.array(data_splits["kfold_records"])
     logger.info(f"STEP 3: Using {len(kfold_records)} records designated for K-Fold evaluation.")
     kfold = KFold(n_splits=CONFIG["training"]["k_folds"], shuffle=True, random_state=seed)
+    if CONFIG["data"].get("in_memory_dataset", False):
+        # Every fold reads the same shared array; folds are masks over its records.
+        load_shared_dataset(CONFIG["data"])
     
     with open(run_path / "evaluation_run_config.json", "w") as f: json.dump(CONFIG, f, indent=4)
 
@@ -232,7 +227,10 @@ def main():
     all_fold_results = []
     best_fold_accuracy = 0.0
     best_fold_model_weights = None
+    best_fold_stats = None
     best_fold_num = -1
+    # Bake each fold's statistics into its model instead of normalizing in the input pipeline
+    normalize_in_model = CONFIG["data"].get("normalize_in_model", False)
 
     for fold_num, (train_indices, val_indices) in enumerate(kfold.split(kfold_records), 1):
         logger.info(f"🚀 ========== STARTING FOLD {fold_num}/{CONFIG['training']['k_folds']} ==========")
@@ -241,13 +239,17 @@ def main():
 
         try:
             tf.keras.backend.clear_session()
-            model = selected_model_builder_func(best_hps)
-            
             mean, scale = calculate_fold_normalization_stats(train_records_fold, CONFIG["data"])
             if mean is None:
                 logger.error(f"Skipping fold {fold_num} due to normalization error.")
                 continue
-                
+            fold_stats = (mean, scale)
+            if normalize_in_model:
+                model_builder.set_normalization(mean, scale)
+                mean, scale = None, None
+
+            model = selected_model_builder_func(best_hps)
+
             train_ds = create_dataset(train_records_fold, CONFIG["data"], CONFIG['training']['batch_size'], is_training=True, mean=mean, scale=scale)
             val_ds = create_dataset(val_records_fold, CONFIG["data"], CONFIG['training']['batch_size'], is_training=False, mean=mean, scale=scale)
 
@@ -290,6 +292,7 @@ def main():
             if val_accuracy > best_fold_accuracy:
                 best_fold_accuracy = val_accuracy
                 best_fold_model_weights = model.get_weights()
+                best_fold_stats = fold_stats
                 best_fold_num = fold_num
                 logger.info(f"🎉 New best model found in fold {fold_num} with accuracy: {val_accuracy:.4f}")
 
@@ -300,6 +303,8 @@ def main():
     if best_fold_model_weights:
         logger.info(f"Saving the best model from fold {best_fold_num}...")
         tf.keras.backend.clear_session()
+        if normalize_in_model:
+            model_builder.set_normalization(*best_fold_stats)
         best_model = selected_model_builder_func(best_hps)
         best_model.set_weights(best_fold_model_weights)
         best_model.save(run_path / f"best_kfold_model_{model_name_to_eval}.keras")
@@ -0,0 +1,237 @@
+# scalogram_store.py (HDF5 Scalogram Layout)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Central place for how scalograms are laid out inside HDF5 files:
+# contiguous or chunked along the beat axis, the compression filter (gzip, lzf or Blosc when the optional
+# hdf5plugin package is installed) and the storage dtype (float32 or float16).
+# Readers always get float32 back, whatever the on-disk dtype is.
+#
+# The wavelet scales of the rows are stored as an attribute of the dataset, so a
+# file computed with a superset of scales (e.g. 1-64 in steps of 0.5) can serve
+# any subset: resolve_scale_rows maps a requested scale list to row indices.
+#
+# Files can instead hold only the raw beat windows (RAW_BEAT_DATASET, 32x smaller
+# than 32-scale scalograms) together with the wavelet and scales to apply. The
+# loader then computes the scalograms on the fly; NumPy readers go through
+# raw_beat_scalograms, which uses the same batched CWT as preprocessing.
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import h5py
+import numpy as np
+
+from cwt_engine import batched_cwt
+
+try:
+    # Importing hdf5plugin registers the Blosc filter with HDF5. It is optional:
+    # without it, Blosc layouts fall back to gzip on write and cannot be read.
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+logger = logging.getLogger(__name__)
+
+SCALOGRAM_DATASET = "scalograms"
+SUPPORTED_COMPRESSION = (None, 'gzip', 'lzf', 'blosc')
+SUPPORTED_STORAGE_DTYPES = ('float32', 'float16')
+SCALES_ATTR = "wavelet_scales"
+RAW_BEAT_DATASET = "beats"
+# Chunk size used when a layout needs chunks but sets none (compressed or
+# resizable datasets). Per-beat chunks make the usual 128-beat reads ~2x slower.
+DEFAULT_CHUNK_BEATS = 128
+WAVELET_ATTR = "wavelet"
+# What a file (or TFRecord directory) stores per beat.
+SCALOGRAM_REPRESENTATION = "scalogram"
+RAW_REPRESENTATION = "raw"
+
+
+def blosc_available() -> bool:
+    """Returns True if the Blosc HDF5 filter can be used in this environment."""
+    return hdf5plugin is not None
+
+
+def compression_kwargs(compression: Optional[str], compression_opts: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Translates a compression name into h5py.create_dataset keyword arguments.
+    'blosc' falls back to gzip with a warning when hdf5plugin is not installed.
+    """
+    if compression not in SUPPORTED_COMPRESSION:
+        raise ValueError(f"Unsupported HDF5 compression '{compression}'. Choose one of {SUPPORTED_COMPRESSION}.")
+    if compression is None:
+        return {}
+    if compression == 'lzf':
+        return {"compression": 'lzf'}
+    if compression == 'gzip':
+        return {"compression": 'gzip', "compression_opts": 4 if compression_opts is None else compression_opts}
+    if not blosc_available():
+        logger.warning("Blosc requested but 'hdf5plugin' is not installed. Falling back to gzip.")
+        return compression_kwargs('gzip', None)
+    clevel = 5 if compression_opts is None else compression_opts
+    return dict(hdf5plugin.Blosc(cname='lz4', clevel=clevel, shuffle=hdf5plugin.Blosc.SHUFFLE))
+
+
+def scalogram_dataset_kwargs(
+    beat_shape: Tuple[int, ...],
+    chunk_beats: Optional[int] = None,
+    compression: Optional[str] = None,
+    compression_opts: Optional[int] = None,
+    storage_dtype: str = 'float32'
+) -> Dict[str, Any]:
+    """
+    Builds the create_dataset keyword arguments for a scalogram dataset whose
+    individual beats have shape beat_shape. chunk_beats=None keeps the
+    contiguous layout; compressed datasets are then chunked by DEFAULT_CHUNK_BEATS.
+    """
+    if storage_dtype not in SUPPORTED_STORAGE_DTYPES:
+        raise ValueError(f"Unsupported storage dtype '{storage_dtype}'. Choose one of {SUPPORTED_STORAGE_DTYPES}.")
+    kwargs = {"dtype": np.dtype(storage_dtype)}
+    if chunk_beats is None and compression is not None:
+        chunk_beats = DEFAULT_CHUNK_BEATS
+    if chunk_beats is not None:
+        kwargs["chunks"] = (chunk_beats,) + tuple(beat_shape)
+    kwargs.update(compression_kwargs(compression, compression_opts))
+    return kwargs
+
+
+def layout_from_config(config: Any) -> Dict[str, Any]:
+    """Extracts the layout settings from a preprocessing Config object."""
+    return {
+        "chunk_beats": config.H5_CHUNK_BEATS,
+        "compression": config.H5_COMPRESSION,
+        "compression_opts": config.H5_COMPRESSION_OPTS,
+        "storage_dtype": config.H5_STORAGE_DTYPE,
+    }
+
+
+def create_scalogram_dataset(
+    hf: h5py.File,
+    beat_shape: Tuple[int, ...],
+    layout: Dict[str, Any],
+    num_beats: Optional[int] = None,
+    scales: Optional[Sequence[float]] = None,
+    wavelet: Optional[str] = None,
+    name: str = SCALOGRAM_DATASET
+) -> h5py.Dataset:
+    """
+    Creates the scalogram dataset in an open file. With num_beats=None the dataset
+    starts empty and is resizable along the beat axis, so it can be appended to
+    segment by segment (resizable datasets are always chunked, by DEFAULT_CHUNK_BEATS
+    unless the layout sets a size). The wavelet scales
+    of the rows and the wavelet are recorded when given. name=RAW_BEAT_DATASET
+    creates a raw beat window dataset instead (beat_shape is then (n_samples,)).
+    """
+    layout = dict(layout)
+    if num_beats is None and layout.get("chunk_beats") is None:
+        layout["chunk_beats"] = DEFAULT_CHUNK_BEATS
+    kwargs = scalogram_dataset_kwargs(beat_shape, **layout)
+    if "chunks" in kwargs and num_beats is not None:
+        kwargs["chunks"] = (min(kwargs["chunks"][0], max(1, num_beats)),) + kwargs["chunks"][1:]
+    if num_beats is None:
+        dataset = hf.create_dataset(name, shape=(0,) + tuple(beat_shape),
+                                    maxshape=(None,) + tuple(beat_shape), **kwargs)
+    else:
+        dataset = hf.create_dataset(name, shape=(num_beats,) + tuple(beat_shape), **kwargs)
+    if scales is not None:
+        dataset.attrs[SCALES_ATTR] = np.asarray(scales, dtype=np.float64)
+    if wavelet is not None:
+        dataset.attrs[WAVELET_ATTR] = wavelet
+    return dataset
+
+
+def append_scalograms(dataset: h5py.Dataset, scalograms: np.ndarray) -> None:
+    """Appends a block of scalograms to a resizable dataset."""
+    if len(scalograms) == 0:
+        return
+    start = dataset.shape[0]
+    dataset.resize(start + len(scalograms), axis=0)
+    dataset[start:] = scalograms.astype(dataset.dtype, copy=False)
+
+
+def write_scalograms(
+    output_path: Path,
+    scalograms: np.ndarray,
+    layout: Dict[str, Any],
+    scales: Optional[Sequence[float]] = None,
+    wavelet: Optional[str] = None,
+    name: str = SCALOGRAM_DATASET
+) -> None:
+    """
+    Writes a (n_beats, n_scales, n_samples) scalogram array using the given layout
+    (or a (n_beats, n_samples) array of raw beat windows with name=RAW_BEAT_DATASET).
+    """
+    with h5py.File(output_path, 'w') as hf:
+        dataset = create_scalogram_dataset(hf, scalograms.shape[1:], layout, num_beats=len(scalograms),
+                                           scales=scales, wavelet=wavelet, name=name)
+        dataset[...] = scalograms.astype(dataset.dtype, copy=False)
+
+
+def read_scalograms(dataset: h5py.Dataset, selection: Any = slice(None)) -> np.ndarray:
+    """Reads a selection from a scalogram dataset and returns it as float32."""
+    return np.asarray(dataset[selection], dtype=np.float32)
+
+
+def beat_dataset(hf: h5py.File) -> h5py.Dataset:
+    """Returns the scalogram dataset of an open file, or its raw beat window dataset. Raises KeyError if it has neither."""
+    if SCALOGRAM_DATASET in hf:
+        return hf[SCALOGRAM_DATASET]
+    return hf[RAW_BEAT_DATASET]
+
+
+def stored_representation(dataset: h5py.Dataset) -> str:
+    """RAW_REPRESENTATION for a raw beat window dataset, SCALOGRAM_REPRESENTATION otherwise."""
+    return RAW_REPRESENTATION if dataset.name.rsplit('/', 1)[-1] == RAW_BEAT_DATASET else SCALOGRAM_REPRESENTATION
+
+
+def stored_wavelet(dataset: h5py.Dataset) -> Optional[str]:
+    """Returns the wavelet recorded with a dataset, or None."""
+    wavelet = dataset.attrs.get(WAVELET_ATTR)
+    return wavelet.decode('utf-8') if isinstance(wavelet, bytes) else wavelet
+
+
+def raw_beat_scalograms(
+    dataset: h5py.Dataset,
+    beats: np.ndarray,
+    scales: Optional[Sequence[float]] = None
+) -> np.ndarray:
+    """
+    Computes the scalograms of raw beat windows read from a raw beat dataset, with
+    the wavelet recorded on the dataset and the given scales (default: the
+    recorded ones). Any scale can be requested, not only the recorded ones.
+    """
+    scales = stored_scales(dataset) if scales is None else scales
+    wavelet = stored_wavelet(dataset)
+    if scales is None or wavelet is None:
+        raise ValueError(f"Raw beat dataset {dataset.name} does not record its wavelet and scales.")
+    return batched_cwt(beats, scales, wavelet)
+
+
+def stored_scales(dataset: h5py.Dataset) -> Optional[np.ndarray]:
+    """Returns the wavelet scales of a scalogram dataset's rows, or None for files written before they were recorded."""
+    scales = dataset.attrs.get(SCALES_ATTR)
+    return None if scales is None else np.asarray(scales, dtype=np.float64)
+
+
+def resolve_scale_rows(
+    available: Optional[Sequence[float]],
+    requested: Optional[Sequence[float]]
+) -> Optional[np.ndarray]:
+    """
+    Returns the row indices of the requested scales within the available ones, or
+    None when no selection is needed (nothing requested, the available scales are
+    unknown, or both lists are the same). Raises ValueError when a requested scale
+    was not computed.
+    """
+    if requested is None or available is None:
+        return None
+    available = np.asarray(available, dtype=np.float64)
+    requested = np.asarray(requested, dtype=np.float64)
+    if available.shape == requested.shape and np.allclose(available, requested):
+        return None
+    matches = np.isclose(requested[:, None], available[None, :])
+    missing = requested[~matches.any(axis=1)]
+    if missing.size:
+        raise ValueError(f"Scales {missing.tolist()} are not in the stored scale set "
+                         f"({available.min():g}-{available.max():g}, {available.size} scales).")
+    return matches.argmax(axis=1)
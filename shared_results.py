@@ -0,0 +1,81 @@
+# shared_results.py (Shared-Memory Result Transport)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Moves the per-beat label and R-peak arrays of a processed record
+# from a preprocessing worker to the parent through a multiprocessing.shared_memory
+# block. The worker only returns a small summary (block name and beat count), so
+# the pickled result no longer grows with the number of beats, and the parent
+# copies the arrays straight into its compact per-record index.
+
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype(np.int64)
+LABEL_DTYPE = np.dtype(np.int8)
+
+
+def _views(buffer, num_beats: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (labels, samples) views into a block laid out as samples followed by labels."""
+    samples = np.ndarray((num_beats,), dtype=SAMPLE_DTYPE, buffer=buffer)
+    labels = np.ndarray((num_beats,), dtype=LABEL_DTYPE, buffer=buffer, offset=num_beats * SAMPLE_DTYPE.itemsize)
+    return labels, samples
+
+
+def start_transport() -> None:
+    """
+    Call in the parent before the worker pool is created. Starting the resource
+    tracker first makes the workers share it, so blocks created by a worker and
+    unlinked by the parent are tracked by one process (and cleaned up if the
+    parent dies before collecting them) instead of being reported as leaked by
+    a per-worker tracker.
+    """
+    resource_tracker.ensure_running()
+
+
+def export_beats(labels: np.ndarray, samples: np.ndarray) -> Dict[str, Any]:
+    """
+    Worker side: copies a record's beat arrays into a new shared-memory block and
+    returns the summary to send back. The block stays alive until the parent
+    calls import_beats (or discard_beats) on the summary.
+    """
+    num_beats = len(labels)
+    if num_beats == 0:
+        return {"shm_name": None, "num_beats": 0}
+    block = shared_memory.SharedMemory(create=True, size=num_beats * (SAMPLE_DTYPE.itemsize + LABEL_DTYPE.itemsize))
+    try:
+        shm_labels, shm_samples = _views(block.buf, num_beats)
+        shm_labels[:] = labels
+        shm_samples[:] = samples
+        del shm_labels, shm_samples
+    finally:
+        block.close()
+    return {"shm_name": block.name, "num_beats": num_beats}
+
+
+def import_beats(summary: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Parent side: copies the beat arrays out of the summary's block and frees the block."""
+    num_beats = summary["num_beats"]
+    if not summary["shm_name"]:
+        return np.zeros(0, dtype=LABEL_DTYPE), np.zeros(0, dtype=SAMPLE_DTYPE)
+    block = shared_memory.SharedMemory(name=summary["shm_name"])
+    try:
+        shm_labels, shm_samples = _views(block.buf, num_beats)
+        labels, samples = shm_labels.copy(), shm_samples.copy()
+        del shm_labels, shm_samples
+    finally:
+        block.close()
+        block.unlink()
+    return labels, samples
+
+
+def discard_beats(summary: Optional[Dict[str, Any]]) -> None:
+    """Frees the block of a summary whose arrays are not needed (e.g. a failed split record)."""
+    if summary and summary["shm_name"]:
+        try:
+            block = shared_memory.SharedMemory(name=summary["shm_name"])
+        except FileNotFoundError:
+            return
+        block.close()
+        block.unlink()
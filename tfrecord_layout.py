@@ -0,0 +1,347 @@
+# tfrecord_layout.py (Beat-Level TFRecord Layout)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Shared description of the TFRecord files written by
+# create_batched_tfrecords.py and read by DataLoader.create_dataset. Every beat
+# is stored once, in chunks of consecutive beats of one record; sequences of any
+# length are assembled at load time by a per-record windowing stage. A small
+# JSON sidecar records the layout, the scalogram shape and the beat count of
+# each record. Directories without the sidecar hold the legacy layout with one
+# pre-windowed sequence per example.
+#
+# The beats_raw payload can be compressed with GZIP or ZLIB. Compression is
+# applied per example rather than to the whole TFRecord stream, so the framing
+# stays uncompressed and byte offsets into a shard remain seekable; readers
+# decompress with tf.io.decode_compressed.
+#
+# Beats can also be stored as float16, or quantized to uint8/uint16 with a
+# linear scale and offset per record or per wavelet scale (quant_scale and
+# quant_offset features, one float32 value per scale row). The loader
+# dequantizes in its normalization map.
+#
+# The sidecar also lists the wavelet scales of the scalogram rows. When they are
+# a superset, the loader keeps only the rows of the scales a training config asks for.
+# For raw-beat directories (representation 'raw') each beat is one row holding
+# the raw window, and the loader computes the scalograms with the recorded
+# wavelet and scales after parsing.
+#
+# Examples are packed into fixed-size shards independent of record boundaries.
+# A sidecar offset index (tfrecord_index.npz) stores, per example, its shard,
+# byte offset, position in the shard, record and first beat, so a reader can
+# seek straight to any record's examples without scanning whole files.
+
+import gzip
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+LAYOUT_FILENAME = "tfrecord_layout.json"
+INDEX_FILENAME = "tfrecord_index.npz"
+SHARD_PATTERN = "shard-{:05d}.tfrecord"
+BEAT_LAYOUT = "beats"
+SEQUENCE_LAYOUT = "sequences"
+
+# Feature keys of one beat-chunk example. beats_raw holds num_in_batch
+# scalograms (or raw beat windows with height 1) of shape (height, width) in the layout's storage dtype (float32 by
+# default); labels_raw holds their int32 labels. Quantized layouts add
+# QUANTIZATION_FEATURES.
+BEAT_FEATURES = ('num_in_batch', 'height', 'width', 'beats_raw', 'labels_raw')
+QUANTIZATION_FEATURES = ('quant_scale', 'quant_offset')
+
+# Payload compression modes, named as tf.io.decode_compressed expects them.
+COMPRESSION_MODES = (None, 'ZLIB', 'GZIP')
+# Storage dtypes of beats_raw. Integer dtypes are quantized.
+STORAGE_DTYPES = ('float32', 'float16', 'uint16', 'uint8')
+QUANTIZATION_MODES = ('record', 'scale')
+
+
+def is_quantized(storage_dtype: str) -> bool:
+    return np.dtype(storage_dtype).kind == 'u'
+
+
+def scalogram_bounds(chunks: Iterable[np.ndarray]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """Per-scale minimum and maximum over chunks of scalograms (n_beats, height, width), in one streaming pass."""
+    low = high = None
+    for chunk in chunks:
+        if chunk.shape[0] == 0:
+            continue
+        chunk_low, chunk_high = chunk.min(axis=(0, 2)), chunk.max(axis=(0, 2))
+        low = chunk_low if low is None else np.minimum(low, chunk_low)
+        high = chunk_high if high is None else np.maximum(high, chunk_high)
+    return low, high
+
+
+def quantization_params(
+    low: np.ndarray,
+    high: np.ndarray,
+    storage_dtype: str,
+    quantization: str = 'scale'
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the float32 (scale, offset) per scale row that map the code range of
+    an integer storage dtype onto [low, high] of each scale ('scale') or of the
+    whole record ('record'), so value = code * scale + offset.
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unsupported quantization '{quantization}'. Choose one of {QUANTIZATION_MODES}.")
+    if quantization == 'record':
+        low, high = np.full_like(low, low.min()), np.full_like(high, high.max())
+    levels = np.iinfo(storage_dtype).max
+    scale = np.where(high > low, (high - low) / levels, 1.0).astype(np.float32)
+    return scale, np.asarray(low, dtype=np.float32)
+
+
+def encode_beats(
+    scalograms: np.ndarray,
+    storage_dtype: str,
+    scale: Optional[np.ndarray] = None,
+    offset: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Converts float32 scalograms to the storage dtype, quantizing with (scale, offset) for integer dtypes."""
+    if scale is None:
+        return scalograms.astype(storage_dtype)
+    codes = np.rint((scalograms - offset[None, :, None]) / scale[None, :, None])
+    return np.clip(codes, 0, np.iinfo(storage_dtype).max).astype(storage_dtype)
+
+
+def quantize_beats(
+    scalograms: np.ndarray,
+    storage_dtype: str = 'float32',
+    quantization: str = 'scale'
+) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Converts a whole record's float32 scalograms (n_beats, height, width) to the
+    storage dtype. Integer dtypes use the full code range between the minimum and
+    maximum of the record or of each scale row (see quantization_params).
+    Returns (stored array, scale, offset); scale and offset are None for float dtypes.
+    """
+    if storage_dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported storage dtype '{storage_dtype}'. Choose one of {STORAGE_DTYPES}.")
+    if not is_quantized(storage_dtype):
+        return encode_beats(scalograms, storage_dtype), None, None
+    scale, offset = quantization_params(*scalogram_bounds([scalograms]), storage_dtype, quantization)
+    return encode_beats(scalograms, storage_dtype, scale, offset), scale, offset
+
+
+def dequantize_beats(stored: np.ndarray, scale: Optional[np.ndarray], offset: Optional[np.ndarray]) -> np.ndarray:
+    """Inverse of quantize_beats (NumPy version of the loader's dequantization)."""
+    values = stored.astype(np.float32)
+    if scale is None:
+        return values
+    return values * scale[None, :, None] + offset[None, :, None]
+
+
+def compress_payload(payload: bytes, compression: Optional[str], level: int = 6) -> bytes:
+    """Compresses one example payload in a format tf.io.decode_compressed can read."""
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unsupported TFRecord compression '{compression}'. Choose one of {COMPRESSION_MODES}.")
+    if compression == 'ZLIB':
+        return zlib.compress(payload, level)
+    if compression == 'GZIP':
+        return gzip.compress(payload, compresslevel=level, mtime=0)
+    return payload
+
+
+def write_layout(
+    output_dir: Path,
+    height: int,
+    width: int,
+    record_beats: Dict[str, int],
+    shard_names: Optional[Sequence[str]] = None,
+    compression: Optional[str] = None,
+    storage_dtype: str = 'float32',
+    quantization: Optional[str] = None,
+    wavelet_scales: Optional[Sequence[float]] = None,
+    representation: str = 'scalogram',
+    wavelet: Optional[str] = None
+) -> Path:
+    """Writes the layout sidecar for a directory of beat-level TFRecord files."""
+    layout = {
+        "layout": BEAT_LAYOUT,
+        "height": int(height),
+        "width": int(width),
+        "compression": compression,
+        "storage_dtype": storage_dtype,
+        "quantization": quantization if is_quantized(storage_dtype) else None,
+        "representation": representation,
+        "wavelet": wavelet,
+        "wavelet_scales": None if wavelet_scales is None else [float(scale) for scale in wavelet_scales],
+        "records": {rec: int(n) for rec, n in sorted(record_beats.items())},
+    }
+    if shard_names is not None:
+        layout["shards"] = list(shard_names)
+        layout["index"] = INDEX_FILENAME
+    path = Path(output_dir) / LAYOUT_FILENAME
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(layout, f, indent=4)
+    tmp_path.replace(path)
+    return path
+
+
+def read_layout(tfrecord_dir: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Returns the layout sidecar of a TFRecord directory, or None for the legacy sequence layout."""
+    path = Path(tfrecord_dir) / LAYOUT_FILENAME
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def iter_tfrecord_frames(path: Path) -> Iterator[bytes]:
+    """
+    Yields the raw frames (length, length CRC, payload, payload CRC) of a TFRecord
+    file one at a time. Frames can be concatenated into another valid TFRecord file.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(12)
+            if not header:
+                return
+            if len(header) < 12:
+                raise IOError(f"Truncated TFRecord header in {path}")
+            length = struct.unpack('<Q', header[:8])[0]
+            body = f.read(length + 4)
+            if len(body) < length + 4:
+                raise IOError(f"Truncated TFRecord payload in {path}")
+            yield header + body
+
+
+def build_shards(
+    record_frames: Sequence[Tuple[str, Iterable[bytes], int]],
+    output_dir: Path,
+    shard_size_bytes: int,
+    beats_per_example: int
+) -> List[str]:
+    """
+    Packs the examples of each record, given as (record, frames, num_beats) in
+    record order, into shards of about shard_size_bytes (a new shard starts at the
+    first example boundary past the limit) and writes the offset index. frames
+    are raw TFRecord frames, e.g. iter_tfrecord_frames of a per-record file or
+    ShardIndex.iter_record_frames of a previous build. Shards replace files of
+    the same name only once all of them are written. Returns the shard file names.
+    """
+    output_dir = Path(output_dir)
+    columns: Dict[str, List[int]] = {
+        "example_shard": [], "example_offset": [], "example_position": [],
+        "example_record": [], "example_first_beat": [], "example_num_beats": []
+    }
+    record_names, record_examples = [], [0]
+    shard_names: List[str] = []
+    shard_file, shard_bytes, shard_examples = None, 0, 0
+
+    try:
+        for rec_id, (rec_name, frames, num_beats) in enumerate(record_frames):
+            record_names.append(rec_name)
+            for i, frame in enumerate(frames):
+                if shard_file is None or shard_bytes >= shard_size_bytes:
+                    if shard_file is not None:
+                        shard_file.close()
+                    shard_names.append(SHARD_PATTERN.format(len(shard_names)))
+                    shard_file = open(output_dir / (shard_names[-1] + '.tmp'), 'wb')
+                    shard_bytes, shard_examples = 0, 0
+                first_beat = i * beats_per_example
+                columns["example_shard"].append(len(shard_names) - 1)
+                columns["example_offset"].append(shard_bytes)
+                columns["example_position"].append(shard_examples)
+                columns["example_record"].append(rec_id)
+                columns["example_first_beat"].append(first_beat)
+                columns["example_num_beats"].append(min(beats_per_example, num_beats - first_beat))
+                shard_file.write(frame)
+                shard_bytes += len(frame)
+                shard_examples += 1
+            record_examples.append(len(columns["example_shard"]))
+    finally:
+        if shard_file is not None:
+            shard_file.close()
+
+    for name in shard_names:
+        os.replace(output_dir / (name + '.tmp'), output_dir / name)
+    tmp_index = output_dir / f"{INDEX_FILENAME}.tmp.npz"
+    np.savez(
+        tmp_index,
+        record_names=np.array(record_names, dtype=str),
+        record_examples=np.array(record_examples, dtype=np.int64),
+        shard_names=np.array(shard_names, dtype=str),
+        **{name: np.array(values, dtype=np.int64) for name, values in columns.items()}
+    )
+    os.replace(tmp_index, output_dir / INDEX_FILENAME)
+    return shard_names
+
+
+class ShardIndex:
+    """Offset index of a sharded beat-level TFRecord directory."""
+    def __init__(self, tfrecord_dir: Union[str, Path]):
+        self.directory = Path(tfrecord_dir)
+        with np.load(self.directory / INDEX_FILENAME, allow_pickle=False) as data:
+            self.record_names = [str(name) for name in data["record_names"]]
+            self.shard_names = [str(name) for name in data["shard_names"]]
+            self.record_examples = data["record_examples"]
+            self.example_shard = data["example_shard"]
+            self.example_offset = data["example_offset"]
+            self.example_position = data["example_position"]
+            self.example_first_beat = data["example_first_beat"]
+            self.example_num_beats = data["example_num_beats"]
+        self._record_lookup = {name: i for i, name in enumerate(self.record_names)}
+
+    def __contains__(self, rec_name: str) -> bool:
+        return rec_name in self._record_lookup
+
+    @property
+    def shard_paths(self) -> List[str]:
+        return [str(self.directory / name) for name in self.shard_names]
+
+    def record_examples_range(self, rec_name: str) -> Tuple[int, int]:
+        """Returns the [start, stop) range of a record's examples in the global example table."""
+        i = self._record_lookup[rec_name]
+        return int(self.record_examples[i]), int(self.record_examples[i + 1])
+
+    def iter_record_frames(self, rec_name: str) -> Iterator[bytes]:
+        """Yields the raw frames of a record's examples, read from the shards at their byte offsets."""
+        start, stop = self.record_examples_range(rec_name)
+        shard, handle = None, None
+        try:
+            for i in range(start, stop):
+                if self.example_shard[i] != shard:
+                    if handle is not None:
+                        handle.close()
+                    shard = self.example_shard[i]
+                    handle = open(self.directory / self.shard_names[shard], 'rb')
+                handle.seek(int(self.example_offset[i]))
+                header = handle.read(12)
+                length = struct.unpack('<Q', header[:8])[0]
+                yield header + handle.read(length + 4)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def read_units(self, record_names: Sequence[str], sequence_len: int, unit_examples: int) -> np.ndarray:
+        """
+        Splits the examples of the given records into read units of at most
+        unit_examples examples, so readers get balanced work regardless of record
+        and shard sizes. Each unit is (first example to read, stop example,
+        sequences to skip): reading starts early enough to supply the
+        sequence_len - 1 beats of context that the unit's first sequences need,
+        and the sequences that end inside that context are skipped.
+        Returns an int64 array of shape (n_units, 3).
+        """
+        carry = sequence_len - 1
+        units = []
+        for rec_name in record_names:
+            if rec_name not in self._record_lookup:
+                continue
+            rec_start, rec_stop = self.record_examples_range(rec_name)
+            for start in range(rec_start, rec_stop, unit_examples):
+                stop = min(start + unit_examples, rec_stop)
+                read_from = start
+                while read_from > rec_start and self.example_first_beat[start] - self.example_first_beat[read_from] < carry:
+                    read_from -= 1
+                context = int(self.example_first_beat[start] - self.example_first_beat[read_from])
+                units.append((read_from, stop, max(0, context - carry)))
+        return np.array(units, dtype=np.int64).reshape(-1, 3)
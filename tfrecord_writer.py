@@ -0,0 +1,161 @@
+# tfrecord_writer.py (TensorFlow-Free TFRecord Writer)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Writes TFRecord files and tf.train.Example protos with Python and
+# NumPy only, so conversion workers do not have to import TensorFlow (seconds of
+# start-up and hundreds of MB per process). Each record is framed exactly like
+# tf.io.TFRecordWriter frames it: little-endian uint64 length, masked CRC32C of
+# the length, payload, masked CRC32C of the payload. Examples are serialized
+# with sorted feature keys, matching Example.SerializeToString(deterministic=True).
+#
+# CRC32C over large payloads is computed lane-parallel: the payload is cut into
+# equal blocks whose CRCs are advanced together with one vectorized table lookup
+# per byte position, and the block CRCs are then chained with a precomputed
+# "append block_size zero bytes" operator (CRC is linear over GF(2)).
+
+import struct
+from pathlib import Path
+from typing import Dict, Sequence, Union
+
+import numpy as np
+
+CRC32C_POLY = 0x82F63B78  # Castagnoli, reflected.
+_MASK_DELTA = 0xA282EAD8
+_BLOCK_SIZE = 2048
+_SCALAR_LIMIT = 4 * _BLOCK_SIZE
+
+
+def _make_table() -> np.ndarray:
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ np.uint32(CRC32C_POLY), table >> 1).astype(np.uint32)
+    return table
+
+
+_TABLE = _make_table()
+_TABLE_LIST = _TABLE.tolist()
+
+
+def _advance(registers: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """Feeds one byte per lane (columns[:, i]) into each lane's CRC register."""
+    for i in range(columns.shape[1]):
+        registers = _TABLE[(registers ^ columns[:, i]) & 0xFF] ^ (registers >> 8)
+    return registers
+
+
+def _zeros_operator(num_bytes: int) -> np.ndarray:
+    """Byte tables (4, 256) of the linear map 'feed num_bytes zero bytes into the register'."""
+    basis = np.uint32(1) << np.arange(32, dtype=np.uint32)
+    images = _advance(basis, np.zeros((32, num_bytes), dtype=np.uint32))
+    tables = np.zeros((4, 256), dtype=np.uint32)
+    values = np.arange(256)
+    for byte in range(4):
+        for bit in range(8):
+            tables[byte][(values >> bit) & 1 == 1] ^= images[byte * 8 + bit]
+    return tables
+
+
+_SHIFT_TABLES = [table.tolist() for table in _zeros_operator(_BLOCK_SIZE)]
+
+
+def _crc_update_scalar(crc: int, data: bytes) -> int:
+    table = _TABLE_LIST
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+def crc32c(data: Union[bytes, bytearray, memoryview]) -> int:
+    """Returns the CRC32C (Castagnoli) checksum of data, as used by TFRecord framing."""
+    data = memoryview(data).cast('B')
+    if len(data) < _SCALAR_LIMIT:
+        return _crc_update_scalar(0xFFFFFFFF, data) ^ 0xFFFFFFFF
+
+    num_blocks = len(data) // _BLOCK_SIZE
+    blocks = np.frombuffer(data[:num_blocks * _BLOCK_SIZE], dtype=np.uint8).reshape(num_blocks, _BLOCK_SIZE)
+    # Register contributions of each block on its own (initial register 0).
+    block_crcs = _advance(np.zeros(num_blocks, dtype=np.uint32), blocks.astype(np.uint32)).tolist()
+
+    t0, t1, t2, t3 = _SHIFT_TABLES
+    crc = 0xFFFFFFFF
+    for block_crc in block_crcs:
+        crc = (t0[crc & 0xFF] ^ t1[(crc >> 8) & 0xFF] ^ t2[(crc >> 16) & 0xFF] ^ t3[crc >> 24]) ^ block_crc
+    return _crc_update_scalar(crc, data[num_blocks * _BLOCK_SIZE:]) ^ 0xFFFFFFFF
+
+
+def masked_crc32c(data: Union[bytes, bytearray, memoryview]) -> int:
+    """CRC32C masked the way TFRecord stores it."""
+    crc = crc32c(data)
+    return ((((crc >> 15) | (crc << 17)) & 0xFFFFFFFF) + _MASK_DELTA) & 0xFFFFFFFF
+
+
+def _varint(value: int) -> bytes:
+    value &= 0xFFFFFFFFFFFFFFFF  # Negative int64 values are encoded as 10-byte two's complement.
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """A length-delimited protobuf field."""
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def bytes_feature(values: Union[bytes, Sequence[bytes]]) -> bytes:
+    """Serialized tf.train.Feature holding a BytesList."""
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        values = [values]
+    return _field(1, b''.join(_field(1, bytes(value)) for value in values))
+
+
+def int64_feature(values: Union[int, Sequence[int]]) -> bytes:
+    """Serialized tf.train.Feature holding a packed Int64List."""
+    if isinstance(values, (int, np.integer)):
+        values = [values]
+    return _field(3, _field(1, b''.join(_varint(int(value)) for value in values)))
+
+
+def float_feature(values: Union[float, Sequence[float]]) -> bytes:
+    """Serialized tf.train.Feature holding a packed FloatList."""
+    packed = np.atleast_1d(np.asarray(values, dtype='<f4')).tobytes()
+    return _field(2, _field(1, packed))
+
+
+def encode_example(features: Dict[str, bytes]) -> bytes:
+    """
+    Serializes a tf.train.Example from a mapping of feature name to a serialized
+    Feature (see bytes_feature, int64_feature, float_feature).
+    """
+    entries = b''.join(_field(1, _field(1, key.encode('utf-8')) + _field(2, feature))
+                       for key, feature in sorted(features.items()))
+    return _field(1, entries)
+
+
+def frame_record(payload: bytes) -> bytes:
+    """Frames one record: length, masked CRC of the length, payload, masked CRC of the payload."""
+    header = struct.pack('<Q', len(payload))
+    return header + struct.pack('<I', masked_crc32c(header)) + payload + struct.pack('<I', masked_crc32c(payload))
+
+
+class TFRecordWriter:
+    """Drop-in for tf.io.TFRecordWriter (uncompressed) without TensorFlow."""
+    def __init__(self, path: Union[str, Path]):
+        self._file = open(path, 'wb')
+
+    def write(self, record: bytes) -> None:
+        self._file.write(frame_record(record))
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> 'TFRecordWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
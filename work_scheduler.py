@@ -0,0 +1,161 @@
+# work_scheduler.py (Cost-Aware Work Scheduler)
+# Author: [Your Name/Organization]
+# Date: 2026-10-18
+# Description: Helpers shared by the preprocessing pools. Pool sizes come from
+# the CPU quota and memory limit of the container (cgroup v1 or v2) instead of
+# os.cpu_count(), records are costed from their .hea signal length and handed
+# out largest first, very long records are split into sample-range sub-tasks,
+# and per-worker utilization is reported when the pool finishes.
+
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+# cgroup v1 reports "unlimited" memory as a huge page-aligned number.
+_UNLIMITED_MEMORY = 1 << 60
+
+
+def _read_text(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """Returns the container CPU quota in CPUs (e.g. 2.5), or None when unlimited."""
+    cpu_max = _read_text(CGROUP_ROOT / "cpu.max")  # cgroup v2: "<quota|max> <period>"
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+    quota = _read_text(CGROUP_ROOT / "cpu" / "cpu.cfs_quota_us")  # cgroup v1
+    period = _read_text(CGROUP_ROOT / "cpu" / "cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may actually use: affinity mask capped by the cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def available_memory_bytes() -> Optional[int]:
+    """
+    Memory still available to this container: the cgroup limit minus current
+    usage when a limit is set, otherwise MemAvailable from /proc/meminfo.
+    """
+    limit = _read_text(CGROUP_ROOT / "memory.max")  # cgroup v2
+    usage = _read_text(CGROUP_ROOT / "memory.current")
+    if limit is None:
+        limit = _read_text(CGROUP_ROOT / "memory" / "memory.limit_in_bytes")  # cgroup v1
+        usage = _read_text(CGROUP_ROOT / "memory" / "memory.usage_in_bytes")
+    if limit and limit != 'max' and int(limit) < _UNLIMITED_MEMORY:
+        return max(0, int(limit) - int(usage or 0))
+
+    meminfo = _read_text(Path("/proc/meminfo"))
+    if meminfo:
+        for line in meminfo.splitlines():
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def pool_size(per_worker_bytes: int = 0, reserve_cpus: int = 1, max_tasks: Optional[int] = None) -> int:
+    """
+    Sizes a worker pool from the cgroup CPU quota (minus reserve_cpus for the
+    parent) and, when per_worker_bytes is given, from the available memory.
+    """
+    workers = max(1, available_cpus() - reserve_cpus)
+    memory = available_memory_bytes()
+    if per_worker_bytes and memory is not None:
+        workers = min(workers, max(1, memory // per_worker_bytes))
+    if max_tasks is not None:
+        workers = min(workers, max(1, max_tasks))
+    return int(workers)
+
+
+def read_record_length(hea_path: Path) -> Tuple[int, float]:
+    """
+    Returns (signal length in samples, sampling frequency) from a WFDB header's
+    record line without reading the signal: "<name> <n_sig> [<fs> [<sig_len> ...]]".
+    """
+    with open(hea_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                fields = line.split()
+                fs = float(fields[2].split('/')[0].split('(')[0]) if len(fields) > 2 else 250.0
+                sig_len = int(fields[3]) if len(fields) > 3 else 0
+                return sig_len, fs
+    raise ValueError(f"No record line found in {hea_path}")
+
+
+@dataclass
+class Task:
+    """One unit of pool work: a record, or a [sampfrom, sampto) range of one."""
+    record: str
+    sampfrom: int
+    sampto: int
+    part: int = 0
+    num_parts: int = 1
+
+    @property
+    def cost(self) -> int:
+        return self.sampto - self.sampfrom
+
+
+def plan_tasks(record_lengths: Dict[str, int], max_task_samples: Optional[int] = None) -> List[Task]:
+    """
+    Turns record lengths into tasks ordered largest first (LPT scheduling), so
+    long records start early instead of becoming stragglers at the end. Records
+    longer than max_task_samples are split into roughly equal sub-tasks.
+    """
+    tasks = []
+    for record, length in record_lengths.items():
+        num_parts = 1
+        if max_task_samples and length > max_task_samples:
+            num_parts = math.ceil(length / max_task_samples)
+        bounds = [round(i * length / num_parts) for i in range(num_parts + 1)]
+        for part in range(num_parts):
+            tasks.append(Task(record, bounds[part], bounds[part + 1], part, num_parts))
+    tasks.sort(key=lambda t: t.cost, reverse=True)
+    return tasks
+
+
+def timed_call(func: Callable, *args, **kwargs) -> Dict[str, Any]:
+    """Runs func in a worker and returns its result with the worker pid and busy interval."""
+    start = time.time()
+    result = func(*args, **kwargs)
+    return {"pid": os.getpid(), "start": start, "end": time.time(), "result": result}
+
+
+def report_utilization(timed_results: Sequence[Dict[str, Any]], wall_time: float, log: logging.Logger = logger) -> Dict[int, float]:
+    """Logs busy time and utilization per worker process and returns {pid: utilization}."""
+    busy: Dict[int, float] = {}
+    tasks: Dict[int, int] = {}
+    for item in timed_results:
+        busy[item["pid"]] = busy.get(item["pid"], 0.0) + item["end"] - item["start"]
+        tasks[item["pid"]] = tasks.get(item["pid"], 0) + 1
+    utilization = {pid: (b / wall_time if wall_time > 0 else 0.0) for pid, b in busy.items()}
+    for pid in sorted(busy):
+        log.info(f"Worker {pid}: {tasks[pid]} tasks, busy {busy[pid]:.1f}s of {wall_time:.1f}s ({utilization[pid]:.0%}).")
+    if utilization:
+        log.info(f"Mean worker utilization: {sum(utilization.values()) / len(utilization):.0%}.")
+    return utilization